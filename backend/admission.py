@@ -0,0 +1,345 @@
+"""
+Admission control for calls to OpenAI and per-client limits on /chat.
+
+Budgets are token buckets kept in one SQLite file, so every gunicorn worker
+draws from the same requests-per-minute and tokens-per-minute allowance and a
+429 seen by one worker pauses them all. Requests that cannot be admitted wait
+in a bounded per-process queue; when it is full, or the wait would be too
+long, they are turned away at once with a Retry-After instead of piling onto
+an upstream that is already saying no.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+
+import openai
+
+from state_db import connect
+from metrics import count_admission, count_client_limited
+from logs import get_logger, fields
+
+log = get_logger("admission")
+
+# Seconds of allowance a full bucket holds, i.e. how big a burst may be
+BURST_SECONDS = 10
+
+
+class Overloaded(Exception):
+    """The request was not sent upstream; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class BucketStore:
+    """
+    Token buckets by name in a SQLite file shared by the worker processes.
+
+    `take` draws from several buckets atomically: either every bucket has
+    enough and all are charged, or none is and the seconds until they would
+    have enough are returned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+    def _connect(self):
+        conn = connect(self.path)
+        # Bucket levels are soft state, losing the last write is harmless
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def reconnect(self):
+        """Open a new SQLite connection, e.g. in a forked worker; handles must not cross a fork"""
+        with self._lock:
+            self._conn = self._connect()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _level(self, name, rate, capacity, now):
+        row = self._conn.execute(
+            "SELECT level, updated_at, blocked_until FROM buckets WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return capacity, 0
+        level, updated_at, blocked_until = row
+        return min(capacity, level + (now - updated_at) * rate), blocked_until
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(time.time())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def take(self, draws):
+        """Charge `amount` to each (name, rate, capacity, amount) in `draws`, or return the seconds to wait"""
+        def work(now):
+            levels = []
+            wait = 0
+            for name, rate, capacity, amount in draws:
+                level, blocked_until = self._level(name, rate, capacity, now)
+                levels.append(level)
+                wait = max(wait, blocked_until - now, (amount - level) / rate)
+            if wait > 0:
+                return wait
+            self._conn.executemany(
+                "INSERT INTO buckets (name, level, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at",
+                [(name, level - amount, now) for (name, _, _, amount), level in zip(draws, levels)]
+            )
+            return 0
+        return self._transaction(work)
+
+    def adjust(self, name, rate, capacity, amount):
+        """Add `amount` (negative to charge more) to a bucket without waiting, it may go into debt"""
+        def work(now):
+            level, _ = self._level(name, rate, capacity, now)
+            self._conn.execute(
+                "INSERT INTO buckets (name, level, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at",
+                (name, min(capacity, level + amount), now)
+            )
+        self._transaction(work)
+
+    def block(self, names, seconds):
+        """Refuse draws from these buckets for `seconds`, e.g. after an upstream 429"""
+        def work(now):
+            for name in names:
+                self._conn.execute(
+                    "INSERT INTO buckets (name, level, updated_at, blocked_until) VALUES (?, 0, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                    (name, now, now + seconds)
+                )
+        self._transaction(work)
+
+    def prune(self, prefix, idle_seconds):
+        """Forget buckets under `prefix` untouched for `idle_seconds`; they would be full again anyway"""
+        self._transaction(lambda now: self._conn.execute(
+            "DELETE FROM buckets WHERE name LIKE ? AND updated_at < ?", (prefix + '%', now - idle_seconds)
+        ))
+
+
+class UpstreamLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for one upstream.
+
+    Each call is charged one request and the running average of the tokens
+    calls have used; `settle` corrects the token bucket once the real usage is
+    known. `admit` waits for the budget, but at most `max_wait` seconds and
+    with at most `max_waiting` callers per process queued at once.
+    """
+
+    def __init__(self, store, name, requests_per_minute, tokens_per_minute,
+                 max_waiting=32, max_wait=10, initial_estimate=4000):
+        self.store = store
+        self.requests = (f"{name}:requests", requests_per_minute / 60, requests_per_minute / 60 * BURST_SECONDS)
+        self.tokens = (f"{name}:tokens", tokens_per_minute / 60, tokens_per_minute / 60 * BURST_SECONDS)
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.estimate = initial_estimate
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _draws(self, requests=1, tokens=True):
+        """
+        (name, rate, capacity, amount) per bucket a call draws from; a zero rate
+        means unlimited. Calls that use no model tokens (e.g. vector store
+        searches) only draw `requests` from the requests bucket.
+        """
+        name, rate, capacity = self.requests
+        draws = [(name, rate, capacity, min(requests, capacity))]
+        if tokens:
+            name, rate, capacity = self.tokens
+            draws.append((name, rate, capacity, min(self.estimate, capacity)))
+        return [draw for draw in draws if draw[1] > 0]
+
+    def _reject(self, reason, retry_after):
+        self.rejected += 1
+        count_admission("rejected")
+        log.warning("Upstream call rejected", extra=fields(reason=reason, retry_after=round(retry_after, 1)))
+        raise Overloaded(f"Upstream busy ({reason})", retry_after)
+
+    def _enter_queue(self, wait):
+        if wait > self.max_wait:
+            self._reject("budget", wait)
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                full = True
+            else:
+                full = False
+                self.waiting += 1
+        if full:
+            self._reject("queue full", wait)
+
+    def _leave_queue(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _next_wait(self, started, draws):
+        wait = self.store.take(draws)
+        if wait <= 0:
+            self.admitted += 1
+            count_admission("queued")
+            return None
+        if time.monotonic() - started + wait > self.max_wait:
+            self._reject("timeout", wait)
+        # Jitter so waiters in different workers do not all retry at the same instant
+        return wait * random.uniform(1.0, 1.2)
+
+    def admit(self, requests=1, tokens=True):
+        """Block until `requests` calls may be made, or raise Overloaded"""
+        draws = self._draws(requests, tokens)
+        wait = self.store.take(draws)
+        if wait <= 0:
+            self.admitted += 1
+            count_admission("immediate")
+            return
+        self._enter_queue(wait)
+        try:
+            started = time.monotonic()
+            while wait is not None:
+                time.sleep(wait)
+                wait = self._next_wait(started, draws)
+        finally:
+            self._leave_queue()
+
+    async def admit_async(self, requests=1, tokens=True):
+        """Async twin of admit, the SQLite work runs off the event loop"""
+        draws = self._draws(requests, tokens)
+        wait = await asyncio.to_thread(self.store.take, draws)
+        if wait <= 0:
+            self.admitted += 1
+            count_admission("immediate")
+            return
+        self._enter_queue(wait)
+        try:
+            started = time.monotonic()
+            while wait is not None:
+                await asyncio.sleep(wait)
+                wait = await asyncio.to_thread(self._next_wait, started, draws)
+        finally:
+            self._leave_queue()
+
+    def settle(self, actual_tokens):
+        """Correct the token bucket for a finished call and update the per-call estimate"""
+        name, rate, capacity = self.tokens
+        if rate > 0:
+            self.store.adjust(name, rate, capacity, min(self.estimate, capacity) - actual_tokens)
+        self.estimate = 0.8 * self.estimate + 0.2 * actual_tokens
+
+    def pause(self, seconds):
+        """Stop every worker calling upstream for `seconds`, after it answered 429"""
+        self.store.block([self.requests[0], self.tokens[0]], seconds)
+
+    def stats(self):
+        return {
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'tokens_per_call_estimate': round(self.estimate)
+        }
+
+
+class ClientLimiter:
+    """Per-client request rate for /chat, `per_minute` sustained with bursts of `burst`"""
+
+    def __init__(self, store, per_minute, burst, prune_every=1000):
+        self.store = store
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.prune_every = prune_every
+        self.checks = 0
+        self.limited = 0
+
+    def check(self, client_id):
+        """0 if the client may proceed, else the whole seconds until it may"""
+        if self.rate <= 0:
+            return 0
+        self.checks += 1
+        if self.checks % self.prune_every == 0:
+            self.store.prune("client:", idle_seconds=self.burst / self.rate)
+        wait = self.store.take([(f"client:{client_id}", self.rate, self.burst, 1)])
+        if wait <= 0:
+            return 0
+        self.limited += 1
+        count_client_limited()
+        return max(1, math.ceil(wait))
+
+
+def client_address(forwarded_for, remote_addr, trusted_hops=1):
+    """
+    The caller's address behind `trusted_hops` proxies (Render's is one).
+
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so only the last `trusted_hops` entries can be trusted;
+    anything before them is whatever the client sent. The entry the outermost
+    trusted proxy appended is the caller, `remote_addr` is used without one.
+    """
+    if forwarded_for and trusted_hops > 0:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if hops:
+            return hops[-min(trusted_hops, len(hops))]
+    return remote_addr or "unknown"
+
+
+def header_retry_after(error):
+    """Seconds from an error response's retry-after-ms or Retry-After header, or None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+
+def is_rate_limit(error):
+    return isinstance(error, openai.RateLimitError)
+
+
+def retry_delay(error, attempt, base=0.5, cap=20):
+    """
+    Seconds to wait before retrying `error`, or None if it should not be retried.
+
+    Rate limits (except an exhausted quota), 5xx replies and dropped
+    connections are retried; timeouts are not, the caller already waited.
+    The upstream's Retry-After wins, otherwise full-jitter exponential backoff.
+    """
+    if isinstance(error, openai.APITimeoutError):
+        return None
+    if is_rate_limit(error):
+        if getattr(error, 'code', None) == 'insufficient_quota':
+            return None
+    elif not isinstance(error, (openai.InternalServerError, openai.APIConnectionError)):
+        return None
+    delay = header_retry_after(error)
+    if delay is not None:
+        return min(delay, cap) * random.uniform(1.0, 1.1)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
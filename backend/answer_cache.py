@@ -0,0 +1,113 @@
+import hashlib
+import json
+import re
+import unicodedata
+
+from ttl_cache import TTLCache
+
+# Words that change the wording of a question but not what is being asked
+FILLER_WORDS = {'please', 'pls', 'thanks', 'hi', 'hello', 'hey', 'kindly'}
+
+
+def normalize_question(text):
+    """Lowercase, strip punctuation and filler words, and collapse whitespace"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    words = [word for word in text.split() if word not in FILLER_WORDS]
+    return " ".join(words)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def context_key(**parts):
+    """Stable digest of everything besides the question that shapes an answer"""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """
+    Cache of complete /chat replies keyed on the normalized question plus a
+    context digest (model, instructions, vector store ids and contents).
+
+    With `similarity_threshold` set, a miss falls back to the most similar cached
+    question in the same context, compared by character-trigram Jaccard.
+    A None context (an answer that depends on more than the question, such as a
+    follow-up in a conversation) is never cached.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600, similarity_threshold=None):
+        self.entries = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.similarity_threshold = similarity_threshold
+        self.near_hits = 0
+        self.invalidations = 0
+
+    def _key(self, normalized, context):
+        return f"{context}:{normalized}"
+
+    def get(self, question, context):
+        normalized = normalize_question(question)
+        if not normalized or context is None:
+            return None
+        answer = self.entries.get(self._key(normalized, context))
+        if answer is not None or not self.similarity_threshold:
+            return answer and answer['value']
+
+        # Near-duplicate lookup, a linear scan over at most max_entries questions
+        grams = trigrams(normalized)
+        best, best_score = None, self.similarity_threshold
+        for _, entry in self.entries.items():
+            if entry['context'] != context:
+                continue
+            score = jaccard(grams, entry['trigrams'])
+            if score >= best_score:
+                best, best_score = entry, score
+        if best is None:
+            return None
+        self.near_hits += 1
+        return best['value']
+
+    def proximity(self, question, context):
+        """Highest trigram similarity of `question` to a cached question in the same context"""
+        normalized = normalize_question(question)
+        if not normalized or context is None:
+            return 0.0
+        grams = trigrams(normalized)
+        return max(
+            (jaccard(grams, entry['trigrams']) for _, entry in self.entries.items() if entry['context'] == context),
+            default=0.0
+        )
+
+    def set(self, question, context, value):
+        normalized = normalize_question(question)
+        if not normalized or context is None:
+            return
+        self.entries.set(self._key(normalized, context), {
+            'context': context,
+            'trigrams': trigrams(normalized),
+            'value': value
+        })
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. when the vector store contents change"""
+        self.entries.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        stats = self.entries.stats()
+        # Near-duplicate answers are served, so report them as hits
+        stats['hits'] += self.near_hits
+        stats['misses'] -= self.near_hits
+        stats['near_hits'] = self.near_hits
+        stats['invalidations'] = self.invalidations
+        stats['similarity_threshold'] = self.similarity_threshold
+        return stats
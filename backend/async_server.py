@@ -0,0 +1,398 @@
+"""
+Async (ASGI) version of server.py.
+
+Same routes and request/response shapes, but each request awaits OpenAI and
+Supabase instead of holding a thread, so one worker process can keep hundreds
+of chats in flight. Serve it with an async worker class, e.g.
+
+    PODC_ASYNC=1 gunicorn -c gunicorn.conf.py async_server:app
+"""
+import asyncio
+import re
+
+from openai import AsyncOpenAI
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
+
+from settings import CORS_ORIGINS, api_key, TRUSTED_PROXY_HOPS
+from chat_pipeline import (
+    answer_cache, answer_context, search_options, cached_answer, session_store, record_turn, UpstreamCall, account_usage,
+    extract_reply_and_citations, wants_stream, cached_events, stream_event_delta, StreamTiming,
+    completion_events, sse_event, SSE_HEADERS, upstream_limiter, client_limiter, overloaded_event,
+    RATE_LIMITED_MESSAGE, OVERLOADED_MESSAGE, usage_store, bounded
+)
+from admission import Overloaded, client_address
+from batch import authorized, parse_batch, BatchSummary, ndjson, NDJSON_HEADERS
+from flags import (
+    supabase_headers, flag_payload, flag_queue, SUPABASE_TIMEOUT,
+    flags_pages, flags_page_url, flags_page_entry, flags_page_headers, etag_matches
+)
+from cassette import async_openai_http_client, async_client as supabase_client
+from metrics import begin_request, current_trace, finish_request, span, render
+from lifecycle import start_worker, warm_async_connections, readiness
+from logs import get_logger, fields
+
+log = get_logger("async_server")
+
+app = Quart(__name__)
+# Long answers can take as long as the gunicorn worker timeout
+app.config['RESPONSE_TIMEOUT'] = 120
+app = cors(
+    app,
+    # Wildcard origins become patterns, quart-cors matches plain strings exactly
+    allow_origin=[re.compile(re.escape(origin).replace(r'\*', '.*')) if '*' in origin else origin for origin in CORS_ORIGINS],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"]
+)
+
+# Created inside the serving event loop, see startup()
+async_client = None
+supabase = None
+
+
+@app.before_serving
+async def startup():
+    global async_client, supabase
+    # Already done by gunicorn's post_fork hook, needed when served any other way
+    await asyncio.to_thread(start_worker, False)
+    async_client = AsyncOpenAI(api_key=api_key, max_retries=0, http_client=async_openai_http_client())
+    supabase = supabase_client(timeout=SUPABASE_TIMEOUT)
+    # Serving starts once these return, so the first chat reuses warm connections
+    await warm_async_connections(async_client, supabase)
+
+
+@app.after_serving
+async def shutdown():
+    await async_client.close()
+    await supabase.aclose()
+
+
+@app.before_request
+async def start_trace():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    begin_request(route, request.method)
+
+
+@app.after_request
+async def end_trace(response):
+    trace = current_trace()
+    if trace is not None:
+        finish_request(trace, response.status_code)
+    return response
+
+
+async def create_response(user_message, stream=False, session=None, search=None, admitted=False):
+    """Async twin of chat_pipeline.create_response"""
+    # The first attempt may already do blocking I/O (shard searches, the local
+    # index's query embedding), keep it off the event loop
+    call = await asyncio.to_thread(UpstreamCall, user_message, session, search)
+    while True:
+        if not admitted:
+            with span("admission"):
+                await upstream_limiter.admit_async()
+        admitted = False
+        try:
+            with span("openai_request"):
+                response = await async_client.responses.create(stream=stream, **call.request_args)
+            # Usage and budget bookkeeping write to SQLite, which may wait on other workers
+            if not stream:
+                await asyncio.to_thread(account_usage, response)
+            return response, call.context_chunks
+        except Exception as e:
+            await asyncio.sleep(await asyncio.to_thread(call.failed, e))
+
+
+def busy_response(message, retry_after, status):
+    """429/503 reply asking the client to come back after `retry_after` seconds"""
+    response = jsonify({'response': message, 'citations': []})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+async def stream_chat(user_message, cache_context, session_id, session, search):
+    """Server-Sent Events for /chat, see server.stream_chat for the event names"""
+    trace = current_trace()
+    cached = cached_answer(user_message, cache_context)
+    if cached is None:
+        with span("admission"):
+            await upstream_limiter.admit_async()
+    trace.streaming = True
+
+    async def generate():
+        with trace.activate():
+            try:
+                async for frame in events():
+                    yield frame
+            finally:
+                trace.log()
+
+    async def events():
+        if cached is not None:
+            await asyncio.to_thread(record_turn, session_id, user_message, cached['response'])
+            for frame in cached_events(cached, session_id):
+                yield frame
+            return
+
+        final_response = None
+        timing = StreamTiming()
+        try:
+            stream, context_chunks = await create_response(
+                user_message, stream=True, session=session, search=search, admitted=True
+            )
+            async for event in stream:
+                timing.event(event)
+                delta = stream_event_delta(event)
+                if delta is not None:
+                    yield sse_event("delta", {"text": delta})
+                elif event.type == "response.completed":
+                    final_response = event.response
+            timing.done()
+        except Overloaded as e:
+            yield overloaded_event(e)
+            return
+        except Exception as openai_error:
+            log.error("OpenAI API error", extra=fields(error=str(openai_error), stream=True))
+            yield sse_event("error", {'response': f'OpenAI API Error: {str(openai_error)}'})
+            return
+
+        # Records the turn and the usage, local SQLite writes kept off the event loop
+        frames = await asyncio.to_thread(
+            completion_events, user_message, cache_context, final_response, context_chunks, session_id
+        )
+        for frame in frames:
+            yield frame
+
+    response = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.timeout = None
+    return response
+
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    try:
+        data = await request.get_json()
+        user_message = data.get('message')
+
+        if not user_message:
+            return jsonify({'response': 'No message received'}), 400
+
+        retry_after = await asyncio.to_thread(
+            client_limiter.check, client_address(request.headers.get('X-Forwarded-For'), request.remote_addr, TRUSTED_PROXY_HOPS)
+        )
+        if retry_after:
+            return busy_response(RATE_LIMITED_MESSAGE, retry_after, 429)
+
+        log.debug("Received message", extra=fields(sampled=True, user_message=user_message))
+
+        # Follow-ups continue the conversation the session ID names; answers are only cached for first questions
+        with span("session"):
+            session_id, session = await asyncio.to_thread(session_store.begin, data.get('session_id'))
+
+        # Optional category/author filters and file_search tuning, part of the cache key
+        try:
+            search = search_options(data, user_message, session)
+        except ValueError as e:
+            return jsonify({'response': str(e), 'citations': []}), 400
+        cache_context = answer_context(session, search)
+
+        if wants_stream(data, request.headers.get('Accept')):
+            return await stream_chat(user_message, cache_context, session_id, session, search)
+
+        cached = cached_answer(user_message, cache_context)
+        if cached is not None:
+            await asyncio.to_thread(record_turn, session_id, user_message, cached['response'])
+            response = jsonify(dict(cached, session_id=session_id))
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        try:
+            response, context_chunks = await create_response(user_message, session=session, search=search)
+        except Overloaded:
+            raise
+        except Exception as openai_error:
+            log.error("OpenAI API error", extra=fields(error=str(openai_error)))
+            return jsonify({
+                'response': f'OpenAI API Error: {str(openai_error)}',
+                'citations': []
+            }), 500
+
+        reply, citations = extract_reply_and_citations(response, context_chunks)
+        if reply:
+            answer_cache.set(user_message, cache_context, {'response': reply, 'citations': citations})
+            await asyncio.to_thread(record_turn, session_id, user_message, reply, response)
+
+        response = jsonify({
+            'response': reply,
+            'citations': citations,
+            'session_id': session_id
+        })
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    except Overloaded as e:
+        return busy_response(OVERLOADED_MESSAGE, e.retry_after, 503)
+
+    except Exception as e:
+        log.exception("Error handling /chat")
+        return jsonify({
+            'response': f'Server error: {str(e)}',
+            'citations': []
+        }), 500
+
+
+async def answer_batch_item(item, use_cache):
+    """Async twin of batch.answer"""
+    item.start()
+    with item.trace.activate():
+        try:
+            cached = cached_answer(item.message, item.cache_context) if use_cache else None
+            if cached is not None:
+                return item.record(cached['response'], cached['citations'], cached=True)
+            while True:
+                try:
+                    response, context_chunks = await create_response(item.message, search=item.search)
+                    break
+                except Overloaded as e:
+                    if not item.can_wait(e):
+                        raise
+                    await asyncio.sleep(e.retry_after)
+            return item.answered(response, context_chunks)
+        except Exception as e:
+            return item.failed(e)
+
+
+async def batch_lines(items, concurrency, use_cache):
+    """Async twin of batch.batch_lines, a semaphore bounds the questions in flight"""
+    summary = BatchSummary(len(items))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await answer_batch_item(item, use_cache)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            record = await finished
+            summary.add(record)
+            yield ndjson(record)
+        yield summary.line()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.route('/chat/batch', methods=['POST'])
+async def chat_batch():
+    """NDJSON answers to a list of questions, see server.chat_batch"""
+    if not authorized(request.headers.get('Authorization')):
+        return jsonify({'message': 'A valid batch API key is required'}), 401
+    try:
+        items, concurrency, use_cache = parse_batch(await request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    trace = current_trace()
+    trace.streaming = True
+
+    async def generate():
+        with trace.activate():
+            try:
+                async for line in batch_lines(items, concurrency, use_cache):
+                    yield line
+            finally:
+                trace.log()
+
+    response = Response(generate(), mimetype='application/x-ndjson', headers=NDJSON_HEADERS)
+    response.timeout = None
+    return response
+
+
+@app.route('/flag', methods=['POST'])
+async def flag_message():
+    try:
+        data = await request.get_json()
+        payload = flag_payload(data)
+
+        # A local SQLite write, kept off the event loop
+        with span("flag_enqueue"):
+            await asyncio.to_thread(flag_queue.enqueue, payload)
+        return jsonify({"message": "Flag queued for Supabase"}), 202
+
+    except Exception:
+        log.exception("Error queueing flag")
+        return jsonify({"message": "Internal error storing flag"}), 500
+
+
+@app.route('/flags', methods=['GET'])
+async def list_flags():
+    try:
+        entry = flags_pages.get(request.query_string)
+        if entry is None:
+            try:
+                url, limit = flags_page_url(request.args)
+            except ValueError as e:
+                return jsonify({"message": str(e)}), 400
+
+            with span("supabase"):
+                response = await supabase.get(url, headers=supabase_headers())
+            if response.status_code != 200:
+                log.error("Error fetching from Supabase", extra=fields(status=response.status_code, body=response.text))
+                return jsonify({"message": "Failed to fetch flags"}), 500
+
+            entry = flags_page_entry(response.json(), limit)
+            flags_pages.set(request.query_string, entry)
+
+        if etag_matches(request.headers.get('If-None-Match'), entry['etag']):
+            return Response("", status=304, headers=flags_page_headers(entry))
+        return Response(entry['body'], mimetype='application/json', headers=flags_page_headers(entry))
+
+    except Exception:
+        log.exception("Error reading flags from Supabase")
+        return jsonify({"message": "Internal server error"}), 500
+
+
+@app.route('/flag/queue', methods=['GET'])
+async def flag_queue_stats():
+    return jsonify(flag_queue.stats())
+
+
+@app.route('/cache/stats', methods=['GET'])
+async def cache_stats():
+    return jsonify(answer_cache.stats())
+
+
+@app.route('/usage', methods=['GET'])
+async def usage():
+    """See server.usage"""
+    try:
+        days = bounded(request.args, 'days', float, 0, 366) or 7
+        return jsonify(await asyncio.to_thread(usage_store.summary, days, request.args.get('group', 'tier')))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    body, content_type = render()
+    return Response(body, content_type=content_type)
+
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    # Liveness only, never waits on an upstream
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    ready, checks = readiness(warm=False)
+    if not checks['openai']:
+        await warm_async_connections(async_client, supabase)
+        ready, checks = readiness(warm=False)
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,187 @@
+"""
+/chat/batch: many first-turn questions through the /chat pipeline at once.
+
+Each question gets the same instructions, file_search options, answer cache
+and citation resolution as a chat, runs with bounded concurrency and is
+written back as one NDJSON line as soon as it finishes, followed by a summary
+line. Questions wait out the shared rate limits instead of failing, so a
+batch runs as fast as the upstream budget allows.
+"""
+import hmac
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from settings import (
+    BATCH_API_KEY, BATCH_MAX_ITEMS, BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, BATCH_ITEM_TIMEOUT
+)
+from chat_pipeline import (
+    answer_cache, answer_context, search_options, cached_answer, create_response, extract_reply_and_citations, bounded
+)
+from admission import Overloaded
+from metrics import RequestTrace
+from logs import get_logger, fields
+
+log = get_logger("batch")
+
+# Request fields that apply to every question unless a question sets its own
+SEARCH_FIELDS = ('category', 'author', 'max_num_results', 'score_threshold', 'ranker')
+
+NDJSON_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+
+def authorized(authorization):
+    """Whether an Authorization header carries BATCH_API_KEY; always False while it is unset"""
+    if not BATCH_API_KEY or not authorization or not authorization.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(authorization[len("Bearer "):].encode(), BATCH_API_KEY.encode())
+
+
+class BatchItem:
+    """One question of a batch, with its own trace for per-item stage timings and usage"""
+
+    def __init__(self, index, item_id, message, search):
+        self.index = index
+        self.id = item_id
+        self.message = message
+        self.search = search
+        self.cache_context = answer_context(None, search)
+        self.trace = RequestTrace("/chat/batch", "POST")
+        self.deadline = None
+
+    def start(self):
+        self.trace.started = time.perf_counter()
+        self.deadline = time.monotonic() + BATCH_ITEM_TIMEOUT
+
+    def can_wait(self, error):
+        """Whether to wait out an Overloaded refusal rather than give up on the question"""
+        return time.monotonic() + error.retry_after < self.deadline
+
+    def answered(self, response, context_chunks):
+        reply, citations = extract_reply_and_citations(response, context_chunks)
+        if reply:
+            answer_cache.set(self.message, self.cache_context, {'response': reply, 'citations': citations})
+        return self.record(response=reply, citations=citations, cached=False)
+
+    def failed(self, error):
+        log.warning("Batch question failed", extra=fields(index=self.index, error=str(error)))
+        message = "Upstream busy, try again later" if isinstance(error, Overloaded) else f"OpenAI API Error: {error}"
+        return self.record(response=None, citations=[], cached=False, error=message)
+
+    def record(self, response, citations, cached, error=None):
+        """The NDJSON record for this question"""
+        return {
+            'index': self.index,
+            'id': self.id,
+            'question': self.message,
+            'response': response,
+            'citations': citations,
+            'cached': cached,
+            'error': error,
+            'seconds': round(time.perf_counter() - self.trace.started, 3),
+            'stages_ms': {stage: round(seconds * 1000, 1) for stage, seconds in self.trace.stages.items()},
+            'usage': dict(self.trace.tokens),
+            'tier': self.trace.model_route['tier'] if self.trace.model_route else None
+        }
+
+
+def parse_batch(data):
+    """
+    ([BatchItem], concurrency, use_cache) for a /chat/batch body, raising
+    ValueError for anything /chat would reject or the limits do not allow.
+    """
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("questions must be a non-empty list")
+    if len(questions) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} questions per batch")
+
+    shared = {name: data[name] for name in SEARCH_FIELDS if name in data}
+    items = []
+    for index, question in enumerate(questions):
+        if isinstance(question, str):
+            question = {'message': question}
+        if not isinstance(question, dict) or not isinstance(question.get('message'), str) or not question['message'].strip():
+            raise ValueError(f"questions[{index}] must be a string or an object with a message")
+        try:
+            search = search_options(dict(shared, **question), question['message'])
+        except ValueError as e:
+            raise ValueError(f"questions[{index}]: {e}")
+        items.append(BatchItem(index, question.get('id'), question['message'], search))
+
+    concurrency = bounded(data, 'concurrency', int, 1, BATCH_MAX_CONCURRENCY) or BATCH_CONCURRENCY
+    return items, concurrency, data.get('cache', True) is not False
+
+
+def answer(item, use_cache=True):
+    """Answer one question like a first /chat turn, returning its record; never raises"""
+    item.start()
+    with item.trace.activate():
+        try:
+            cached = cached_answer(item.message, item.cache_context) if use_cache else None
+            if cached is not None:
+                return item.record(cached['response'], cached['citations'], cached=True)
+            while True:
+                try:
+                    response, context_chunks = create_response(item.message, search=item.search)
+                    break
+                except Overloaded as e:
+                    if not item.can_wait(e):
+                        raise
+                    time.sleep(e.retry_after)
+            return item.answered(response, context_chunks)
+        except Exception as e:
+            return item.failed(e)
+
+
+class BatchSummary:
+    """Totals for the last NDJSON line of a batch"""
+
+    def __init__(self, total):
+        self.total = total
+        self.started = time.perf_counter()
+        self.records = 0
+        self.errors = 0
+        self.cached = 0
+        self.usage = {}
+
+    def add(self, record):
+        self.records += 1
+        self.errors += record['error'] is not None
+        self.cached += record['cached']
+        for kind, count in record['usage'].items():
+            self.usage[kind] = self.usage.get(kind, 0) + count
+
+    def line(self):
+        return ndjson({
+            'done': True,
+            'count': self.total,
+            'answered': self.records - self.errors,
+            'errors': self.errors,
+            'cached': self.cached,
+            'seconds': round(time.perf_counter() - self.started, 3),
+            'usage': self.usage
+        })
+
+
+def batch_lines(items, concurrency, use_cache=True):
+    """NDJSON lines in the order questions finish, `concurrency` at a time, then the summary"""
+    summary = BatchSummary(len(items))
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(items)))
+    futures = [executor.submit(answer, item, use_cache) for item in items]
+    try:
+        for future in as_completed(futures):
+            record = future.result()
+            summary.add(record)
+            yield ndjson(record)
+        yield summary.line()
+    finally:
+        # Questions not yet started are dropped if the client goes away
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def ndjson(record):
+    return json.dumps(record, ensure_ascii=False) + "\n"
@@ -0,0 +1,284 @@
+"""
+Record and replay the HTTP exchanges with OpenAI and Supabase.
+
+    PODC_CASSETTE_MODE=record PODC_CASSETTE=golden.jsonl python ...   # real calls, each one saved
+    PODC_CASSETTE_MODE=replay PODC_CASSETTE=golden.jsonl python ...   # no network, answers from the file
+
+The OpenAI clients get an httpx transport and the Supabase session a requests
+adapter, so everything the SDK sends and receives, Responses annotations and
+file_search results included, is captured as it went over the wire. A
+cassette is one JSON line per exchange; it is loaded into memory for replay
+and a request that was never recorded raises CassetteMiss instead of going out.
+
+Requests are matched on method, path, query and a hash of the body (JSON
+bodies with sorted keys, multipart boundaries ignored), not on the host, so a
+cassette recorded against the real API also replays behind a proxy. Repeats of
+the same request are answered in the order they were recorded. API keys and
+other request headers are never written to the cassette. Record with a single
+worker process: the file is appended to without cross-process locking.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+MODES = ("record", "replay")
+# Response headers the SDK and the backend read; everything else is left out
+RECORDED_HEADERS = (
+    "content-type", "content-range", "etag", "retry-after", "retry-after-ms", "x-request-id", "openai-processing-ms"
+)
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?')
+
+
+class CassetteMiss(Exception):
+    """A request in replay mode that the cassette has no recording of"""
+
+
+def _body_bytes(body):
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    return bytes(body)
+
+
+def request_key(method, url, body, content_type=None):
+    """Identity of a request for matching a replay to its recording"""
+    parsed = urlsplit(str(url))
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    body = _body_bytes(body)
+    content_type = content_type or ""
+    if body and "json" in content_type:
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            pass
+    elif body and "multipart/" in content_type:
+        boundary = BOUNDARY_RE.search(content_type)
+        if boundary:
+            body = body.replace(boundary.group(1).encode("latin-1"), b"BOUNDARY")
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    return f"{method.upper()} {parsed.path}?{query} {digest}"
+
+
+def _entry(key, method, url, status, headers, body):
+    parsed = urlsplit(str(url))
+    entry = {
+        "key": key,
+        "method": method.upper(),
+        "url": parsed.path + (f"?{parsed.query}" if parsed.query else ""),
+        "status": status,
+        "headers": {name: headers[name] for name in RECORDED_HEADERS if name in headers}
+    }
+    try:
+        entry["body"] = body.decode("utf-8")
+    except UnicodeDecodeError:
+        entry["body"] = base64.b64encode(body).decode("ascii")
+        entry["base64"] = True
+    return entry
+
+
+def _entry_body(entry):
+    if entry.get("base64"):
+        return base64.b64decode(entry["body"])
+    return entry["body"].encode("utf-8")
+
+
+class Cassette:
+    """The exchanges of one cassette file, appended to in record mode and served from memory in replay mode"""
+
+    def __init__(self, path, mode):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {', '.join(MODES)}, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.exchanges = {}
+        self.served = {}
+        if mode == "replay":
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.exchanges.setdefault(entry["key"], []).append(entry)
+        else:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            # A new recording replaces the old one
+            open(path, "w").close()
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def play(self, key):
+        """(status, headers, body) recorded for a request; later repeats get later recordings"""
+        with self.lock:
+            entries = self.exchanges.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recording of {key} in {self.path}")
+            index = self.served.get(key, 0)
+            self.served[key] = index + 1
+        entry = entries[min(index, len(entries) - 1)]
+        return entry["status"], entry["headers"], _entry_body(entry)
+
+    def record(self, key, method, url, status, headers, body):
+        line = json.dumps(_entry(key, method, url, status, headers, body), ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """
+    httpx transport that records through `inner` or replays from the cassette.
+    `http` is the httpx module of the client it is mounted on, see sdk_httpx().
+    """
+
+    def __init__(self, cassette, inner=None, http=httpx):
+        self.cassette = cassette
+        self.http = http
+        self.inner = inner or http.HTTPTransport()
+
+    def handle_request(self, request):
+        key = request_key(request.method, request.url, request.read(), request.headers.get("content-type"))
+        if self.cassette.replaying:
+            status, headers, body = self.cassette.play(key)
+            return self.http.Response(status, headers=headers, content=body, request=request)
+        response = self.inner.handle_request(request)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        self.cassette.record(key, request.method, request.url, response.status_code, response.headers, body)
+        return _recorded_response(self.http, response, body, request)
+
+    def close(self):
+        self.inner.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Async twin of CassetteTransport"""
+
+    def __init__(self, cassette, inner=None, http=httpx):
+        self.cassette = cassette
+        self.http = http
+        self.inner = inner or http.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        key = request_key(request.method, request.url, await request.aread(), request.headers.get("content-type"))
+        if self.cassette.replaying:
+            status, headers, body = self.cassette.play(key)
+            return self.http.Response(status, headers=headers, content=body, request=request)
+        response = await self.inner.handle_async_request(request)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        self.cassette.record(key, request.method, request.url, response.status_code, response.headers, body)
+        return _recorded_response(self.http, response, body, request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def _recorded_response(http, response, body, request):
+    # The body is already decoded, so the reply carries only the headers a replay would
+    headers = {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}
+    return http.Response(response.status_code, headers=headers, content=body, request=request)
+
+
+class CassetteAdapter(HTTPAdapter):
+    """requests adapter that records through the usual connection pool or replays from the cassette"""
+
+    def __init__(self, cassette, **kwargs):
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        key = request_key(request.method, request.url, request.body, request.headers.get("Content-Type"))
+        if self.cassette.replaying:
+            status, headers, body = self.cassette.play(key)
+            response = requests.Response()
+            response.status_code = status
+            response.headers = CaseInsensitiveDict(headers)
+            response._content = body
+            response.url = request.url
+            response.request = request
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            return response
+        response = super().send(request, **kwargs)
+        self.cassette.record(key, request.method, request.url, response.status_code, response.headers, response.content)
+        return response
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def active():
+    """The cassette PODC_CASSETTE_MODE and PODC_CASSETTE select, or None when neither is set"""
+    global _cassette
+    mode = os.getenv("PODC_CASSETTE_MODE", "").strip().lower()
+    if not mode or mode == "off":
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            path = os.getenv("PODC_CASSETTE")
+            if not path:
+                raise ValueError("PODC_CASSETTE_MODE is set but PODC_CASSETTE names no cassette file")
+            _cassette = Cassette(path, mode)
+        return _cassette
+
+
+def sdk_httpx(client_class):
+    """The httpx module an openai SDK client class is built on, which newer releases vendor under another name"""
+    for base in client_class.__mro__[1:]:
+        if base.__name__ in ("Client", "AsyncClient"):
+            return sys.modules[base.__module__.split(".")[0]]
+    return httpx
+
+
+def openai_http_client():
+    """http_client for OpenAI(): None (the SDK default) unless a cassette is active"""
+    cassette = active()
+    if cassette is None:
+        return None
+    from openai import DefaultHttpxClient
+    return DefaultHttpxClient(transport=CassetteTransport(cassette, http=sdk_httpx(DefaultHttpxClient)))
+
+
+def async_openai_http_client():
+    """http_client for AsyncOpenAI(), see openai_http_client"""
+    cassette = active()
+    if cassette is None:
+        return None
+    from openai import DefaultAsyncHttpxClient
+    return DefaultAsyncHttpxClient(transport=AsyncCassetteTransport(cassette, http=sdk_httpx(DefaultAsyncHttpxClient)))
+
+
+def async_client(**kwargs):
+    """httpx.AsyncClient for Supabase, going through the cassette when one is active"""
+    cassette = active()
+    if cassette is not None:
+        kwargs['transport'] = AsyncCassetteTransport(cassette)
+    return httpx.AsyncClient(**kwargs)
+
+
+def mount(session, **adapter_kwargs):
+    """Send a requests session through the cassette when one is active"""
+    cassette = active()
+    if cassette is not None:
+        adapter = CassetteAdapter(cassette, **adapter_kwargs)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return session
@@ -0,0 +1,99 @@
+"""
+Pick the knowledge base category a question is most likely about.
+
+A multinomial naive Bayes model over the titles, file names and category names
+of the indexed documents. It trains in a few milliseconds from the attributes
+the citation index (or local index) already holds, so it needs no model files
+and is rebuilt whenever the vector store changes.
+"""
+import math
+import re
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Common words plus ones every category shares, which say nothing about the topic
+STOPWORDS = set("""
+a about after all also an and any are as at be but by can could do does for from has have how i if
+in into is it its may me my new no not of old on or our pdf should so that the their them there these
+they this to was we what when where which who why will with would you your
+child children deaf hearing hard dhh
+""".split())
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall((text or "").lower()):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        # Fold simple plurals so "aids" matches "aid"
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def document_text(attributes):
+    filename = re.sub(r'_(NEW|OLD)?\.pdf$|\.pdf$', '', attributes.get('filename') or '', flags=re.IGNORECASE)
+    return " ".join(part for part in (attributes.get('title'), filename) if part)
+
+
+class CategoryClassifier:
+    """
+    Naive Bayes over document titles with a uniform prior, so large categories
+    are not favoured just for holding more files.
+
+    `select` names the fewest categories that together hold `coverage` of the
+    posterior, so a question that could belong to two categories searches
+    both. It returns nothing, meaning the whole store, when the question
+    shares no vocabulary with the titles or the answer would span more than
+    `max_categories`.
+    """
+
+    def __init__(self, documents, alpha=0.5, coverage=0.95, max_categories=3):
+        self.alpha = alpha
+        self.coverage = coverage
+        self.max_categories = max_categories
+        self.token_counts = {}
+        for attributes in documents:
+            category = attributes.get('category')
+            if not category:
+                continue
+            counts = self.token_counts.setdefault(category, {})
+            for token in tokenize(document_text(attributes)):
+                counts[token] = counts.get(token, 0) + 1
+        self.vocabulary = {token for counts in self.token_counts.values() for token in counts}
+        self.totals = {category: sum(counts.values()) for category, counts in self.token_counts.items()}
+
+    @property
+    def categories(self):
+        return sorted(self.token_counts)
+
+    def scores(self, text):
+        """Posterior probability per category, or {} if no word of `text` appears in any title"""
+        tokens = [token for token in tokenize(text) if token in self.vocabulary]
+        if not tokens or not self.token_counts:
+            return {}
+        vocabulary_size = len(self.vocabulary)
+        log_likelihoods = {}
+        for category, counts in self.token_counts.items():
+            denominator = self.totals[category] + self.alpha * vocabulary_size
+            log_likelihoods[category] = sum(
+                math.log((counts.get(token, 0) + self.alpha) / denominator) for token in tokens
+            )
+        best = max(log_likelihoods.values())
+        weights = {category: math.exp(value - best) for category, value in log_likelihoods.items()}
+        total = sum(weights.values())
+        return {category: weight / total for category, weight in weights.items()}
+
+    def select(self, text):
+        """The categories to search for `text`, most likely first, or [] for the whole store"""
+        scores = self.scores(text)
+        selected, mass = [], 0.0
+        for category in sorted(scores, key=scores.get, reverse=True):
+            selected.append(category)
+            mass += scores[category]
+            if mass >= self.coverage:
+                break
+        if not selected or len(selected) > self.max_categories or len(selected) == len(scores):
+            return []
+        return selected
@@ -0,0 +1,648 @@
+"""
+Request building, retrieval and citation handling for /chat.
+
+Everything here is independent of the web framework so that the sync Flask
+app (server.py) and the async Quart app (async_server.py) behave identically.
+"""
+import json
+import time
+
+from openai import OpenAI
+
+from settings import (
+    api_key, vector_store_ids, vector_store_shards, MODEL,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY,
+    RETRIEVER, LOCAL_INDEX_DIR, LOCAL_TOP_K, LOCAL_EMBED_TIMEOUT, FILE_SEARCH_TIMEOUT, SHARD_TOP_K, SHARD_SEARCH_TIMEOUT,
+    STATE_DIR, SESSION_TTL, SESSION_MAX_HISTORY_TOKENS,
+    FILE_SEARCH_MAX_RESULTS, FILE_SEARCH_SCORE_THRESHOLD, FILE_SEARCH_RANKER, AUTO_CATEGORY,
+    OPENAI_RPM, OPENAI_TPM, OPENAI_MAX_RETRIES, ADMISSION_MAX_WAITING, ADMISSION_MAX_WAIT,
+    CHAT_RATE_PER_MINUTE, CHAT_BURST,
+    MODEL_ROUTING, MODEL_LIGHT, MODEL_COMPLEX, MODEL_LIGHT_REASONING, MODEL_REASONING, MODEL_COMPLEX_REASONING,
+    LIGHT_MAX_NUM_RESULTS, USAGE_RETENTION_DAYS
+)
+from citation_index import CitationIndex, resolve_citations
+from answer_cache import AnswerCache, context_key
+from sessions import SessionStore
+from category_classifier import CategoryClassifier
+from model_router import ModelRouter
+from usage import UsageStore, usage_row
+from cassette import openai_http_client
+from admission import BucketStore, UpstreamLimiter, ClientLimiter, Overloaded, retry_delay, is_rate_limit
+from metrics import span, observe, record_usage, count_cache_lookup, count_search_scope, count_retry, count_route, current_trace
+from logs import get_logger, fields
+
+log = get_logger("chat")
+
+INSTRUCTIONS = (
+    "You are the AI assistant for Parents of Deaf Children (PODC). Follow these rules:\n\n"
+    "1. Use only retrieved PODC documents. Never guess or use prior knowledge.\n"
+    "2. If unsure, say: 'I don’t know based on the available information. You may consider contacting PODC directly.'\n"
+    "3. Be clear, kind, and supportive. Avoid jargon. Define terms (e.g., 'NDIS' → 'National Disability Insurance Scheme').\n"
+    "4. Use bullet points when listing steps or multiple options. Mention the document title if applicable.\n"
+    "5. Do not fabricate information, sources, or advice.\n"
+    "6. Reflect before replying: 'Am I using only the retrieved content? Is this clear and kind?'"
+)
+
+# Retries are done by UpstreamCall, which also honours the shared rate limits
+client = OpenAI(api_key=api_key, max_retries=0, http_client=openai_http_client())
+
+retriever = RETRIEVER
+if retriever == "shards" and not vector_store_shards:
+    log.warning("PODC_RETRIEVER=shards needs VECTOR_STORE_SHARDS or synced shards, using file_search")
+    retriever = "file_search"
+
+# Vector store file attributes for citations, loaded before the workers fork
+# and refreshed in the background by each of them (see lifecycle.py)
+citation_index = CitationIndex(
+    client, sorted(set(vector_store_shards.values())) if retriever == "shards" else vector_store_ids
+)
+
+# Complete replies to repeated questions, dropped whenever the vector store changes
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY
+)
+citation_index.on_change(answer_cache.invalidate)
+
+# Conversation state for follow-up questions, shared by the worker processes
+session_store = SessionStore(
+    STATE_DIR / "sessions.sqlite3",
+    ttl=SESSION_TTL,
+    max_history_tokens=SESSION_MAX_HISTORY_TOKENS
+)
+
+# Shared request/token budgets for OpenAI and per-client limits for /chat
+buckets = BucketStore(STATE_DIR / "admission.sqlite3")
+upstream_limiter = UpstreamLimiter(
+    buckets, "openai", OPENAI_RPM, OPENAI_TPM,
+    max_waiting=ADMISSION_MAX_WAITING,
+    max_wait=ADMISSION_MAX_WAIT
+)
+client_limiter = ClientLimiter(buckets, CHAT_RATE_PER_MINUTE, CHAT_BURST)
+
+# Model per question, and the usage and cost of every answer for GET /usage
+model_router = ModelRouter({
+    'light': {'model': MODEL_LIGHT, 'reasoning': MODEL_LIGHT_REASONING, 'max_num_results': LIGHT_MAX_NUM_RESULTS},
+    'standard': {'model': MODEL, 'reasoning': MODEL_REASONING, 'max_num_results': None},
+    'complex': {'model': MODEL_COMPLEX, 'reasoning': MODEL_COMPLEX_REASONING, 'max_num_results': None}
+}, enabled=MODEL_ROUTING)
+usage_store = UsageStore(STATE_DIR / "usage.sqlite3", retention_days=USAGE_RETENTION_DAYS)
+
+
+def shard_failed(error):
+    """A 429 from one shard's search pauses every worker's upstream calls, like one from a response"""
+    if is_rate_limit(error):
+        delay = retry_delay(error, 0)
+        if delay is not None:
+            upstream_limiter.pause(delay)
+
+
+# Parallel search over the per-category stores
+shard_search = None
+if retriever == "shards":
+    from shard_search import ShardSearch
+    shard_search = ShardSearch(client, vector_store_shards, timeout=SHARD_SEARCH_TIMEOUT, on_error=shard_failed)
+
+local_index = None
+if retriever not in ("file_search", "shards"):
+    # Only imported (with numpy) when a local index is configured
+    from local_retrieval import LocalIndex, DEFAULT_INDEX_DIR
+    local_index = LocalIndex.load_if_present(LOCAL_INDEX_DIR or DEFAULT_INDEX_DIR)
+    if local_index is None:
+        log.warning(f"PODC_RETRIEVER={retriever} needs a local index, using file_search only")
+        retriever = "file_search"
+
+
+# (key of the documents it was trained on, CategoryClassifier), see category_classifier()
+_classifier = None
+
+FILE_SEARCH_RANKERS = ("auto", "default-2024-11-15")
+
+# How long to wait goes in the Retry-After header (or the SSE error's retry_after)
+RATE_LIMITED_MESSAGE = "You're sending messages too quickly. Please wait a moment and try again."
+OVERLOADED_MESSAGE = "The assistant is busy right now. Please try again in a moment."
+
+
+def reconnect():
+    """Fresh OpenAI client and database handles, e.g. in a forked worker"""
+    global client
+    client = OpenAI(api_key=api_key, max_retries=0, http_client=openai_http_client())
+    citation_index.client = client
+    if shard_search is not None:
+        shard_search.reconnect(client)
+    session_store.reconnect()
+    buckets.reconnect()
+    usage_store.reconnect()
+
+
+def category_classifier():
+    """Classifier over the indexed document titles, rebuilt when the documents change"""
+    global _classifier
+    if local_index is not None and retriever == "local":
+        key, documents = local_index.build_id, local_index.documents
+    else:
+        key, documents = citation_index.fingerprint, citation_index.attributes()
+    if key is None:
+        return None
+    if _classifier is None or _classifier[0] != key:
+        _classifier = (key, CategoryClassifier(documents))
+    return _classifier[1]
+
+
+def bounded(data, name, convert, low, high):
+    """An optional numeric /chat field, raising ValueError outside [low, high]"""
+    value = data.get(name)
+    if value is None:
+        return None
+    try:
+        value = convert(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def search_options(data, user_message, session=None):
+    """
+    Retrieval scope and tuning for one /chat request, raising ValueError for bad input.
+
+    `category` (a name or a list of names) and `author` restrict the search to
+    files with those attributes; `"category": "all"` searches everything.
+    Without either, the first question of a session is narrowed to the
+    categories the title classifier is confident about. `max_num_results`,
+    `score_threshold` and `ranker` override the FILE_SEARCH_* settings.
+    """
+    category = data.get('category')
+    author = data.get('author') or None
+    if author is not None and not isinstance(author, str):
+        raise ValueError("author must be a string")
+
+    classifier = category_classifier()
+    known = classifier.categories if classifier is not None else None
+    if category in (None, '', []):
+        categories = []
+        auto = AUTO_CATEGORY and author is None and not (session and session['turns']) and classifier is not None
+        if auto:
+            categories = classifier.select(user_message)
+        scope = "auto" if categories else ("requested" if author else "all")
+    elif category == "all":
+        categories, scope = [], ("requested" if author else "all")
+    else:
+        categories = [category] if isinstance(category, str) else category
+        if not isinstance(categories, list) or not all(isinstance(name, str) for name in categories):
+            raise ValueError("category must be a string or a list of strings")
+        unknown = [name for name in categories if known is not None and name not in known]
+        if unknown:
+            raise ValueError(f"Unknown category: {unknown[0]}")
+        categories, scope = sorted(set(categories)), "requested"
+
+    ranker = data.get('ranker', FILE_SEARCH_RANKER)
+    if ranker is not None and ranker not in FILE_SEARCH_RANKERS:
+        raise ValueError(f"ranker must be one of {', '.join(FILE_SEARCH_RANKERS)}")
+    max_num_results = bounded(data, 'max_num_results', int, 1, 50)
+    score_threshold = bounded(data, 'score_threshold', float, 0, 1)
+
+    count_search_scope(scope)
+    return {
+        'categories': categories,
+        'author': author,
+        'max_num_results': max_num_results if max_num_results is not None else FILE_SEARCH_MAX_RESULTS,
+        'score_threshold': score_threshold if score_threshold is not None else FILE_SEARCH_SCORE_THRESHOLD,
+        'ranker': ranker
+    }
+
+
+def attribute_filter(search):
+    """file_search `filters` for the categories and author in `search`, or None"""
+    filters = []
+    if search['categories']:
+        matches = [{"type": "eq", "key": "category", "value": name} for name in search['categories']]
+        filters.append(matches[0] if len(matches) == 1 else {"type": "or", "filters": matches})
+    if search['author']:
+        filters.append({"type": "eq", "key": "author", "value": search['author']})
+    if not filters:
+        return None
+    return filters[0] if len(filters) == 1 else {"type": "and", "filters": filters}
+
+
+def file_search_tool(search=None):
+    tool = {
+        "type": "file_search",
+        "vector_store_ids": vector_store_ids
+    }
+    if not search:
+        return tool
+    filters = attribute_filter(search)
+    if filters:
+        tool["filters"] = filters
+    if search['max_num_results'] is not None:
+        tool["max_num_results"] = search['max_num_results']
+    ranking_options = {}
+    if search['ranker'] is not None:
+        ranking_options["ranker"] = search['ranker']
+    if search['score_threshold'] is not None:
+        ranking_options["score_threshold"] = search['score_threshold']
+    if ranking_options:
+        tool["ranking_options"] = ranking_options
+    return tool
+
+
+def local_search(user_message, search=None):
+    """
+    Excerpts from the local index, scoped like the hosted search would be.
+    An index built with --vectors also ranks by the question's embedding;
+    if that cannot be fetched the search is BM25 only.
+    """
+    search = search or {}
+    with span("local_search"):
+        query_vector = None
+        if local_index.vectors is not None:
+            try:
+                query_vector = local_index.embed_query(
+                    client.with_options(timeout=LOCAL_EMBED_TIMEOUT, max_retries=1), user_message
+                )
+            except Exception as e:
+                log.warning("Query embedding failed, using BM25 only", extra=fields(error=str(e)))
+        return local_index.search(
+            user_message,
+            k=search.get('max_num_results') or LOCAL_TOP_K,
+            query_vector=query_vector,
+            category=search.get('categories'),
+            author=search.get('author')
+        )
+
+
+def search_shards(user_message, search=None, route=None):
+    """
+    The best excerpts across the category stores the question is scoped to.
+
+    Each store searched is charged to the shared requests budget first. If
+    every shard fails with a transient error the search is retried like a
+    response call, and raises Overloaded once the retries run out.
+    """
+    search = search or {}
+    stores, _ = shard_search.stores_for(search.get('categories'))
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        with span("admission"):
+            upstream_limiter.admit(requests=len(stores), tokens=False)
+        try:
+            with span("shard_search"):
+                return shard_search.search(
+                    user_message,
+                    k=search.get('max_num_results') or (route or {}).get('max_num_results') or SHARD_TOP_K,
+                    categories=search.get('categories'),
+                    author=search.get('author'),
+                    score_threshold=search.get('score_threshold'),
+                    ranker=search.get('ranker')
+                )
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            if attempt == OPENAI_MAX_RETRIES:
+                raise Overloaded("Vector store search is unavailable", retry_after=delay) from e
+            count_retry(e)
+            log.warning("Shard search failed, retrying", extra=fields(error=str(e), retry=attempt + 1, delay=round(delay, 2)))
+            time.sleep(delay)
+
+
+def choose_route(user_message, session=None, search=None):
+    """The model_router route for a question, noted on the request's trace for usage accounting"""
+    with span("route"):
+        # The cache scan is only worth it when the router will look at the result
+        proximity = answer_cache.proximity(user_message, answer_context(session, search)) if model_router.enabled else 0.0
+        route = model_router.route(user_message, search, session, proximity)
+    route['category'] = ",".join(search['categories']) if search and search['categories'] else "all"
+    count_route(route['tier'])
+    trace = current_trace()
+    if trace is not None:
+        trace.model_route = route
+    return route
+
+
+def model_options(route=None):
+    """The model (and reasoning effort) arguments for a route; MODEL without one"""
+    if route is None:
+        return {"model": MODEL}
+    options = {"model": route['model']}
+    if route['reasoning']:
+        options["reasoning"] = {"effort": route['reasoning']}
+    return options
+
+
+def build_response_request(user_message, context_chunks=None, search=None, route=None):
+    """
+    Arguments for client.responses.create shared by the JSON and streaming paths.
+
+    With `context_chunks` from the local index or the shards the excerpts are sent inline and
+    the hosted file_search tool is left out. `search` comes from search_options
+    and `route` from choose_route; a route's max_num_results applies unless
+    the request or settings set one.
+    """
+    if context_chunks is not None:
+        from local_retrieval import LOCAL_CONTEXT_INSTRUCTIONS, format_context
+        return {
+            **model_options(route),
+            "instructions": INSTRUCTIONS + LOCAL_CONTEXT_INSTRUCTIONS,
+            "input": format_context(context_chunks, user_message)
+        }
+    if search and route and route['max_num_results'] and search['max_num_results'] is None:
+        search = dict(search, max_num_results=route['max_num_results'])
+    return {
+        **model_options(route),
+        "instructions": INSTRUCTIONS,
+        "input": user_message,
+        "tools": [file_search_tool(search)],
+        "include": ["file_search_call.results"]
+    }
+
+
+def retrieval_attempts(user_message, search=None, route=None):
+    """
+    Yield (request_args, context_chunks) for each retriever to try in turn.
+
+    context_chunks is None when the hosted file_search tool is used. The
+    "shards" retriever searches the category stores before the call. In
+    "fallback" mode a failed hosted call is followed by one attempt with
+    excerpts from the local index; the local search only runs if it is needed.
+    """
+    if retriever == "local":
+        context_chunks = local_search(user_message, search)
+        yield build_response_request(user_message, context_chunks, route=route), context_chunks
+        return
+
+    if retriever == "shards":
+        context_chunks = search_shards(user_message, search, route)
+        yield build_response_request(user_message, context_chunks, route=route), context_chunks
+        return
+
+    if retriever != "fallback":
+        yield build_response_request(user_message, search=search, route=route), None
+        return
+
+    yield dict(build_response_request(user_message, search=search, route=route), timeout=FILE_SEARCH_TIMEOUT), None
+    context_chunks = local_search(user_message, search)
+    yield build_response_request(user_message, context_chunks, route=route), context_chunks
+
+
+def with_recap(request_args, session):
+    """Prefix the input with the session's last exchange, if it has one"""
+    if not session or not session['recap']:
+        return request_args
+    return dict(request_args, input=f"Earlier in this conversation:\n{session['recap']}\n\nNow answer this:\n{request_args['input']}")
+
+
+def response_attempts(user_message, session=None, search=None, route=None):
+    """
+    Yield (request_args, context_chunks) for each Responses API call to try in turn.
+
+    Follow-ups chain to the session's previous response, so the history is not
+    sent again. If that fails (e.g. the stored response is gone) the same
+    retriever is retried with the recap of the last exchange instead.
+    """
+    for request_args, context_chunks in retrieval_attempts(user_message, search, route):
+        if session and session['previous_response_id']:
+            yield dict(request_args, previous_response_id=session['previous_response_id']), context_chunks
+        yield with_recap(request_args, session), context_chunks
+
+
+class UpstreamCall:
+    """
+    Retry and fallback bookkeeping for one answer, shared by the sync and async
+    create_response.
+
+    Rate limits, 5xx replies and dropped connections are retried up to
+    OPENAI_MAX_RETRIES times with jittered backoff (or the upstream's
+    Retry-After); a 429 also pauses every worker for that long. Other errors,
+    or transient ones that persist, move on to the next of response_attempts.
+    Once those run out a persistent transient error becomes Overloaded, so
+    the client gets a 503 with Retry-After rather than a 500.
+    """
+
+    def __init__(self, user_message, session=None, search=None):
+        self.route = choose_route(user_message, session, search)
+        self.attempts = response_attempts(user_message, session, search, self.route)
+        self.request_args, self.context_chunks = next(self.attempts)
+        self.retries = 0
+
+    def failed(self, error):
+        """Seconds to wait before the next call, or raise if there is nothing left to try"""
+        delay = retry_delay(error, self.retries)
+        if delay is not None and self.retries < OPENAI_MAX_RETRIES:
+            self.retries += 1
+            count_retry(error)
+            if is_rate_limit(error):
+                upstream_limiter.pause(delay)
+            log.warning("OpenAI call failed, retrying", extra=fields(
+                error=str(error), retry=self.retries, delay=round(delay, 2)
+            ))
+            return delay
+
+        fallback = next(self.attempts, None)
+        if fallback is None:
+            if delay is not None:
+                raise Overloaded("OpenAI is unavailable", retry_after=delay) from error
+            raise error
+        log.warning("Response request failed, retrying", extra=fields(error=str(error)))
+        self.request_args, self.context_chunks = fallback
+        self.retries = 0
+        return 0
+
+
+def create_response(user_message, stream=False, session=None, search=None, admitted=False):
+    """
+    Call the Responses API with the configured retriever, returns (response, context_chunks).
+
+    Every call waits for the shared rate limits first, the first one is skipped
+    if the caller already `admitted` it. Raises Overloaded when it cannot be made.
+    """
+    call = UpstreamCall(user_message, session, search)
+    while True:
+        if not admitted:
+            with span("admission"):
+                upstream_limiter.admit()
+        admitted = False
+        try:
+            # For streams this ends when the response headers arrive, see StreamTiming
+            with span("openai_request"):
+                response = client.responses.create(stream=stream, **call.request_args)
+            if not stream:
+                account_usage(response)
+            return response, call.context_chunks
+        except Exception as e:
+            time.sleep(call.failed(e))
+
+
+def account_usage(response):
+    """Count a completed response's tokens in the metrics, the shared token budget and the usage store"""
+    record_usage(response)
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        upstream_limiter.settle(usage.input_tokens + usage.output_tokens)
+        try:
+            usage_store.record(usage_row(response, current_trace()))
+        except Exception as e:
+            log.error("Error recording usage", extra=fields(error=str(e)))
+
+
+def record_turn(session_id, user_message, reply, response=None):
+    """Remember a finished turn so the session's next question can follow on from it"""
+    usage = getattr(response, 'usage', None)
+    history_tokens = (usage.input_tokens + usage.output_tokens) if usage else 0
+    session_store.record(session_id, user_message, reply, getattr(response, 'id', None), history_tokens)
+
+
+def extract_reply_and_citations(response, context_chunks=None):
+    """
+    Pull the answer text and resolved file citations out of a completed response
+    """
+    with span("citations"):
+        return _extract_reply_and_citations(response, context_chunks)
+
+
+def _extract_reply_and_citations(response, context_chunks):
+    reply = ""
+    annotations = []
+
+    # Process the output items
+    for output in response.output:
+        if output.type == "message":
+            for content in output.content:
+                if content.type == "output_text":
+                    reply = content.text
+                    annotations.extend(getattr(content, 'annotations', None) or [])
+
+    if context_chunks is not None:
+        # Locally retrieved excerpts are cited by their [n] markers in the reply
+        from local_retrieval import cite_chunks
+        return reply, cite_chunks(reply, context_chunks)
+
+    # Attributes come from the included search results or the preloaded index,
+    # so no vector store lookups happen while the user waits
+    citations = resolve_citations(response, annotations, citation_index)
+
+    return reply, citations
+
+
+def answer_context(session=None, search=None):
+    """
+    Cache namespace for everything other than the question that shapes the
+    answer (including the search scope), or None for follow-ups, whose
+    answers depend on the conversation
+    """
+    if session and session['turns']:
+        return None
+    return context_key(
+        model=MODEL,
+        instructions=INSTRUCTIONS,
+        retriever=retriever,
+        vector_store_ids=vector_store_ids,
+        vector_store_shards=vector_store_shards if shard_search else None,
+        vector_store=citation_index.fingerprint,
+        local_index=local_index.build_id if local_index else None,
+        routing=model_router.signature(),
+        search=search
+    )
+
+
+def cached_answer(user_message, cache_context):
+    """Answer cache lookup, counted as a hit or miss in the metrics"""
+    with span("answer_cache"):
+        cached = answer_cache.get(user_message, cache_context)
+    if cache_context is not None:
+        count_cache_lookup(cached is not None)
+    return cached
+
+
+def wants_stream(data, accept_header):
+    """Clients opt in to SSE with {"stream": true} or an event-stream Accept header"""
+    if data.get('stream') is True:
+        return True
+    return 'text/event-stream' in (accept_header or '')
+
+
+def sse_event(event, payload):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # Stop proxies from buffering the stream
+}
+
+
+def overloaded_event(error):
+    """SSE error frame for a stream whose upstream call was refused or kept failing"""
+    return sse_event("error", {
+        'response': OVERLOADED_MESSAGE,
+        'retry_after': error.retry_after
+    })
+
+
+def cached_events(cached, session_id):
+    """SSE frames replaying a cached answer"""
+    return [
+        sse_event("delta", {"text": cached['response']}),
+        sse_event("citations", {'citations': cached['citations']}),
+        sse_event("done", {'response': cached['response'], 'session_id': session_id})
+    ]
+
+
+def stream_event_delta(event):
+    """
+    Output text carried by a Responses stream event, or None.
+
+    Raises if the stream reports a failure.
+    """
+    if event.type == "response.output_text.delta":
+        return event.delta
+    if event.type in ("response.failed", "error"):
+        raise RuntimeError(getattr(event, 'message', None) or "Response failed")
+    return None
+
+
+class StreamTiming:
+    """
+    Stage timings read off a Responses event stream: time to the first output
+    token, the hosted file_search (between its in_progress and completed
+    events) and the whole stream.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = False
+        self.search_started = None
+
+    def event(self, event):
+        now = time.perf_counter()
+        if event.type == "response.output_text.delta":
+            if not self.first_token:
+                self.first_token = True
+                observe("first_token", now - self.started)
+        elif event.type == "response.file_search_call.in_progress":
+            self.search_started = now
+        elif event.type == "response.file_search_call.completed" and self.search_started is not None:
+            observe("file_search", now - self.search_started)
+            self.search_started = None
+
+    def done(self):
+        observe("stream", time.perf_counter() - self.started)
+
+
+def completion_events(user_message, cache_context, final_response, context_chunks, session_id):
+    """Final SSE frames once a streamed response has completed, caching the answer"""
+    if final_response is None:
+        return [sse_event("error", {'response': 'Response ended before completion'})]
+
+    account_usage(final_response)
+    reply, citations = extract_reply_and_citations(final_response, context_chunks)
+    if reply:
+        answer_cache.set(user_message, cache_context, {'response': reply, 'citations': citations})
+        record_turn(session_id, user_message, reply, final_response)
+    return [
+        sse_event("citations", {'citations': citations}),
+        sse_event("done", {'response': reply, 'session_id': session_id})
+    ]
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import threading
+import time
+
+from logs import get_logger, fields
+
+log = get_logger("citation_index")
+
+CITATION_FIELDS = ('url', 'title', 'author', 'category', 'original_file_id')
+
+
+class CitationIndex:
+    """
+    In-process map of vector store file_id -> attributes.
+
+    The index is filled from vector_stores.files.list on a background thread and
+    refreshed periodically, so resolving a citation never needs a network call.
+    """
+
+    def __init__(self, client, vector_store_ids, refresh_interval=600):
+        self.client = client
+        self.vector_store_ids = list(vector_store_ids)
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+        self.last_refresh = None
+        self.fingerprint = None
+        self._files = {}
+        self._listeners = []
+        self._wake = threading.Event()
+        self._thread = None
+
+    def get(self, file_id):
+        """Return the stored attributes for a file, or None if it is not indexed"""
+        return self._files.get(file_id)
+
+    def attributes(self):
+        """Attributes of every indexed file"""
+        return list(self._files.values())
+
+    def __len__(self):
+        return len(self._files)
+
+    def refresh(self):
+        """List every file in the vector stores and swap in the new index"""
+        files = {}
+        for vector_store_id in self.vector_store_ids:
+            after = None
+            while True:
+                page = self.client.vector_stores.files.list(
+                    vector_store_id,
+                    limit=100,
+                    **({'after': after} if after else {})
+                )
+                for vector_file in page.data:
+                    files[vector_file.id] = dict(vector_file.attributes or {})
+                if not page.has_more:
+                    break
+                after = page.last_id
+
+        # Replacing the dict is atomic, readers see either the old or new index
+        self._files = files
+        self.loaded = True
+        self.last_refresh = time.time()
+
+        fingerprint = hashlib.sha1(json.dumps(files, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        if fingerprint != self.fingerprint:
+            previous, self.fingerprint = self.fingerprint, fingerprint
+            if previous is not None:
+                for listener in self._listeners:
+                    listener()
+        return len(files)
+
+    def on_change(self, listener):
+        """Call `listener()` whenever a refresh finds the vector store contents changed"""
+        self._listeners.append(listener)
+
+    def request_refresh(self):
+        """Ask the background thread to refresh early, e.g. after a lookup miss"""
+        self._wake.set()
+
+    def start(self):
+        """Build the index, unless it was just loaded, and keep it fresh on a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="citation-index", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # An index loaded before the worker forked is only refreshed once it is due
+        due = self.last_refresh + self.refresh_interval if self.loaded else 0
+        while True:
+            self._wake.wait(max(0, due - time.time()))
+            self._wake.clear()
+            try:
+                count = self.refresh()
+                log.info("Citation index refreshed", extra=fields(files=count))
+            except Exception as e:
+                log.error("Error refreshing citation index", extra=fields(error=str(e)))
+            due = time.time() + self.refresh_interval
+
+
+def search_result_attributes(response):
+    """Attributes carried by file_search_call.results, keyed by file_id"""
+    attributes = {}
+    for output in response.output:
+        if output.type == "file_search_call":
+            for result in getattr(output, 'results', None) or []:
+                if result.attributes:
+                    attributes[result.file_id] = dict(result.attributes)
+    return attributes
+
+
+def resolve_citations(response, annotations, index):
+    """
+    Turn file_citation annotations into citation dicts, one per cited file.
+
+    Attributes come from the search results included in the response first and
+    the in-process index second. A file found in neither is returned with empty
+    metadata and triggers a background refresh instead of a blocking lookup.
+    """
+    included = search_result_attributes(response)
+    citations = []
+    seen = set()
+
+    for annotation in annotations:
+        if annotation.type != "file_citation" or annotation.file_id in seen:
+            continue
+        seen.add(annotation.file_id)
+
+        attributes = included.get(annotation.file_id)
+        if attributes is None:
+            attributes = index.get(annotation.file_id)
+        if attributes is None:
+            log.warning("No attributes indexed for cited file", extra=fields(file_id=annotation.file_id))
+            index.request_refresh()
+            citations.append({
+                'filename': annotation.filename,
+                'file_id': annotation.file_id,
+                'metadata': {}
+            })
+            continue
+
+        citations.append({
+            # The uploaded file may be a text derivative, the attribute names the PDF
+            'filename': attributes.get('filename') or annotation.filename,
+            'file_id': annotation.file_id,
+            'metadata': {field: attributes.get(field) or None for field in CITATION_FIELDS}
+        })
+
+    return citations
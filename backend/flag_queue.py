@@ -0,0 +1,193 @@
+import json
+import random
+import threading
+import time
+
+from state_db import connect
+from logs import get_logger, fields
+
+log = get_logger("flag_queue")
+
+MAX_ATTEMPTS = 20
+# 4xx replies that are about the request as a whole (credentials, the table,
+# rate limits, timeouts) rather than the rows in it; the batch is retried
+BATCH_LEVEL_STATUSES = {401, 403, 404, 408, 429}
+
+
+class SendError(Exception):
+    """A sender's failure to deliver rows, with the upstream's HTTP status if it replied"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def rejected(self):
+        """Whether the upstream refused the rows themselves, so sending them again cannot help"""
+        return self.status is not None and 400 <= self.status < 500 and self.status not in BATCH_LEVEL_STATUSES
+
+
+class FlagQueue:
+    """
+    Durable local queue of flag rows waiting to be inserted into Supabase.
+
+    `enqueue` only writes to SQLite, so /flag returns as soon as the row is on
+    disk. A daemon thread claims batches with a lease (so several gunicorn
+    workers sharing the file never send the same row twice at once), hands them
+    to `sender(rows)` and deletes them once it returns. Failed batches are
+    retried with exponential backoff; rows left over from a previous process are
+    picked up on start. When the sender raises a SendError that rejects the
+    rows (e.g. one has a bad timestamp), the batch is split in halves until the
+    offending rows are found; only those are set aside as undeliverable.
+    """
+
+    def __init__(self, path, sender, batch_size=100, flush_interval=2.0, lease_seconds=60, max_backoff=300):
+        self.path = path
+        self.sender = sender
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lease_seconds = lease_seconds
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._conn = connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_flags (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0
+            )
+        """)
+
+    def reconnect(self):
+        """Open a new SQLite connection, e.g. in a forked worker; handles must not cross a fork"""
+        with self._lock:
+            self._conn = connect(self.path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, payload):
+        """Store one flag row and nudge the flusher"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO pending_flags (payload, created_at) VALUES (?, ?)",
+                (json.dumps(payload), time.time())
+            )
+        self._wake.set()
+        return cursor.lastrowid
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload FROM pending_flags WHERE available_at <= ? AND attempts < ? ORDER BY id LIMIT ?",
+                    (now, MAX_ATTEMPTS, self.batch_size)
+                ).fetchall()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE pending_flags SET available_at = ? WHERE id = ?",
+                        [(now + self.lease_seconds, row[0]) for row in rows]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _ack(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_flags WHERE id = ?", [(i,) for i in ids])
+
+    def _dead_letter(self, ids):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pending_flags SET attempts = ? WHERE id = ?", [(MAX_ATTEMPTS, i) for i in ids]
+            )
+
+    def _release(self, ids, delay):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE pending_flags SET attempts = attempts + 1, available_at = ? WHERE id = ?",
+                [(time.time() + delay, i) for i in ids]
+            )
+
+    def backoff(self):
+        """Seconds to wait after the current run of failures, with jitter"""
+        delay = min(self.flush_interval * (2 ** self.failures), self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def flush_once(self):
+        """Send one batch, returns the number of rows delivered"""
+        rows = self._claim()
+        if not rows:
+            return 0
+        settled = set()
+        try:
+            delivered = self._deliver(rows, settled)
+        except Exception as e:
+            self.failures += 1
+            delay = self.backoff()
+            ids = [row[0] for row in rows if row[0] not in settled]
+            log.warning("Error sending flags to Supabase", extra=fields(rows=len(ids), retry_in=round(delay), error=str(e)))
+            self._release(ids, delay)
+            raise
+        self.failures = 0
+        self.sent += delivered
+        return delivered
+
+    def _deliver(self, rows, settled):
+        """
+        Send `rows`, acknowledging them on success. A rejected batch is split in
+        halves and a rejected single row dead-lettered; ids dealt with either way
+        are added to `settled`. Returns the number delivered, other errors propagate.
+        """
+        ids = [row[0] for row in rows]
+        try:
+            self.sender([json.loads(row[1]) for row in rows])
+        except SendError as e:
+            if not e.rejected:
+                raise
+            if len(rows) == 1:
+                log.error("Flag rejected by Supabase, set aside", extra=fields(id=ids[0], status=e.status, error=str(e)))
+                self._dead_letter(ids)
+                settled.update(ids)
+                return 0
+            middle = len(rows) // 2
+            return self._deliver(rows[:middle], settled) + self._deliver(rows[middle:], settled)
+        self._ack(ids)
+        settled.update(ids)
+        return len(ids)
+
+    def start(self):
+        """Deliver queued flags on a daemon thread, including any left from a previous run"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="flag-flusher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self.flush_once() == self.batch_size:
+                    continue  # more rows are probably waiting
+                wait = self.flush_interval
+            except Exception:
+                wait = self.backoff()
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def stats(self):
+        with self._lock:
+            pending, dead = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(attempts >= ?), 0) FROM pending_flags", (MAX_ATTEMPTS,)
+            ).fetchone()
+        return {'pending': pending, 'undeliverable': dead, 'sent': self.sent, 'consecutive_failures': self.failures}
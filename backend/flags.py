@@ -0,0 +1,163 @@
+"""Supabase `flags` table access shared by the sync and async apps"""
+import base64
+import hashlib
+import json
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from settings import SUPABASE_URL, SUPABASE_API_KEY, STATE_DIR, FLAG_FLUSH_INTERVAL, FLAGS_CACHE_TTL
+from flag_queue import FlagQueue, SendError
+from ttl_cache import TTLCache
+from cassette import mount
+from logs import get_logger, fields
+
+log = get_logger("flags")
+
+FLAGS_URL = f"{SUPABASE_URL}/rest/v1/flags"
+FLAGS_COLUMNS = "id,timestamp,user_prompt,flagged_text"
+SUPABASE_TIMEOUT = 10
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Recently served /flags pages, keyed by query string
+flags_pages = TTLCache(max_entries=256, ttl=FLAGS_CACHE_TTL)
+
+
+def supabase_headers():
+    return {
+        "apikey": SUPABASE_API_KEY,
+        "Authorization": f"Bearer {SUPABASE_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def flag_payload(data):
+    """Map the frontend's /flag body onto a `flags` row"""
+    flagged_text = data.get('flaggedText')
+    user_prompt = data.get('userPrompt')
+    timestamp = data.get('timestamp')
+
+    log.info("Flagged response", extra=fields(timestamp=timestamp, user_prompt=user_prompt, flagged_text=flagged_text))
+
+    return {
+        "timestamp": timestamp,
+        "user_prompt": user_prompt,
+        "flagged_text": flagged_text
+    }
+
+
+# Keep-alive connection pool to Supabase for the background flusher
+supabase_session = requests.Session()
+supabase_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+# Recorded or replayed instead when a cassette is active (see cassette.py)
+mount(supabase_session, pool_connections=1, pool_maxsize=4)
+supabase_session.headers.update(supabase_headers())
+
+
+def insert_flags(rows):
+    """Bulk insert rows into the flags table, raising SendError on a failed request or any non-2xx reply"""
+    try:
+        response = supabase_session.post(
+            FLAGS_URL,
+            json=rows,
+            headers={"Prefer": "return=minimal"},
+            timeout=SUPABASE_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise SendError(f"Supabase request failed: {e}") from e
+    if response.status_code not in (200, 201, 204):
+        raise SendError(f"Supabase returned {response.status_code}: {response.text}", status=response.status_code)
+    # New rows change the first page, drop what this process has cached
+    flags_pages.clear()
+
+
+# /flag writes here and returns; the flusher delivers batches to Supabase
+# (started by each worker, see lifecycle.py)
+flag_queue = FlagQueue(STATE_DIR / "flag_queue.sqlite3", insert_flags, flush_interval=FLAG_FLUSH_INTERVAL)
+
+
+def reconnect():
+    """Drop pooled Supabase connections and reopen the queue database, e.g. in a forked worker"""
+    supabase_session.close()
+    flag_queue.reconnect()
+
+
+def encode_cursor(row):
+    raw = json.dumps({'t': row['timestamp'], 'id': row['id']}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return position['t'], int(position['id'])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def flags_page_url(args):
+    """
+    Supabase URL for one page of flags, newest first, plus the page size.
+
+    Accepts `limit`, an opaque `cursor` from a previous page's X-Next-Cursor
+    header, and `since`/`until` timestamps (inclusive/exclusive). Pages use
+    keyset pagination on (timestamp, id), so deep pages cost the same as the first.
+    With neither `limit` nor `cursor` every flag is returned as before paging
+    existed, and the page size is None.
+    """
+    params = [
+        ('select', FLAGS_COLUMNS),
+        ('order', 'timestamp.desc,id.desc')
+    ]
+    limit = None
+    if args.get('limit') is not None or args.get('cursor'):
+        try:
+            limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        # One extra row tells us whether another page exists
+        params.append(('limit', str(limit + 1)))
+    if args.get('since'):
+        params.append(('timestamp', f"gte.{args['since']}"))
+    if args.get('until'):
+        params.append(('timestamp', f"lt.{args['until']}"))
+    if args.get('cursor'):
+        timestamp, row_id = decode_cursor(args['cursor'])
+        params.append(('or', f'(timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",id.lt.{row_id}))'))
+
+    return f"{FLAGS_URL}?{urlencode(params)}", limit
+
+
+def flags_page_entry(rows, limit):
+    """Serialised page with its ETag and next cursor, ready to cache; a `limit` of None is every row"""
+    if limit is None:
+        next_cursor = None
+    else:
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        rows = rows[:limit]
+    body = json.dumps(rows).encode('utf-8')
+    return {
+        'body': body,
+        'etag': '"' + hashlib.sha1(body).hexdigest() + '"',
+        'next_cursor': next_cursor
+    }
+
+
+def flags_page_headers(entry):
+    headers = {
+        'ETag': entry['etag'],
+        'Cache-Control': f"private, max-age={int(FLAGS_CACHE_TTL)}"
+    }
+    if entry['next_cursor']:
+        headers['X-Next-Cursor'] = entry['next_cursor']
+    return headers
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
@@ -1,7 +1,44 @@
 import os
+import shutil
+from pathlib import Path
 
 # Gunicorn config variables
 bind = "0.0.0.0:10000"  # Use a specific port
 workers = 4
-threads = 4
-timeout = 120
\ No newline at end of file
+timeout = 120
+
+# Import the app once in the master; workers share its memory copy-on-write
+preload_app = True
+
+if os.getenv("PODC_ASYNC") == "1":
+    # async_server:app on an event loop, each worker holds many in-flight chats
+    wsgi_app = "async_server:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    # server:app with a fixed pool of request threads per worker
+    threads = 4
+
+# Workers write their metrics here so /metrics can add up every process.
+# Must be set before prometheus_client is imported by a worker.
+# Cleared here rather than in on_starting: with preload_app the master imports
+# the app, and so creates its metric files, before on_starting runs.
+metrics_dir = Path(os.getenv("PODC_STATE_DIR", Path(__file__).resolve().parent.parent / "storage" / "state")) / "metrics"
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", str(metrics_dir))
+# Samples left by a previous run would be counted again
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker forks
+    import lifecycle
+    lifecycle.preload()
+
+def post_fork(server, worker):
+    # Reopen connections, start background threads and warm the upstream pools
+    # before this worker accepts its first request
+    import lifecycle
+    lifecycle.start_worker()
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
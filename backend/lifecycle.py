@@ -0,0 +1,143 @@
+"""
+Process start-up and readiness for the sync and async apps.
+
+gunicorn.conf.py preloads the app, so modules are imported, the citation
+index is listed and any local index is mapped once in the master process and
+the workers share that memory copy-on-write. Threads, sockets and SQLite
+handles do not survive a fork, so each worker calls `start_worker()` from the
+post_fork hook to reopen them, start its background threads and open warm
+connections to OpenAI and Supabase before it accepts a request. Served any
+other way (python server.py, uvicorn), the first request starts the worker.
+"""
+import os
+import threading
+import time
+
+from settings import MODEL
+import chat_pipeline
+import flags
+from logs import get_logger, fields
+
+log = get_logger("lifecycle")
+
+# Seconds each warm-up request may take before the worker gives up on it
+WARM_TIMEOUT = 5
+
+_lock = threading.Lock()
+_import_pid = os.getpid()
+_started_pid = None
+_warm = {'openai': None, 'supabase': None}
+
+
+def preload():
+    """Build the shared read-only state in the master, before the workers fork"""
+    started = time.perf_counter()
+    try:
+        files = chat_pipeline.citation_index.refresh()
+        # Trained here once so the workers share it
+        chat_pipeline.category_classifier()
+    except Exception as e:
+        files = None
+        log.error("Error preloading citation index, workers will retry", extra=fields(error=str(e)))
+
+    # Every worker opens its own connections after the fork
+    chat_pipeline.client.close()
+    chat_pipeline.session_store.close()
+    chat_pipeline.buckets.close()
+    chat_pipeline.usage_store.close()
+    flags.flag_queue.close()
+    log.info("Preloaded", extra=fields(
+        citation_files=files,
+        local_index=chat_pipeline.local_index is not None,
+        seconds=round(time.perf_counter() - started, 2)
+    ))
+
+
+def start_worker(warm=True):
+    """Reopen per-process resources and start the background threads, once per process"""
+    global _started_pid
+    with _lock:
+        if _started_pid == os.getpid():
+            return
+        if os.getpid() != _import_pid:
+            chat_pipeline.reconnect()
+            flags.reconnect()
+        chat_pipeline.citation_index.start()
+        flags.flag_queue.start()
+        _started_pid = os.getpid()
+    if warm:
+        warm_connections()
+
+
+def ensure_started():
+    """Start this process on its first request if no post_fork hook did"""
+    if _started_pid != os.getpid():
+        start_worker(warm=False)
+
+
+# Cheapest authenticated request to each upstream
+WARM_SUPABASE_URL = f"{flags.FLAGS_URL}?select=id&limit=1"
+
+
+def _warmed(name, started, status=200, error=None):
+    if error is None and status != 200:
+        error = f"status {status}"
+    _warm[name] = error is None
+    if error is not None:
+        log.warning("Warm-up request failed", extra=fields(upstream=name, error=str(error)))
+    log.debug("Warmed connection", extra=fields(
+        upstream=name, ok=_warm[name], seconds=round(time.perf_counter() - started, 3)
+    ))
+
+
+def warm_connections():
+    """Open pooled connections to OpenAI and Supabase so the first request does not pay for TLS"""
+    started = time.perf_counter()
+    try:
+        chat_pipeline.client.with_options(timeout=WARM_TIMEOUT, max_retries=0).models.retrieve(MODEL)
+        _warmed('openai', started)
+    except Exception as e:
+        _warmed('openai', started, error=e)
+
+    started = time.perf_counter()
+    try:
+        response = flags.supabase_session.get(WARM_SUPABASE_URL, timeout=WARM_TIMEOUT)
+        _warmed('supabase', started, response.status_code)
+    except Exception as e:
+        _warmed('supabase', started, error=e)
+
+
+async def warm_async_connections(async_client, supabase):
+    """Async twin of warm_connections for async_server's clients"""
+    started = time.perf_counter()
+    try:
+        await async_client.with_options(timeout=WARM_TIMEOUT, max_retries=0).models.retrieve(MODEL)
+        _warmed('openai', started)
+    except Exception as e:
+        _warmed('openai', started, error=e)
+
+    started = time.perf_counter()
+    try:
+        response = await supabase.get(WARM_SUPABASE_URL, headers=flags.supabase_headers(), timeout=WARM_TIMEOUT)
+        _warmed('supabase', started, response.status_code)
+    except Exception as e:
+        _warmed('supabase', started, error=e)
+
+
+def readiness(warm=True):
+    """
+    (ready, checks) for /readyz. The worker is ready once it has started, the
+    citation index is loaded and OpenAI answered the warm-up; a missing or
+    failed warm-up is retried here unless `warm` is False. Supabase is reported
+    but not required, flags are queued locally while it is unavailable.
+    """
+    if warm and _started_pid == os.getpid() and not _warm['openai']:
+        warm_connections()
+    checks = {
+        'worker': _started_pid == os.getpid(),
+        'citation_index': chat_pipeline.citation_index.loaded or chat_pipeline.retriever == "local",
+        'openai': bool(_warm['openai']),
+        'supabase': _warm['supabase']
+    }
+    ready = checks['worker'] and checks['citation_index'] and checks['openai']
+    return ready, checks
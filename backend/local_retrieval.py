@@ -0,0 +1,402 @@
+"""
+Local BM25 retrieval over the PDFs in storage/data/PDFs.
+
+The index is built offline into a directory of .npy arrays plus a small JSON
+header, and loaded with memory mapping so startup only reads the header.
+
+    python local_retrieval.py build [--vectors]
+    python local_retrieval.py query "how do I apply for the NDIS?"
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).parent.parent.resolve()
+PDF_ROOT = project_root / "storage" / "data" / "PDFs"
+METADATA_CSV = project_root / "storage" / "data" / "metadata.csv"
+DEFAULT_INDEX_DIR = project_root / "storage" / "data" / "local_index"
+
+CHUNK_WORDS = 220
+CHUNK_OVERLAP = 40
+BM25_K1 = 1.2
+BM25_B = 0.75
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+STOPWORDS = set("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you your
+yours yourself yourselves
+""".split())
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def load_catalog_metadata(csv_path=METADATA_CSV):
+    """Title/author/URL per filename from metadata.csv"""
+    metadata = {}
+    if not Path(csv_path).exists():
+        return metadata
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            metadata[row['Name']] = {
+                'title': row.get('Title') or None,
+                'author': row.get('Author') or None,
+                'url': (row.get('URL') or '').replace('\n', '') or None
+            }
+    return metadata
+
+
+def chunk_pages(pages):
+    """Split [(page_number, text)] into overlapping word windows, keeping the start page"""
+    words = []
+    for page_number, text in pages:
+        words.extend((word, page_number) for word in text.split())
+
+    chunks = []
+    step = CHUNK_WORDS - CHUNK_OVERLAP
+    for start in range(0, max(len(words) - CHUNK_OVERLAP, 1), step):
+        window = words[start:start + CHUNK_WORDS]
+        if window:
+            chunks.append((window[0][1], " ".join(word for word, _ in window)))
+    return chunks
+
+
+def extract_pages(pdf_path):
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(str(pdf_path))
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            print(f"Error extracting page {number} of {pdf_path.name}: {e}")
+            text = ""
+        if text.strip():
+            pages.append((number, text))
+    return pages
+
+
+def embed_texts(client, texts, batch_size=256, model=EMBEDDING_MODEL):
+    """Unit-normalized embedding matrix for `texts`"""
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        response = client.embeddings.create(model=model, input=texts[start:start + batch_size])
+        vectors.extend(item.embedding for item in response.data)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    return matrix
+
+
+def build_index(pdf_root=PDF_ROOT, index_dir=DEFAULT_INDEX_DIR, with_vectors=False, client=None):
+    """Extract, chunk and index every PDF under `pdf_root` into `index_dir`"""
+    pdf_root = Path(pdf_root)
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    catalog = load_catalog_metadata()
+
+    documents = []
+    chunk_texts = []
+    chunk_doc = []
+    chunk_page = []
+
+    for pdf_path in sorted(pdf_root.glob('**/*.pdf')):
+        try:
+            pages = extract_pages(pdf_path)
+        except Exception as e:
+            print(f"Error processing {pdf_path}: {e}")
+            continue
+
+        relative = pdf_path.relative_to(pdf_root)
+        metadata = catalog.get(pdf_path.name, {})
+        doc_id = len(documents)
+        documents.append({
+            'filename': pdf_path.name,
+            'path': relative.as_posix(),
+            'category': relative.parts[0] if len(relative.parts) > 1 else None,
+            'title': metadata.get('title'),
+            'author': metadata.get('author'),
+            'url': metadata.get('url')
+        })
+        for page_number, text in chunk_pages(pages):
+            chunk_texts.append(text)
+            chunk_doc.append(doc_id)
+            chunk_page.append(page_number)
+        print(f"Indexed {pdf_path.name}: {len(pages)} pages")
+
+    # Term -> [(chunk, tf)] postings, stored as CSR arrays ordered by term id
+    vocabulary = {}
+    postings = []
+    doc_lengths = np.zeros(len(chunk_texts), dtype=np.float32)
+    for chunk_id, text in enumerate(chunk_texts):
+        counts = {}
+        tokens = tokenize(text)
+        doc_lengths[chunk_id] = len(tokens)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            term_id = vocabulary.setdefault(token, len(vocabulary))
+            if term_id == len(postings):
+                postings.append([])
+            postings[term_id].append((chunk_id, tf))
+
+    indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    for term_id, entries in enumerate(postings):
+        indptr[term_id + 1] = indptr[term_id] + len(entries)
+    posting_chunks = np.fromiter((c for entries in postings for c, _ in entries), dtype=np.int32, count=int(indptr[-1]))
+    posting_tf = np.fromiter((tf for entries in postings for _, tf in entries), dtype=np.float32, count=int(indptr[-1]))
+
+    # Chunk text lives in one UTF-8 blob so only the returned chunks are ever paged in
+    encoded = [text.encode('utf-8') for text in chunk_texts]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    for i, blob in enumerate(encoded):
+        text_offsets[i + 1] = text_offsets[i] + len(blob)
+    with open(index_dir / 'texts.bin', 'wb') as f:
+        for blob in encoded:
+            f.write(blob)
+
+    np.save(index_dir / 'postings_indptr.npy', indptr)
+    np.save(index_dir / 'postings_chunks.npy', posting_chunks)
+    np.save(index_dir / 'postings_tf.npy', posting_tf)
+    np.save(index_dir / 'chunk_lengths.npy', doc_lengths)
+    np.save(index_dir / 'chunk_doc.npy', np.asarray(chunk_doc, dtype=np.int32))
+    np.save(index_dir / 'chunk_page.npy', np.asarray(chunk_page, dtype=np.int32))
+    np.save(index_dir / 'text_offsets.npy', text_offsets)
+
+    vectors_file = index_dir / 'vectors.npy'
+    if with_vectors:
+        np.save(vectors_file, embed_texts(client, chunk_texts))
+    elif vectors_file.exists():
+        vectors_file.unlink()
+
+    header = {
+        'build_id': time.strftime('%Y%m%d_%H%M%S'),
+        'chunk_count': len(chunk_texts),
+        'avg_chunk_length': float(doc_lengths.mean()) if len(chunk_texts) else 0.0,
+        'embedding_model': EMBEDDING_MODEL if with_vectors else None,
+        'documents': documents,
+        'vocabulary': vocabulary
+    }
+    with open(index_dir / 'index.json', 'w', encoding='utf-8') as f:
+        json.dump(header, f, ensure_ascii=False)
+
+    print(f"Local index written to {index_dir}: {len(documents)} documents, {len(chunk_texts)} chunks, {len(vocabulary)} terms")
+    return header
+
+
+class LocalIndex:
+    """Memory-mapped BM25 index (plus optional embedding matrix) produced by build_index"""
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / 'index.json', encoding='utf-8') as f:
+            header = json.load(f)
+        self.build_id = header['build_id']
+        self.documents = header['documents']
+        self.vocabulary = header['vocabulary']
+        self.avg_chunk_length = header['avg_chunk_length'] or 1.0
+        self.chunk_count = header['chunk_count']
+        self.embedding_model = header.get('embedding_model')
+
+        def load(name):
+            return np.load(self.index_dir / name, mmap_mode='r')
+
+        self.indptr = load('postings_indptr.npy')
+        self.posting_chunks = load('postings_chunks.npy')
+        self.posting_tf = load('postings_tf.npy')
+        self.chunk_lengths = load('chunk_lengths.npy')
+        self.chunk_doc = load('chunk_doc.npy')
+        self.chunk_page = load('chunk_page.npy')
+        self.text_offsets = load('text_offsets.npy')
+        self.texts = np.memmap(self.index_dir / 'texts.bin', dtype=np.uint8, mode='r') if self.text_offsets[-1] else None
+        vectors_file = self.index_dir / 'vectors.npy'
+        self.vectors = np.load(vectors_file, mmap_mode='r') if vectors_file.exists() else None
+
+        # Length normalisation only depends on the index, so compute it once
+        self._length_norm = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(self.chunk_lengths) / self.avg_chunk_length)
+
+    @classmethod
+    def load_if_present(cls, index_dir=DEFAULT_INDEX_DIR):
+        if not (Path(index_dir) / 'index.json').exists():
+            print(f"No local index found at {index_dir}")
+            return None
+        return cls(index_dir)
+
+    def chunk_text(self, chunk_id):
+        start, end = self.text_offsets[chunk_id], self.text_offsets[chunk_id + 1]
+        return bytes(self.texts[start:end]).decode('utf-8')
+
+    def embed_query(self, client, query):
+        """`query` embedded with the model the index was built with, or None when it has no vectors"""
+        if self.vectors is None or not self.embedding_model:
+            return None
+        return embed_texts(client, [query], model=self.embedding_model)[0]
+
+    def bm25_scores(self, query):
+        scores = np.zeros(self.chunk_count, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            chunks = self.posting_chunks[start:end]
+            tf = self.posting_tf[start:end]
+            df = end - start
+            idf = math.log(1 + (self.chunk_count - df + 0.5) / (df + 0.5))
+            scores[chunks] += idf * tf * (BM25_K1 + 1) / (tf + self._length_norm[chunks])
+        return scores
+
+    def search(self, query, k=8, query_vector=None, category=None, author=None):
+        """
+        Top-k chunks for `query` as dicts with text, score, page and document metadata.
+
+        When the index has vectors and `query_vector` is given, BM25 and cosine
+        scores are blended after scaling each to [0, 1]. `category` (one name or
+        a list) and `author` restrict the search to matching documents.
+        """
+        if not self.chunk_count:
+            return []
+        scores = self.bm25_scores(query)
+        if self.vectors is not None and query_vector is not None:
+            if scores.max() > 0:
+                scores /= scores.max()
+            cosine = np.asarray(self.vectors) @ np.asarray(query_vector, dtype=np.float32)
+            scores = 0.5 * scores + 0.5 * np.clip(cosine, 0, None)
+        if category or author:
+            categories = [category] if isinstance(category, str) else category
+            doc_ids = [
+                i for i, doc in enumerate(self.documents)
+                if (not categories or doc['category'] in categories) and (not author or doc['author'] == author)
+            ]
+            scores = np.where(np.isin(self.chunk_doc, doc_ids), scores, 0)
+
+        k = min(k, self.chunk_count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for chunk_id in top:
+            if scores[chunk_id] <= 0:
+                break
+            document = self.documents[self.chunk_doc[chunk_id]]
+            results.append({
+                'chunk_id': int(chunk_id),
+                'score': float(scores[chunk_id]),
+                'page': int(self.chunk_page[chunk_id]),
+                'text': self.chunk_text(chunk_id),
+                'document': document
+            })
+        return results
+
+
+def format_context(chunks, question):
+    """Model input with numbered source excerpts ahead of the question"""
+    blocks = []
+    for number, chunk in enumerate(chunks, start=1):
+        document = chunk['document']
+        title = document['title'] or document['filename']
+        page = f" (page {chunk['page']})" if chunk['page'] is not None else ""
+        blocks.append(f"[{number}] {title}{page}\n{chunk['text']}")
+    sources = "\n\n".join(blocks) if blocks else "No documents were retrieved."
+    return f"Retrieved PODC documents:\n\n{sources}\n\nQuestion: {question}"
+
+
+LOCAL_CONTEXT_INSTRUCTIONS = (
+    "\n7. The retrieved documents are numbered excerpts in the input. "
+    "Cite the excerpts you use with their number in square brackets, e.g. [2]."
+)
+
+
+def cite_chunks(reply, chunks):
+    """
+    Citation dicts for the excerpts referenced as [n] in `reply`, one per document.
+    Excerpts from the vector store shards also carry the file and store they came from.
+    """
+    referenced = [int(n) for n in re.findall(r"\[(\d+)\]", reply)]
+    citations = []
+    seen = set()
+    for number in referenced:
+        if not 1 <= number <= len(chunks):
+            continue
+        document = chunks[number - 1]['document']
+        if document['path'] in seen:
+            continue
+        seen.add(document['path'])
+        citation = {
+            'filename': document['filename'],
+            'file_id': chunks[number - 1].get('file_id'),
+            'metadata': {
+                'url': document['url'],
+                'title': document['title'],
+                'author': document['author'],
+                'category': document['category']
+            }
+        }
+        if 'vector_store_id' in chunks[number - 1]:
+            citation['vector_store_id'] = chunks[number - 1]['vector_store_id']
+            citation['metadata']['original_file_id'] = document.get('original_file_id')
+        citations.append(citation)
+    return citations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local retrieval index")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build = subcommands.add_parser('build', help="Index every PDF under storage/data/PDFs")
+    build.add_argument('--vectors', action='store_true', help="Also store an OpenAI embedding matrix")
+    build.add_argument('--index-dir', default=os.getenv("LOCAL_INDEX_DIR", DEFAULT_INDEX_DIR))
+    query = subcommands.add_parser('query', help="Print the top chunks for a question")
+    query.add_argument('question')
+    query.add_argument('-k', type=int, default=5)
+    query.add_argument('--index-dir', default=os.getenv("LOCAL_INDEX_DIR", DEFAULT_INDEX_DIR))
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        client = None
+        if args.vectors:
+            from dotenv import load_dotenv
+            from openai import OpenAI
+            from cassette import openai_http_client
+            load_dotenv()
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
+        build_index(index_dir=args.index_dir, with_vectors=args.vectors, client=client)
+        return
+
+    started = time.perf_counter()
+    index = LocalIndex(args.index_dir)
+    query_vector = None
+    if index.vectors is not None:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+        from cassette import openai_http_client
+        load_dotenv()
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
+        query_vector = index.embed_query(client, args.question)
+    loaded = time.perf_counter()
+    results = index.search(args.question, k=args.k, query_vector=query_vector)
+    searched = time.perf_counter()
+    print(f"Loaded in {(loaded - started) * 1000:.1f} ms, searched in {(searched - loaded) * 1000:.2f} ms")
+    for result in results:
+        document = result['document']
+        print(f"{result['score']:.3f}  {document['filename']} p.{result['page']}")
+        print(f"       {result['text'][:160]}...")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""JSON-lines logging with levels and sampling for the backend"""
+import json
+import logging
+import random
+import sys
+import time
+
+from settings import LOG_LEVEL, LOG_SAMPLE_RATE
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Keep a `LOG_SAMPLE_RATE` fraction of records logged with sampled=True"""
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < LOG_SAMPLE_RATE
+
+
+def fields(sampled=False, **values):
+    """`extra` for a log call: structured values, optionally subject to sampling"""
+    return {'fields': values, 'sampled': sampled}
+
+
+_root = logging.getLogger("podc")
+if not _root.handlers:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(SampleFilter())
+    _root.addHandler(handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+def get_logger(name):
+    return logging.getLogger(f"podc.{name}")
@@ -0,0 +1,182 @@
+"""
+Prometheus metrics and per-request timing spans.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(see gunicorn.conf.py) and /metrics aggregates them, so a scrape sees the
+whole server rather than whichever worker answered.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+from logs import get_logger, fields
+
+log = get_logger("requests")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+REQUESTS = Counter(
+    'podc_http_requests_total', 'HTTP requests by route, method and status', ['route', 'method', 'status']
+)
+REQUEST_SECONDS = Histogram(
+    'podc_http_request_duration_seconds', 'Time until response headers, by route', ['route'],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'podc_stage_duration_seconds', 'Time spent in each stage of handling a request', ['stage'],
+    buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter('podc_stage_errors_total', 'Exceptions raised inside a stage', ['stage'])
+TOKENS = Counter('podc_openai_tokens_total', 'Tokens reported by response.usage', ['model', 'kind'])
+ANSWER_CACHE = Counter('podc_answer_cache_lookups_total', 'Answer cache lookups by result', ['result'])
+ADMISSION = Counter('podc_admission_total', 'OpenAI calls by admission result: immediate, queued or rejected', ['result'])
+UPSTREAM_RETRIES = Counter('podc_openai_retries_total', 'OpenAI calls retried after an error, by error type', ['error'])
+CLIENT_LIMITED = Counter('podc_client_rate_limited_total', '/chat requests refused by the per-client rate limit')
+SEARCH_SCOPE = Counter(
+    'podc_search_scope_total', 'Chats by retrieval scope: requested filters, auto-selected categories or the whole store', ['scope']
+)
+MODEL_ROUTES = Counter('podc_model_routes_total', 'Chats by the model tier the router picked', ['tier'])
+
+_current = contextvars.ContextVar("podc_trace", default=None)
+
+
+class RequestTrace:
+    """Stage timings and token usage collected while one request is handled"""
+
+    def __init__(self, route, method):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.tokens = {}
+        self.status = None
+        self.streaming = False
+        # The model_router route of the request's answer, if it made one
+        self.model_route = None
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    @contextmanager
+    def activate(self):
+        """Make this the trace spans report to, e.g. inside a streaming generator"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def log(self):
+        """One sampled structured line summarising the request"""
+        log.info("request", extra=fields(
+            sampled=True,
+            route=self.route,
+            method=self.method,
+            status=self.status,
+            duration_ms=round((time.perf_counter() - self.started) * 1000, 1),
+            stages_ms={stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            tokens=self.tokens,
+            tier=self.model_route['tier'] if self.model_route else None
+        ))
+
+
+def begin_request(route, method):
+    trace = RequestTrace(route, method)
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def finish_request(trace, status):
+    """Count the request; streamed responses log their summary when the stream ends"""
+    trace.status = status
+    REQUESTS.labels(trace.route, trace.method, str(status)).inc()
+    REQUEST_SECONDS.labels(trace.route).observe(time.perf_counter() - trace.started)
+    if not trace.streaming:
+        trace.log()
+
+
+def observe(stage, seconds):
+    """Record a stage measured elsewhere, e.g. from stream event timestamps"""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as `stage`, counting it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def record_usage(response):
+    """Count the tokens a completed response reports"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    model = getattr(response, 'model', None) or 'unknown'
+    counts = {'input': usage.input_tokens, 'output': usage.output_tokens}
+    input_details = getattr(usage, 'input_tokens_details', None)
+    if input_details is not None:
+        counts['cached'] = getattr(input_details, 'cached_tokens', 0) or 0
+    output_details = getattr(usage, 'output_tokens_details', None)
+    if output_details is not None:
+        counts['reasoning'] = getattr(output_details, 'reasoning_tokens', 0) or 0
+
+    for kind, count in counts.items():
+        if count:
+            TOKENS.labels(model, kind).inc(count)
+    trace = _current.get()
+    if trace is not None:
+        for kind, count in counts.items():
+            trace.tokens[kind] = trace.tokens.get(kind, 0) + count
+
+
+def count_cache_lookup(hit):
+    ANSWER_CACHE.labels('hit' if hit else 'miss').inc()
+
+
+def count_admission(result):
+    ADMISSION.labels(result).inc()
+
+
+def count_retry(error):
+    UPSTREAM_RETRIES.labels(type(error).__name__).inc()
+
+
+def count_client_limited():
+    CLIENT_LIMITED.inc()
+
+
+def count_search_scope(scope):
+    SEARCH_SCOPE.labels(scope).inc()
+
+
+def count_route(tier):
+    MODEL_ROUTES.labels(tier).inc()
+
+
+def render():
+    """(body, content type) for /metrics"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
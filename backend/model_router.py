@@ -0,0 +1,95 @@
+"""
+Pick the model for a /chat question from cheap local features of the query.
+
+Most questions parents ask are short lookups ("what does NDIS stand for?")
+that a small model answers as well as a large one, from a handful of search
+results. Routing those to a light tier cuts latency and cost; questions that
+compare, plan or span several categories go to the complex tier. The
+features are the question's length and wording, the categories the
+classifier picked, whether it is a follow-up, and how close it is to a
+question already in the answer cache (routine questions repeat).
+"""
+import re
+
+TIERS = ("light", "standard", "complex")
+
+# Wording of a definition or single-fact lookup
+LOOKUP_RE = re.compile(
+    r"^(what|who)\s+(is|are|does|do)\b|\bstand\s+for\b|\bmeaning\s+of\b|\bdefin(e|ition)\b|\bacronym\b|\b(where|when)\s+(is|are|can)\b",
+    re.IGNORECASE
+)
+# Wording that asks for reasoning over several documents
+COMPLEX_RE = re.compile(
+    r"\b(compare|comparison|difference|differences|versus|vs|pros\s+and\s+cons|trade-?offs?|step[- ]by[- ]step|help\s+me\s+plan|"
+    r"explain\s+why|which\s+is\s+better|should\s+i|what\s+are\s+(all|my)\s+options)\b",
+    re.IGNORECASE
+)
+
+
+class ModelRouter:
+    """
+    Maps a question to one of TIERS. `tiers` gives each tier's settings:
+    {'model', 'reasoning' (effort or None), 'max_num_results' (or None)}.
+
+    A question is light when it is at most `light_max_words` words, stays
+    within one category and reads like a lookup or is within `near_cached`
+    trigram similarity of a cached question. It is complex when it is at least
+    `complex_min_words` words, asks several questions, spans categories or
+    asks to compare or plan. Follow-ups are never light, the conversation
+    needs the standard model. With `enabled` off everything is standard.
+    """
+
+    def __init__(self, tiers, enabled=True, light_max_words=12, complex_min_words=40, near_cached=0.6):
+        self.tiers = tiers
+        self.enabled = enabled
+        self.light_max_words = light_max_words
+        self.complex_min_words = complex_min_words
+        self.near_cached = near_cached
+
+    def signature(self):
+        """Everything that decides routing, for cache keys"""
+        return {
+            'enabled': self.enabled,
+            'tiers': self.tiers,
+            'thresholds': (self.light_max_words, self.complex_min_words, self.near_cached)
+        }
+
+    def features(self, user_message, search=None, session=None, proximity=0.0):
+        text = user_message.strip()
+        categories = (search or {}).get('categories') or []
+        return {
+            'words': len(text.split()),
+            'questions': max(1, text.count('?')),
+            'categories': len(categories),
+            'follow_up': bool(session and session['turns']),
+            'lookup': bool(LOOKUP_RE.search(text)),
+            'complex_wording': bool(COMPLEX_RE.search(text)),
+            'proximity': round(proximity, 3)
+        }
+
+    def tier(self, features):
+        """(tier, reason) for the features of a question"""
+        if not self.enabled:
+            return "standard", "routing off"
+        if features['words'] >= self.complex_min_words:
+            return "complex", "long"
+        if features['questions'] > 1:
+            return "complex", "several questions"
+        if features['categories'] > 1:
+            return "complex", "several categories"
+        if features['complex_wording']:
+            return "complex", "comparison or plan"
+        if features['follow_up']:
+            return "standard", "follow-up"
+        if features['words'] <= self.light_max_words:
+            if features['lookup']:
+                return "light", "lookup"
+            if features['proximity'] >= self.near_cached:
+                return "light", "near cached"
+        return "standard", "default"
+
+    def route(self, user_message, search=None, session=None, proximity=0.0):
+        """{'tier', 'reason', 'model', 'reasoning', 'max_num_results', 'features'} for a question"""
+        features = self.features(user_message, search, session, proximity)
+        tier, reason = self.tier(features)
+        return dict(self.tiers[tier], tier=tier, reason=reason, features=features)
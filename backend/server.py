@@ -1,48 +1,116 @@
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from openai import OpenAI
-import os
-from dotenv import load_dotenv, find_dotenv
-import json
-import requests
-
-SUPABASE_URL = "https://jqcnepfjbcpgsulzbfna.supabase.co"
-SUPABASE_API_KEY = os.environ.get("SUPABASE_API_KEY")
-vector_store_ids = ["vs_682b3328e1cc8191ae3c2186a94b18e4"]
-
-# Load environment variables from .env with debugging
-env_path = find_dotenv()
-if env_path:
-    print(f"Found .env file at: {env_path}")
-    load_dotenv(env_path)
-else:
-    print("No .env file found!")
+from settings import CORS_ORIGINS, TRUSTED_PROXY_HOPS
+from chat_pipeline import (
+    answer_cache, answer_context, search_options, cached_answer, session_store, record_turn, create_response,
+    extract_reply_and_citations, wants_stream, cached_events, stream_event_delta, StreamTiming,
+    completion_events, sse_event, SSE_HEADERS, upstream_limiter, client_limiter, overloaded_event,
+    RATE_LIMITED_MESSAGE, OVERLOADED_MESSAGE, usage_store, bounded
+)
+from admission import Overloaded, client_address
+from batch import authorized, parse_batch, batch_lines, NDJSON_HEADERS
+from flags import (
+    flag_payload, flag_queue, supabase_session, SUPABASE_TIMEOUT,
+    flags_pages, flags_page_url, flags_page_entry, flags_page_headers, etag_matches
+)
+from metrics import begin_request, current_trace, finish_request, span, render
+from lifecycle import ensure_started, readiness
+from logs import get_logger, fields
+
+log = get_logger("server")
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
-        "origins": [
-            "http://localhost:5000",
-            "https://podc-chatbot-frontend-v2.onrender.com",
-            "https://*.onrender.com",
-            "https://macquarieuniversity.wildapricot.org/", #Change to PODC domain for integration
-            "https://*.wildapricot.org"
-        ],
+        "origins": CORS_ORIGINS,
         "methods": ["GET", "POST"],
         "allow_headers": ["Content-Type"]
     }
 })
 
+@app.before_request
+def start_worker():
+    # A no-op once gunicorn's post_fork hook has started this worker
+    ensure_started()
+
+@app.before_request
+def start_trace():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    begin_request(route, request.method)
+
+@app.after_request
+def end_trace(response):
+    trace = current_trace()
+    if trace is not None:
+        finish_request(trace, response.status_code)
+    return response
+
+def busy_response(message, retry_after, status):
+    """429/503 reply asking the client to come back after `retry_after` seconds"""
+    response = jsonify({'response': message, 'citations': []})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def stream_chat(user_message, cache_context, session_id, session, search):
+    """
+    Stream output text deltas as they arrive, then the resolved citations.
+
+    Events: `delta` ({"text"}) per chunk, `citations` ({"citations"}) once the
+    response has completed, `done` ({"response", "session_id"}) with the full
+    reply, or `error` ({"response"}) if the upstream call fails part way.
+    A call the rate limits refuse raises Overloaded before the stream starts.
+    """
+    trace = current_trace()
+    cached = cached_answer(user_message, cache_context)
+    if cached is None:
+        with span("admission"):
+            upstream_limiter.admit()
+    trace.streaming = True
+
+    def generate():
+        with trace.activate():
+            try:
+                yield from events()
+            finally:
+                trace.log()
+
+    def events():
+        if cached is not None:
+            record_turn(session_id, user_message, cached['response'])
+            yield from cached_events(cached, session_id)
+            return
+
+        final_response = None
+        timing = StreamTiming()
+        try:
+            stream, context_chunks = create_response(
+                user_message, stream=True, session=session, search=search, admitted=True
+            )
+            for event in stream:
+                timing.event(event)
+                delta = stream_event_delta(event)
+                if delta is not None:
+                    yield sse_event("delta", {"text": delta})
+                elif event.type == "response.completed":
+                    final_response = event.response
+            timing.done()
+        except Overloaded as e:
+            yield overloaded_event(e)
+            return
+        except Exception as openai_error:
+            log.error("OpenAI API error", extra=fields(error=str(openai_error), stream=True))
+            yield sse_event("error", {'response': f'OpenAI API Error: {str(openai_error)}'})
+            return
 
-# Set up OpenAI client using the key from environment
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("No API key found. Please check your .env file")
-else:
-    print(f"API key loaded")
+        yield from completion_events(user_message, cache_context, final_response, context_chunks, session_id)
 
-client = OpenAI(api_key=api_key)
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -53,167 +121,167 @@ def chat():
         if not user_message:
             return jsonify({'response': 'No message received'}), 400
 
-        # Add debug print
-        print(f"Received message: {user_message}")
+        retry_after = client_limiter.check(client_address(request.headers.get('X-Forwarded-For'), request.remote_addr, TRUSTED_PROXY_HOPS))
+        if retry_after:
+            return busy_response(RATE_LIMITED_MESSAGE, retry_after, 429)
+
+        log.debug("Received message", extra=fields(sampled=True, user_message=user_message))
 
+        # Follow-ups continue the conversation the session ID names; answers are only cached for first questions
+        with span("session"):
+            session_id, session = session_store.begin(data.get('session_id'))
+
+        # Optional category/author filters and file_search tuning, part of the cache key
         try:
-            # Test OpenAI connection
-            print("Testing OpenAI connection...")
-            print(f"Using API key (first 4 chars): {api_key[:4]}...")
-            
-            response = client.responses.create(
-                model="gpt-4o-mini",
-                instructions = (
-                    "You are the AI assistant for Parents of Deaf Children (PODC). Follow these rules:\n\n"
-                    "1. Use only retrieved PODC documents. Never guess or use prior knowledge.\n"
-                    "2. If unsure, say: 'I don’t know based on the available information. You may consider contacting PODC directly.'\n"
-                    "3. Be clear, kind, and supportive. Avoid jargon. Define terms (e.g., 'NDIS' → 'National Disability Insurance Scheme').\n"
-                    "4. Use bullet points when listing steps or multiple options. Mention the document title if applicable.\n"
-                    "5. Do not fabricate information, sources, or advice.\n"
-                    "6. Reflect before replying: 'Am I using only the retrieved content? Is this clear and kind?'"
-                ),
-                input=user_message,
-                tools=[{
-                    "type": "file_search",
-                    "vector_store_ids": vector_store_ids
-                }],
-                include=["file_search_call.results"]
-            )
-            print("OpenAI call successful")
-            
+            search = search_options(data, user_message, session)
+        except ValueError as e:
+            return jsonify({'response': str(e), 'citations': []}), 400
+        cache_context = answer_context(session, search)
+
+        # Streaming clients get text as it is generated; older clients keep the single JSON reply
+        if wants_stream(data, request.headers.get('Accept')):
+            return stream_chat(user_message, cache_context, session_id, session, search)
+
+        cached = cached_answer(user_message, cache_context)
+        if cached is not None:
+            record_turn(session_id, user_message, cached['response'])
+            response = jsonify(dict(cached, session_id=session_id))
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        try:
+            response, context_chunks = create_response(user_message, session=session, search=search)
+        except Overloaded:
+            raise
         except Exception as openai_error:
-            print(f"OpenAI API Error: {str(openai_error)}")
+            log.error("OpenAI API error", extra=fields(error=str(openai_error)))
             return jsonify({
                 'response': f'OpenAI API Error: {str(openai_error)}',
                 'citations': []
             }), 500
 
         # Extract the main response text and citations
-        reply = ""
-        citations = []
-
-        # Process the output items
-        for output in response.output:
-            if output.type == "message":
-                for content in output.content:
-                    if content.type == "output_text":
-                        reply = content.text
-                        # Extract citations from annotations
-                        if hasattr(content, 'annotations'):
-                            for annotation in content.annotations:
-                                if annotation.type == "file_citation":
-                                    # Get file info from vector store instead of regular files
-                                    try:
-                                        vector_file = client.vector_stores.files.retrieve(
-                                            vector_store_id = vector_store_ids[0],  # Use first ID from the list
-                                            file_id=annotation.file_id
-                                        )
-                                        
-                                        # Extract URL from attributes if available
-                                        url = vector_file.attributes.get('url') if vector_file.attributes else None
-                                        
-                                        print(f"File info for {annotation.filename}:")
-                                        print(f"- File ID: {annotation.file_id}")
-                                        print(f"- URL: {url}")
-                                        
-                                        citation = {
-                                            'filename': annotation.filename,
-                                            'file_id': annotation.file_id,
-                                            'metadata': {
-                                                'url': url,
-                                                'title': vector_file.attributes.get('title') if vector_file.attributes else None,
-                                                'author': vector_file.attributes.get('author') if vector_file.attributes else None,
-                                                'category': vector_file.attributes.get('category') if vector_file.attributes else None
-                                            }
-                                        }
-                                        citations.append(citation)
-                                    except Exception as e:
-                                        print(f"Error retrieving file info: {e}")
-                                        citations.append({
-                                            'filename': annotation.filename,
-                                            'file_id': annotation.file_id,
-                                            'metadata': {}
-                                        })
+        reply, citations = extract_reply_and_citations(response, context_chunks)
+        if reply:
+            answer_cache.set(user_message, cache_context, {'response': reply, 'citations': citations})
+            record_turn(session_id, user_message, reply, response)
 
-        return jsonify({
+        response = jsonify({
             'response': reply,
-            'citations': citations
+            'citations': citations,
+            'session_id': session_id
         })
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    except Overloaded as e:
+        return busy_response(OVERLOADED_MESSAGE, e.retry_after, 503)
 
     except Exception as e:
-        print(f"Detailed error: {str(e)}")
-        import traceback
-        print(f"Stack trace: {traceback.format_exc()}")
+        log.exception("Error handling /chat")
         return jsonify({
             'response': f'Server error: {str(e)}',
             'citations': []
         }), 500
 
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    Answer a list of questions as /chat would, streaming one NDJSON line per
+    question as it finishes and a summary line last, see batch.py
+    """
+    if not authorized(request.headers.get('Authorization')):
+        return jsonify({'message': 'A valid batch API key is required'}), 401
+    try:
+        items, concurrency, use_cache = parse_batch(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    trace = current_trace()
+    trace.streaming = True
+
+    def generate():
+        with trace.activate():
+            try:
+                yield from batch_lines(items, concurrency, use_cache)
+            finally:
+                trace.log()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=NDJSON_HEADERS)
+
 @app.route('/flag', methods=['POST'])
 def flag_message():
     try:
         data = request.get_json()
-        flagged_text = data.get('flaggedText')
-        user_prompt = data.get('userPrompt')
-        timestamp = data.get('timestamp')
-
-        print("\n[FLAGGED]")
-        print(f"- Time: {timestamp}")
-        print(f"- User Prompt: {user_prompt}")
-        print(f"- Flagged Response: {flagged_text}")
-
-        # POST to Supabase
-        headers = {
-            "apikey": SUPABASE_API_KEY,
-            "Authorization": f"Bearer {SUPABASE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "timestamp": timestamp,
-            "user_prompt": user_prompt,
-            "flagged_text": flagged_text
-        }
-
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/flags",
-            headers=headers,
-            json=payload
-        )
-
-        if response.status_code == 201:
-            return jsonify({"message": "Flag stored in Supabase"}), 200
-        else:
-            print("Supabase error:", response.text)
-            return jsonify({"message": "Failed to store flag in Supabase"}), 500
+        payload = flag_payload(data)
 
-    except Exception as e:
-        print(f"Error sending flag: {e}")
+        # Stored durably on local disk, the background flusher sends it to Supabase
+        with span("flag_enqueue"):
+            flag_queue.enqueue(payload)
+        return jsonify({"message": "Flag queued for Supabase"}), 202
+
+    except Exception:
+        log.exception("Error queueing flag")
         return jsonify({"message": "Internal error storing flag"}), 500
 
 @app.route('/flags', methods=['GET'])
 def list_flags():
     try:
-        headers = {
-            "apikey": SUPABASE_API_KEY,
-            "Authorization": f"Bearer {SUPABASE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/flags?select=id,timestamp,user_prompt,flagged_text&order=timestamp.desc",
-            headers=headers
-        )
-
-        if response.status_code == 200:
-            return jsonify(response.json())
-        else:
-            print("Error fetching from Supabase:", response.text)
-            return jsonify({"message": "Failed to fetch flags"}), 500
+        entry = flags_pages.get(request.query_string)
+        if entry is None:
+            try:
+                url, limit = flags_page_url(request.args)
+            except ValueError as e:
+                return jsonify({"message": str(e)}), 400
 
-    except Exception as e:
-        print(f"Error reading flags from Supabase: {e}")
+            with span("supabase"):
+                response = supabase_session.get(url, timeout=SUPABASE_TIMEOUT)
+            if response.status_code != 200:
+                log.error("Error fetching from Supabase", extra=fields(status=response.status_code, body=response.text))
+                return jsonify({"message": "Failed to fetch flags"}), 500
+
+            entry = flags_page_entry(response.json(), limit)
+            flags_pages.set(request.query_string, entry)
+
+        if etag_matches(request.headers.get('If-None-Match'), entry['etag']):
+            return Response(status=304, headers=flags_page_headers(entry))
+        return Response(entry['body'], mimetype='application/json', headers=flags_page_headers(entry))
+
+    except Exception:
+        log.exception("Error reading flags from Supabase")
         return jsonify({"message": "Internal server error"}), 500
 
+@app.route('/flag/queue', methods=['GET'])
+def flag_queue_stats():
+    return jsonify(flag_queue.stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(answer_cache.stats())
+
+@app.route('/usage', methods=['GET'])
+def usage():
+    """Token usage, prompt cache share, cost and latency per answer over the last `days`, by `group`"""
+    try:
+        days = bounded(request.args, 'days', float, 0, 366) or 7
+        return jsonify(usage_store.summary(days, request.args.get('group', 'tier')))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render()
+    return Response(body, content_type=content_type)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness only, never waits on an upstream
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready, checks = readiness()
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
 if __name__ == '__main__':
     app.run(debug=True)
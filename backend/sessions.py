@@ -0,0 +1,109 @@
+import re
+import secrets
+import threading
+import time
+
+from state_db import connect
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+# Characters of each side of the last exchange kept for a recap
+RECAP_CHARS = 1500
+
+
+class SessionStore:
+    """
+    Server-side state for multi-turn /chat conversations.
+
+    A session only remembers the ID of its latest response, so the next turn
+    can chain to it with `previous_response_id` and OpenAI supplies the
+    history. Once a chain carries more than `max_history_tokens` the next turn
+    starts a fresh one, seeded with a short recap of the last exchange.
+    Sessions expire `ttl` seconds after their last turn. The SQLite file is
+    shared by the worker processes, so any worker can continue a session.
+    """
+
+    def __init__(self, path, ttl=1800, max_history_tokens=8000):
+        self.ttl = ttl
+        self.max_history_tokens = max_history_tokens
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                previous_response_id TEXT,
+                history_tokens INTEGER NOT NULL DEFAULT 0,
+                recap TEXT,
+                turns INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connect(self):
+        conn = connect(self.path)
+        # Losing the last turn in a power cut is fine, so skip the fsync per write
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reconnect(self):
+        """Open a new SQLite connection, e.g. in a forked worker; handles must not cross a fork"""
+        with self._lock:
+            self._conn = self._connect()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, session_id):
+        """The live session with this ID as a dict, or None if unknown or expired"""
+        if not session_id or not SESSION_ID.match(session_id):
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT previous_response_id, history_tokens, recap, turns FROM sessions WHERE id = ? AND updated_at > ?",
+                (session_id, time.time() - self.ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'previous_response_id': row[0], 'history_tokens': row[1], 'recap': row[2], 'turns': row[3]}
+
+    def begin(self, session_id):
+        """(session_id, session) for a request; unknown or expired IDs get a new, empty session"""
+        session = self.get(session_id)
+        if session is None:
+            session_id = secrets.token_urlsafe(16)
+            session = {'previous_response_id': None, 'history_tokens': 0, 'recap': None, 'turns': 0}
+        return session_id, session
+
+    def record(self, session_id, user_message, reply, response_id=None, history_tokens=0):
+        """
+        Store a finished turn. `history_tokens` is what chaining to `response_id`
+        would resend (the response's input plus output tokens); past the limit, or
+        without a response to chain to, the next turn uses the recap instead.
+        """
+        if response_id is None or history_tokens > self.max_history_tokens:
+            response_id, history_tokens = None, 0
+        recap = f"User: {user_message[:RECAP_CHARS]}\nAssistant: {reply[:RECAP_CHARS]}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO sessions (id, previous_response_id, history_tokens, recap, turns, updated_at)
+                VALUES (?, ?, ?, ?, 1, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    previous_response_id = excluded.previous_response_id,
+                    history_tokens = excluded.history_tokens,
+                    recap = excluded.recap,
+                    turns = turns + 1,
+                    updated_at = excluded.updated_at
+            """, (session_id, response_id, history_tokens, recap, now))
+            self._conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (now - self.ttl,))
+
+    def stats(self):
+        with self._lock:
+            active, turns = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(turns), 0) FROM sessions WHERE updated_at > ?",
+                (time.time() - self.ttl,)
+            ).fetchone()
+        return {'active': active, 'turns': turns}
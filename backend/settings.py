@@ -0,0 +1,157 @@
+"""Configuration shared by the sync (server.py) and async (async_server.py) apps"""
+import os
+import json
+from pathlib import Path
+from dotenv import load_dotenv
+
+project_root = Path(__file__).parent.parent.resolve()
+
+# Load environment variables from backend/.env or the project root, checked
+# directly rather than searching up the directory tree on every start
+env_path = next((path for path in (Path(__file__).parent / ".env", project_root / ".env") if path.exists()), None)
+if env_path:
+    print(f"Found .env file at: {env_path}")
+    load_dotenv(env_path)
+else:
+    print("No .env file found!")
+
+SUPABASE_URL = os.getenv("SUPABASE_URL", "https://jqcnepfjbcpgsulzbfna.supabase.co")
+SUPABASE_API_KEY = os.environ.get("SUPABASE_API_KEY")
+
+def configured_vector_store_ids():
+    """VECTOR_STORE_IDS (comma separated), else the store last synced by vector_store_setup.py"""
+    if os.getenv("VECTOR_STORE_IDS"):
+        return [store_id.strip() for store_id in os.environ["VECTOR_STORE_IDS"].split(",") if store_id.strip()]
+    manifest_path = project_root / "storage" / "data" / "vector_store_manifest.json"
+    if manifest_path.exists():
+        with open(manifest_path, encoding='utf-8') as f:
+            store_id = json.load(f).get('vector_store_id')
+        if store_id:
+            return [store_id]
+    return ["vs_682b3328e1cc8191ae3c2186a94b18e4"]
+
+vector_store_ids = configured_vector_store_ids()
+
+def configured_vector_store_shards():
+    """
+    {category: vector store ID} from VECTOR_STORE_SHARDS ("Category=vs_...;Other=vs_..."),
+    else the per-category stores synced by vector_store_setup.py --shards
+    """
+    if os.getenv("VECTOR_STORE_SHARDS"):
+        shards = {}
+        for entry in os.environ["VECTOR_STORE_SHARDS"].split(";"):
+            category, _, store_id = entry.rpartition("=")
+            if category.strip() and store_id.strip():
+                shards[category.strip()] = store_id.strip()
+        return shards
+    shards = {}
+    for path in sorted((project_root / "storage" / "data" / "vector_store_shards").glob("*.json")):
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('category') and manifest.get('vector_store_id'):
+            shards[manifest['category']] = manifest['vector_store_id']
+    return shards
+
+# One store per category; when there are any /chat searches them instead of vector_store_ids
+vector_store_shards = configured_vector_store_shards()
+
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+CORS_ORIGINS = [
+    "http://localhost:5000",
+    "https://podc-chatbot-frontend-v2.onrender.com",
+    "https://*.onrender.com",
+    "https://macquarieuniversity.wildapricot.org/", #Change to PODC domain for integration
+    "https://*.wildapricot.org"
+]
+
+# Set up OpenAI client using the key from environment
+api_key = os.getenv("OPENAI_API_KEY")
+if not api_key:
+    raise ValueError("No API key found. Please check your .env file")
+else:
+    print(f"API key loaded")
+
+# Answer cache
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY")) if os.getenv("ANSWER_CACHE_SIMILARITY") else None
+
+# Retrieval backend: "file_search" (hosted vector store), "local" (index built by
+# local_retrieval.py), "fallback" (hosted, retried locally if the upstream call
+# fails) or "shards" (the category stores searched in parallel, the default when there are any)
+RETRIEVER = os.getenv("PODC_RETRIEVER", "shards" if vector_store_shards else "file_search")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR")
+LOCAL_TOP_K = int(os.getenv("LOCAL_TOP_K", "8"))
+# Seconds to wait for the question's embedding when the local index has vectors
+LOCAL_EMBED_TIMEOUT = float(os.getenv("LOCAL_EMBED_TIMEOUT", "5"))
+FILE_SEARCH_TIMEOUT = float(os.getenv("FILE_SEARCH_TIMEOUT", "30"))
+# Excerpts kept from the merged shard results, and seconds each shard search may take
+SHARD_TOP_K = int(os.getenv("SHARD_TOP_K", "10"))
+SHARD_SEARCH_TIMEOUT = float(os.getenv("SHARD_SEARCH_TIMEOUT", "10"))
+
+# Local SQLite state (flag queue) shared by the worker processes on one machine
+STATE_DIR = Path(os.getenv("PODC_STATE_DIR", project_root / "storage" / "state"))
+FLAG_FLUSH_INTERVAL = float(os.getenv("FLAG_FLUSH_INTERVAL", "2"))
+
+# Seconds a page of /flags is served from memory before Supabase is asked again
+FLAGS_CACHE_TTL = float(os.getenv("FLAGS_CACHE_TTL", "15"))
+
+# Multi-turn /chat sessions: idle seconds before a session expires, and the
+# history a chained turn may carry before it restarts from a short recap
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_MAX_HISTORY_TOKENS = int(os.getenv("SESSION_MAX_HISTORY_TOKENS", "8000"))
+
+# Logging: minimum level, and the fraction of routine per-request lines kept
+# (warnings and errors are always logged)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+
+# file_search tuning for /chat, each can also be set per request. Unset values
+# use the API defaults. AUTO_CATEGORY=1 narrows questions that seem to belong
+# to one or two knowledge base categories when the request names none; it is
+# off by default because a wrong guess drops the documents that would answer
+# (check it with benchmarks/auto_category.py).
+FILE_SEARCH_MAX_RESULTS = int(os.getenv("FILE_SEARCH_MAX_RESULTS")) if os.getenv("FILE_SEARCH_MAX_RESULTS") else None
+FILE_SEARCH_SCORE_THRESHOLD = float(os.getenv("FILE_SEARCH_SCORE_THRESHOLD")) if os.getenv("FILE_SEARCH_SCORE_THRESHOLD") else None
+FILE_SEARCH_RANKER = os.getenv("FILE_SEARCH_RANKER")
+AUTO_CATEGORY = os.getenv("AUTO_CATEGORY", "0") == "1"
+
+# Admission control for OpenAI calls, shared by the workers: the account's
+# requests and tokens per minute, how many calls each worker may queue and
+# for how long before turning requests away with 503, and retries on 429/5xx.
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+ADMISSION_MAX_WAITING = int(os.getenv("ADMISSION_MAX_WAITING", "32"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+# Per-client /chat limit (by X-Forwarded-For address): sustained rate and burst; 0 disables
+CHAT_RATE_PER_MINUTE = float(os.getenv("CHAT_RATE_PER_MINUTE", "20"))
+CHAT_BURST = int(os.getenv("CHAT_BURST", "10"))
+# Proxies in front of the app that append to X-Forwarded-For (Render's); 0 uses the socket address
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+# /chat/batch: callers must send this as a bearer token (the endpoint is off
+# while it is unset), the most questions per request, default and maximum
+# concurrent questions, and how long a question may keep waiting for budget
+BATCH_API_KEY = os.getenv("BATCH_API_KEY")
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "300"))
+
+# Model routing for /chat, off unless MODEL_ROUTING=1: short, simple questions go
+# to MODEL_LIGHT with fewer file_search results, complex ones to MODEL_COMPLEX,
+# the rest to MODEL. *_REASONING sets a reasoning effort for reasoning models
+# (left out when unset).
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "0") == "1"
+MODEL_LIGHT = os.getenv("MODEL_LIGHT", "gpt-4.1-nano")
+MODEL_COMPLEX = os.getenv("MODEL_COMPLEX", MODEL)
+MODEL_LIGHT_REASONING = os.getenv("MODEL_LIGHT_REASONING")
+MODEL_REASONING = os.getenv("MODEL_REASONING")
+MODEL_COMPLEX_REASONING = os.getenv("MODEL_COMPLEX_REASONING")
+LIGHT_MAX_NUM_RESULTS = int(os.getenv("LIGHT_MAX_NUM_RESULTS", "5"))
+
+# Per-answer token usage and cost kept for GET /usage, in days
+USAGE_RETENTION_DAYS = float(os.getenv("USAGE_RETENTION_DAYS", "90"))
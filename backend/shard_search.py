@@ -0,0 +1,128 @@
+"""
+Search the per-category vector stores in parallel and merge the results.
+
+With the library sharded by category (vector_store_setup.py --shards) a
+question only searches the stores of the categories it is scoped to, all at
+once, so adding a category does not slow down searches in the others. Each
+store is queried with vector_stores.search, the results are merged by score,
+and the best excerpts are sent to the model inline like the local
+retriever's, each cited with the store it was found in.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import get_logger, fields
+
+log = get_logger("shard_search")
+
+
+class ShardSearch:
+    """
+    Parallel search over {category: vector store ID}. `on_error(error)`, if
+    given, sees every failed shard search, e.g. to back off after a 429.
+    """
+
+    def __init__(self, client, shards, timeout=10, max_workers=16, on_error=None):
+        self.shards = dict(shards)
+        self.on_error = on_error
+        self.timeout = timeout
+        self.max_workers = max(1, min(max_workers, len(self.shards)))
+        self.client = client
+        self._executor = None
+        self._pid = None
+
+    def reconnect(self, client):
+        """Use a new client, e.g. in a forked worker"""
+        self.client = client
+        self._executor = None
+
+    def executor(self):
+        # Threads do not survive a fork, each worker starts its own pool
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shard-search")
+            self._pid = os.getpid()
+        return self._executor
+
+    def stores_for(self, categories):
+        """
+        [(category, store ID)] to search and whether they still need a category
+        filter: the stores of the named categories, or every store when none
+        are named or none of them has a store of its own.
+        """
+        chosen = [(category, self.shards[category]) for category in categories or () if category in self.shards]
+        if chosen:
+            return chosen, False
+        return sorted(self.shards.items()), bool(categories)
+
+    def search_store(self, store_id, query, k, filters=None, ranking_options=None):
+        arguments = {'vector_store_id': store_id, 'query': query, 'max_num_results': k}
+        if filters:
+            arguments['filters'] = filters
+        if ranking_options:
+            arguments['ranking_options'] = ranking_options
+        return self.client.with_options(timeout=self.timeout, max_retries=1).vector_stores.search(**arguments)
+
+    def search(self, query, k, categories=None, author=None, score_threshold=None, ranker=None):
+        """
+        The `k` best excerpts across the shards as local_retrieval chunk dicts,
+        plus each one's `score`, `file_id` and `vector_store_id`. A shard that
+        fails is left out; if every shard fails the last error is raised.
+        """
+        stores, filter_categories = self.stores_for(categories)
+        filters = []
+        if filter_categories:
+            matches = [{"type": "eq", "key": "category", "value": name} for name in categories]
+            filters.append(matches[0] if len(matches) == 1 else {"type": "or", "filters": matches})
+        if author:
+            filters.append({"type": "eq", "key": "author", "value": author})
+        filters = (filters[0] if len(filters) == 1 else {"type": "and", "filters": filters}) if filters else None
+        ranking_options = {}
+        if ranker is not None:
+            ranking_options['ranker'] = ranker
+        if score_threshold is not None:
+            ranking_options['score_threshold'] = score_threshold
+
+        executor = self.executor()
+        futures = [
+            (category, store_id, executor.submit(self.search_store, store_id, query, k, filters, ranking_options))
+            for category, store_id in stores
+        ]
+        chunks = []
+        errors = []
+        for category, store_id, future in futures:
+            try:
+                page = future.result()
+            except Exception as e:
+                errors.append(e)
+                if self.on_error is not None:
+                    self.on_error(e)
+                log.warning("Shard search failed", extra=fields(category=category, vector_store_id=store_id, error=str(e)))
+                continue
+            chunks.extend(result_chunk(result, category, store_id) for result in page.data)
+        if errors and len(errors) == len(futures):
+            raise errors[-1]
+
+        chunks.sort(key=lambda chunk: chunk['score'], reverse=True)
+        return chunks[:k]
+
+
+def result_chunk(result, category, store_id):
+    """A vector_stores.search result as a chunk for local_retrieval.format_context and cite_chunks"""
+    attributes = dict(result.attributes or {})
+    text = "\n".join(content.text for content in result.content or [] if content.type == "text")
+    return {
+        'text': text,
+        'page': None,
+        'score': result.score,
+        'file_id': result.file_id,
+        'vector_store_id': store_id,
+        'document': {
+            'path': result.file_id,
+            'filename': attributes.get('filename') or result.filename,
+            'title': attributes.get('title') or None,
+            'author': attributes.get('author') or None,
+            'category': attributes.get('category') or category,
+            'url': attributes.get('url') or None,
+            'original_file_id': attributes.get('original_file_id') or None
+        }
+    }
@@ -0,0 +1,12 @@
+"""SQLite files under STATE_DIR shared by the worker processes on one machine"""
+import sqlite3
+from pathlib import Path
+
+
+def connect(path):
+    """SQLite connection in WAL mode, safe to share the file between worker processes"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
@@ -0,0 +1,19 @@
+"""
+Backend modules import each other by bare name and read their settings at
+import time, so the path and environment are set before any test imports them.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+# Nothing listens here, so a test that forgets its stub fails instead of calling out
+os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+os.environ["SUPABASE_URL"] = "http://127.0.0.1:9"
+os.environ.setdefault("VECTOR_STORE_IDS", "vs_test")
+os.environ.setdefault("PODC_RETRIEVER", "file_search")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ["PODC_STATE_DIR"] = tempfile.mkdtemp(prefix="podc-tests-")
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from admission import BucketStore, UpstreamLimiter, Overloaded, client_address
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BucketStore(tmp_path / "admission.sqlite3")
+    yield store
+    store.close()
+
+
+def levels(store):
+    return dict(store._conn.execute("SELECT name, level FROM buckets").fetchall())
+
+
+def test_take_charges_every_bucket(store):
+    assert store.take([("a", 1, 10, 3), ("b", 1, 5, 2)]) == 0
+    assert levels(store) == pytest.approx({"a": 7, "b": 3}, abs=0.01)
+
+
+def test_failed_draw_charges_no_bucket(store):
+    store.take([("a", 1, 10, 1), ("b", 1, 5, 1)])
+    before = levels(store)
+    # "a" has plenty, "b" does not: neither may be charged
+    wait = store.take([("a", 1, 10, 5), ("b", 1, 5, 5)])
+    assert wait == pytest.approx(1, abs=0.1)
+    assert levels(store) == pytest.approx(before, abs=0.01)
+
+
+def test_concurrent_draws_never_overdraw(tmp_path):
+    stores = [BucketStore(tmp_path / "admission.sqlite3") for _ in range(4)]
+    granted = []
+
+    def draw(store):
+        for _ in range(10):
+            if store.take([("shared", 0.001, 10, 1)]) <= 0:
+                granted.append(1)
+
+    threads = [threading.Thread(target=draw, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 10
+
+
+def test_block_refuses_draws_until_it_expires(store):
+    store.block(["a", "b"], 30)
+    assert store.take([("a", 1, 10, 1)]) == pytest.approx(30, abs=1)
+    assert store.take([("b", 1, 10, 1)]) == pytest.approx(30, abs=1)
+    assert store.take([("c", 1, 10, 1)]) == 0
+
+
+def test_pause_blocks_both_upstream_buckets(store):
+    limiter = UpstreamLimiter(store, "openai", 600, 60000, max_wait=0.1)
+    limiter.admit()
+    limiter.pause(30)
+    with pytest.raises(Overloaded) as raised:
+        limiter.admit()
+    assert raised.value.retry_after >= 29
+    with pytest.raises(Overloaded):
+        limiter.admit(requests=3, tokens=False)
+
+
+def test_search_requests_draw_no_tokens(store):
+    limiter = UpstreamLimiter(store, "openai", 600, 60000)
+    limiter.admit(requests=3, tokens=False)
+    assert levels(store) == pytest.approx({"openai:requests": 97}, abs=0.1)
+
+
+def test_client_address_ignores_spoofed_entries():
+    # The client prepended two addresses; the proxy appended the real one
+    assert client_address("6.6.6.6, 7.7.7.7, 203.0.113.5", "10.0.0.1") == "203.0.113.5"
+    assert client_address("6.6.6.6, 203.0.113.5, 10.0.0.2", "10.0.0.1", trusted_hops=2) == "203.0.113.5"
+
+
+def test_client_address_without_forwarded_for():
+    assert client_address(None, "10.0.0.1") == "10.0.0.1"
+    assert client_address(" , ", "10.0.0.1") == "10.0.0.1"
+    assert client_address("203.0.113.5", "10.0.0.1", trusted_hops=0) == "10.0.0.1"
+    assert client_address(None, None) == "unknown"
+
+
+def test_client_address_with_fewer_hops_than_trusted():
+    assert client_address("203.0.113.5", "10.0.0.1", trusted_hops=3) == "203.0.113.5"
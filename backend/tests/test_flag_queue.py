@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from flag_queue import FlagQueue, SendError, MAX_ATTEMPTS
+
+
+class StubSender:
+    """Records every batch; rows marked `bad` make the whole batch fail with `status`"""
+
+    def __init__(self, status=None, delay=0):
+        self.status = status
+        self.delay = delay
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, rows):
+        time.sleep(self.delay)
+        with self._lock:
+            self.batches.append([row['n'] for row in rows])
+        if self.status is not None and any(row.get('bad') for row in rows):
+            raise SendError("rejected", status=self.status)
+
+    @property
+    def sent(self):
+        return [n for batch in self.batches for n in batch]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "flag_queue.sqlite3"
+
+
+def attempts(queue):
+    return dict(queue._conn.execute("SELECT id, attempts FROM pending_flags").fetchall())
+
+
+def test_delivered_rows_are_removed(path):
+    sender = StubSender()
+    queue = FlagQueue(path, sender, batch_size=10)
+    for n in range(25):
+        queue.enqueue({'n': n})
+    assert [queue.flush_once() for _ in range(4)] == [10, 10, 5, 0]
+    assert sender.sent == list(range(25))
+    assert queue.stats()['pending'] == 0
+
+
+def test_concurrent_claims_never_send_a_row_twice(path):
+    sender = StubSender(delay=0.01)
+    queues = [FlagQueue(path, sender, batch_size=7) for _ in range(4)]
+    for n in range(100):
+        queues[0].enqueue({'n': n})
+
+    def drain(queue):
+        while queue.flush_once():
+            pass
+
+    threads = [threading.Thread(target=drain, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(sender.sent) == list(range(100))
+
+
+def test_claimed_rows_are_leased(path):
+    queue = FlagQueue(path, StubSender(), lease_seconds=60)
+    queue.enqueue({'n': 1})
+    assert len(queue._claim()) == 1
+    # Another worker sees nothing until the lease runs out
+    assert FlagQueue(path, StubSender())._claim() == []
+
+
+def test_failed_batch_is_released_with_backoff(path):
+    def down(rows):
+        raise SendError("Supabase returned 503", status=503)
+
+    queue = FlagQueue(path, down, flush_interval=10)
+    for n in range(3):
+        queue.enqueue({'n': n})
+    with pytest.raises(SendError):
+        queue.flush_once()
+    assert set(attempts(queue).values()) == {1}
+    assert queue.stats()['consecutive_failures'] == 1
+    # Not available again until the backoff has passed
+    assert queue.flush_once() == 0
+
+
+def test_rejected_batch_sets_aside_only_the_bad_row(path):
+    sender = StubSender(status=400)
+    queue = FlagQueue(path, sender)
+    ids = [queue.enqueue({'n': n, 'bad': n == 37}) for n in range(100)]
+    assert queue.flush_once() == 99
+    assert attempts(queue) == {ids[37]: MAX_ATTEMPTS}
+    stats = queue.stats()
+    assert stats['undeliverable'] == 1
+    assert stats['consecutive_failures'] == 0
+    # Delivered exactly once each, and the bad row is never claimed again
+    delivered = [n for batch in sender.batches if not any(n == 37 for n in batch) for n in batch]
+    assert sorted(delivered) == [n for n in range(100) if n != 37]
+    assert queue.flush_once() == 0
+
+
+@pytest.mark.parametrize("status", [401, 429, 500])
+def test_batch_level_errors_do_not_split_the_batch(path, status):
+    sender = StubSender(status=status)
+    queue = FlagQueue(path, sender)
+    for n in range(10):
+        queue.enqueue({'n': n, 'bad': n == 3})
+    with pytest.raises(SendError):
+        queue.flush_once()
+    assert len(sender.batches) == 1
+    assert set(attempts(queue).values()) == {1}
+
+
+def test_transient_error_while_splitting_keeps_what_was_settled(path):
+    calls = []
+
+    def sender(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise SendError("bad row", status=422)
+        if len(calls) == 3:
+            raise SendError("Supabase returned 502", status=502)
+
+    queue = FlagQueue(path, sender)
+    for n in range(4):
+        queue.enqueue({'n': n})
+    with pytest.raises(SendError):
+        queue.flush_once()
+    # The first half went through; only the second half is released for a retry
+    assert list(attempts(queue).values()) == [1, 1]
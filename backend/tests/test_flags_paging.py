@@ -0,0 +1,93 @@
+import json
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+from flags import (
+    encode_cursor, decode_cursor, flags_page_url, flags_page_entry, etag_matches,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+)
+
+
+def query(url):
+    return parse_qsl(urlsplit(url).query)
+
+
+def flag(n):
+    # Newest first, two rows share each timestamp so the id breaks ties
+    return {'id': 100 - n, 'timestamp': f"2026-01-01T00:00:{59 - n // 2:02d}Z", 'user_prompt': "q", 'flagged_text': "t"}
+
+
+def test_cursor_round_trip():
+    row = flag(3)
+    assert decode_cursor(encode_cursor(row)) == (row['timestamp'], row['id'])
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "eyJ0IjogMX0="])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_no_limit_or_cursor_returns_everything():
+    url, limit = flags_page_url({})
+    assert limit is None
+    assert ('limit', str(DEFAULT_PAGE_SIZE + 1)) not in query(url)
+
+
+def test_cursor_alone_uses_the_default_page_size():
+    url, limit = flags_page_url({'cursor': encode_cursor(flag(0))})
+    assert limit == DEFAULT_PAGE_SIZE
+    assert ('limit', str(DEFAULT_PAGE_SIZE + 1)) in query(url)
+
+
+@pytest.mark.parametrize("value", ["0", str(MAX_PAGE_SIZE + 1), "ten"])
+def test_limit_is_validated(value):
+    with pytest.raises(ValueError):
+        flags_page_url({'limit': value})
+
+
+def test_cursor_continues_after_the_last_row_including_ties():
+    row = flag(5)
+    url, _ = flags_page_url({'limit': "5", 'cursor': encode_cursor(row), 'since': "2026-01-01T00:00:00Z"})
+    params = query(url)
+    assert ('order', 'timestamp.desc,id.desc') in params
+    assert ('timestamp', 'gte.2026-01-01T00:00:00Z') in params
+    assert ('or', f'(timestamp.lt."{row["timestamp"]}",and(timestamp.eq."{row["timestamp"]}",id.lt.{row["id"]}))') in params
+
+
+def keyset_page(rows, cursor, limit):
+    """What Supabase returns for flags_page_url's filter: rows after the cursor, limit + 1 of them"""
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        rows = [row for row in rows if (row['timestamp'], row['id']) < (timestamp, row_id)]
+    return rows[:limit + 1]
+
+
+def test_pages_cover_every_row_once():
+    rows = [flag(n) for n in range(23)]
+    seen, cursor = [], None
+    while True:
+        entry = flags_page_entry(keyset_page(rows, cursor, 5), 5)
+        page = json.loads(entry['body'])
+        assert len(page) <= 5
+        seen.extend(row['id'] for row in page)
+        cursor = entry['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [row['id'] for row in rows]
+
+
+def test_exact_last_page_has_no_next_cursor():
+    rows = [flag(n) for n in range(5)]
+    assert flags_page_entry(rows, 5)['next_cursor'] is None
+    assert flags_page_entry(rows + [flag(5)], 5)['next_cursor'] == encode_cursor(rows[4])
+
+
+def test_etag_follows_the_body():
+    first = flags_page_entry([flag(0)], None)
+    assert first == flags_page_entry([flag(0)], None)
+    assert first['etag'] != flags_page_entry([flag(1)], None)['etag']
+    assert etag_matches(f'"other", {first["etag"]}', first['etag'])
+    assert etag_matches('*', first['etag'])
+    assert not etag_matches(None, first['etag'])
@@ -0,0 +1,93 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+import chat_pipeline
+from sessions import SessionStore, RECAP_CHARS
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(tmp_path / "sessions.sqlite3", ttl=60, max_history_tokens=1000)
+    yield store
+    store.close()
+
+
+def test_unknown_id_starts_a_new_session(store):
+    session_id, session = store.begin("not-a-session-id")
+    assert session_id != "not-a-session-id"
+    assert session == {'previous_response_id': None, 'history_tokens': 0, 'recap': None, 'turns': 0}
+
+
+def test_turns_chain_to_the_previous_response(store):
+    session_id, _ = store.begin(None)
+    store.record(session_id, "What is the NDIS?", "A scheme.", response_id="resp_1", history_tokens=200)
+    store.record(session_id, "Who runs it?", "The agency.", response_id="resp_2", history_tokens=400)
+    same_id, session = store.begin(session_id)
+    assert same_id == session_id
+    assert session['previous_response_id'] == "resp_2"
+    assert session['history_tokens'] == 400
+    assert session['turns'] == 2
+    assert session['recap'] == "User: Who runs it?\nAssistant: The agency."
+
+
+def test_long_chain_falls_back_to_the_recap(store):
+    session_id, _ = store.begin(None)
+    store.record(session_id, "q" * 5000, "a" * 5000, response_id="resp_1", history_tokens=1001)
+    _, session = store.begin(session_id)
+    assert session['previous_response_id'] is None
+    assert session['recap'] == f"User: {'q' * RECAP_CHARS}\nAssistant: {'a' * RECAP_CHARS}"
+
+
+def test_expired_session_starts_over(store):
+    session_id, _ = store.begin(None)
+    store.record(session_id, "hi", "hello", response_id="resp_1")
+    store._conn.execute("UPDATE sessions SET updated_at = ?", (time.time() - 61,))
+    assert store.get(session_id) is None
+    new_id, session = store.begin(session_id)
+    assert new_id != session_id
+    assert session['turns'] == 0
+    # Recording any turn also drops expired rows
+    store.record(new_id, "hi", "hello")
+    assert store.stats() == {'active': 1, 'turns': 1}
+
+
+def test_sessions_are_shared_between_connections(store, tmp_path):
+    session_id, _ = store.begin(None)
+    store.record(session_id, "hi", "hello", response_id="resp_1")
+    other = SessionStore(tmp_path / "sessions.sqlite3", ttl=60)
+    assert other.get(session_id)['previous_response_id'] == "resp_1"
+
+
+def follow_up(previous_response_id="resp_1"):
+    return {'previous_response_id': previous_response_id, 'history_tokens': 100,
+            'recap': "User: hi\nAssistant: hello", 'turns': 1}
+
+
+def test_follow_up_tries_the_chain_then_the_recap():
+    attempts = list(chat_pipeline.response_attempts("And then?", follow_up()))
+    assert [args.get('previous_response_id') for args, _ in attempts] == ["resp_1", None]
+    assert attempts[0][0]['input'] == "And then?"
+    assert attempts[1][0]['input'].startswith("Earlier in this conversation:\nUser: hi\nAssistant: hello")
+
+
+def test_session_without_a_chain_sends_the_recap_only():
+    attempts = list(chat_pipeline.response_attempts("And then?", follow_up(None)))
+    assert len(attempts) == 1
+    assert 'previous_response_id' not in attempts[0][0]
+    assert "User: hi" in attempts[0][0]['input']
+
+
+def test_missing_stored_response_falls_back_to_the_recap():
+    call = chat_pipeline.UpstreamCall("And then?", follow_up())
+    assert call.request_args['previous_response_id'] == "resp_1"
+    request = httpx.Request("POST", "http://127.0.0.1:9/v1/responses")
+    gone = openai.NotFoundError("Previous response not found", response=httpx.Response(404, request=request), body=None)
+    assert call.failed(gone) == 0
+    assert 'previous_response_id' not in call.request_args
+    assert call.request_args['input'].startswith("Earlier in this conversation:")
+    # Nothing left after the recap: the error is raised
+    with pytest.raises(openai.NotFoundError):
+        call.failed(gone)
@@ -0,0 +1,185 @@
+"""
+Per-answer token usage and cost, kept in SQLite for GET /usage.
+
+Every completed Responses call is one row: the route and model tier that made
+it, the model that answered, its search scope, input tokens with the part
+served from OpenAI's prompt cache (the instructions and tool definitions are
+the same for every question, so they are cached once a prefix repeats),
+output and reasoning tokens, file_search calls, an estimated cost and the
+seconds from the request arriving to the answer being complete.
+"""
+import statistics
+import threading
+import time
+
+from state_db import connect
+
+# USD per million tokens: input, cached input, output. Dated model names match by prefix.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-5-nano": (0.05, 0.005, 0.40),
+    "gpt-5-mini": (0.25, 0.025, 2.00),
+    "gpt-5": (1.25, 0.125, 10.00),
+    "o4-mini": (1.10, 0.275, 4.40),
+}
+FILE_SEARCH_CALL_PRICE = 2.50 / 1000
+
+GROUPS = {
+    'tier': "tier",
+    'model': "model",
+    'category': "category",
+    'route': "route",
+    'day': "date(at, 'unixepoch')"
+}
+
+
+def model_prices(model):
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if (model or "").startswith(name):
+            return MODEL_PRICES[name]
+    return None
+
+
+def usage_row(response, trace=None):
+    """The usage row for a completed response, or None if it reports no usage"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return None
+    input_details = getattr(usage, 'input_tokens_details', None)
+    output_details = getattr(usage, 'output_tokens_details', None)
+    cached = (getattr(input_details, 'cached_tokens', 0) or 0) if input_details is not None else 0
+    reasoning = (getattr(output_details, 'reasoning_tokens', 0) or 0) if output_details is not None else 0
+    search_calls = sum(1 for output in getattr(response, 'output', None) or [] if output.type == "file_search_call")
+    model = getattr(response, 'model', None) or 'unknown'
+
+    cost = None
+    prices = model_prices(model)
+    if prices is not None:
+        input_price, cached_price, output_price = prices
+        cost = (
+            (usage.input_tokens - cached) * input_price + cached * cached_price + usage.output_tokens * output_price
+        ) / 1_000_000 + search_calls * FILE_SEARCH_CALL_PRICE
+
+    route = getattr(trace, 'model_route', None) or {}
+    return {
+        'at': time.time(),
+        'route': trace.route if trace is not None else None,
+        'tier': route.get('tier'),
+        'model': model,
+        'category': route.get('category'),
+        'input_tokens': usage.input_tokens,
+        'cached_tokens': cached,
+        'output_tokens': usage.output_tokens,
+        'reasoning_tokens': reasoning,
+        'search_calls': search_calls,
+        'cost': cost,
+        'seconds': round(time.perf_counter() - trace.started, 3) if trace is not None else None
+    }
+
+
+class UsageStore:
+    """Usage rows shared by the worker processes, dropped after `retention_days`"""
+
+    def __init__(self, path, retention_days=90, prune_every=1000):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.prune_every = prune_every
+        self.records = 0
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage (
+                at REAL NOT NULL,
+                route TEXT,
+                tier TEXT,
+                model TEXT,
+                category TEXT,
+                input_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                reasoning_tokens INTEGER NOT NULL,
+                search_calls INTEGER NOT NULL,
+                cost REAL,
+                seconds REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS usage_at ON usage (at)")
+
+    def _connect(self):
+        conn = connect(self.path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reconnect(self):
+        """Open a new SQLite connection, e.g. in a forked worker"""
+        with self._lock:
+            self._conn = self._connect()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, row):
+        columns = ", ".join(row)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO usage ({columns}) VALUES ({', '.join('?' for _ in row)})", tuple(row.values())
+            )
+            self.records += 1
+            if self.records % self.prune_every == 0:
+                self.prune()
+
+    def prune(self):
+        """Drop rows older than the retention period"""
+        self._conn.execute("DELETE FROM usage WHERE at < ?", (time.time() - self.retention,))
+
+    def summary(self, days=7, group='tier'):
+        """
+        Totals since `days` ago per `group` (one of GROUPS) and overall: answers,
+        tokens, the share of input tokens served from the prompt cache, cost
+        and seconds per answer. Raises ValueError for an unknown group.
+        """
+        if group not in GROUPS:
+            raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+        since = time.time() - days * 86400
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT {GROUPS[group]}, input_tokens, cached_tokens, output_tokens, reasoning_tokens,
+                       search_calls, cost, seconds
+                FROM usage WHERE at >= ? ORDER BY at
+            """, (since,)).fetchall()
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[0] or 'unknown', []).append(row)
+        return {
+            'days': days,
+            'group': group,
+            'groups': {key: _totals(group_rows) for key, group_rows in sorted(groups.items())},
+            'total': _totals(rows)
+        }
+
+
+def _totals(rows):
+    answers = len(rows)
+    input_tokens = sum(row[1] for row in rows)
+    cached_tokens = sum(row[2] for row in rows)
+    costs = [row[6] for row in rows if row[6] is not None]
+    seconds = [row[7] for row in rows if row[7] is not None]
+    return {
+        'answers': answers,
+        'input_tokens': input_tokens,
+        'cached_tokens': cached_tokens,
+        'cached_share': round(cached_tokens / input_tokens, 3) if input_tokens else 0.0,
+        'output_tokens': sum(row[3] for row in rows),
+        'reasoning_tokens': sum(row[4] for row in rows),
+        'search_calls': sum(row[5] for row in rows),
+        'cost_usd': round(sum(costs), 6),
+        'cost_per_answer_usd': round(sum(costs) / len(costs), 6) if costs else None,
+        'median_seconds': round(statistics.median(seconds), 3) if seconds else None,
+        'mean_seconds': round(sum(seconds) / len(seconds), 3) if seconds else None
+    }
@@ -1,9 +1,16 @@
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError, APITimeoutError
 import os
 import sys
+import argparse
+import hashlib
+import inspect
+import json
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from pathlib import Path
-import pandas as pd
 from datetime import datetime
 import time
 
@@ -11,122 +18,266 @@ import time
 project_root = Path(__file__).parent.parent.resolve()
 tests_path = project_root / "storage/data"
 
+pdf_root = project_root / "storage" / "data" / "PDFs"
+# Read by backend/settings.py to find the vector store without editing server.py
+manifest_path = project_root / "storage" / "data" / "vector_store_manifest.json"
+# One manifest per category store when the library is sharded (--shards), also read by settings.py
+shards_path = project_root / "storage" / "data" / "vector_store_shards"
+# Uploads finished by an interrupted run, so the next run carries on from there
+checkpoint_path = project_root / "storage" / "data" / "upload_checkpoint.json"
+
+UPLOAD_WORKERS = 8
+# What goes into the store for each PDF: its text derivative, the PDF itself,
+# or the text derivative with the original PDF uploaded alongside for links
+UPLOAD_FORMATS = ('text', 'pdf', 'both')
+MAX_ATTEMPTS = 6
+MAX_BATCH_FILES = 2000
+
 # Add paths to Python path
 sys.path.append(str(project_root))
 sys.path.append(str(tests_path))
 
 # Import the file_catalog function - use explicit import from Tests directory
 from storage.functions.file_catalog import create_file_catalog
+from storage.functions.catalog_store import CatalogStore
+from storage.functions.pdf_dedup import find_clusters, duplicate_paths, print_report, DEFAULT_THRESHOLD
+from storage.functions.pdf_text import build_derivatives, print_savings
+from cassette import openai_http_client
 
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
 
 def get_catalog_metadata(directory):
     """
-    Generate catalog and return metadata dictionary
+    Update the catalog store and return {filename: metadata}
     """
     try:
-        # Ensure directory is absolute path
-        directory = Path(directory).resolve()
-        
-        # Create catalog using existing function
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_file = f'file_catalog_{timestamp}.xlsx'
-        
-        # Call create_file_catalog with absolute path
-        create_file_catalog(str(directory))
-        
-        # Wait briefly to ensure file is written
-        time.sleep(1)
-        
-        # Look for the generated file in the current working directory
-        catalog_files = list(Path('.').glob(f'file_catalog_*.xlsx'))
-        if not catalog_files:
-            raise FileNotFoundError("No catalog file found")
-            
-        # Use the most recent catalog file
-        latest_catalog = max(catalog_files, key=lambda p: p.stat().st_mtime)
-        print(f"Reading catalog from: {latest_catalog.absolute()}")
-        
-        # Read the generated catalog
-        df = pd.read_excel(latest_catalog)
-        
-        # Convert to dictionary with filename as key
-        metadata_dict = {}
-        for _, row in df.iterrows():
-            metadata_dict[row['Name']] = {
-                'filename': row['Name'],
-                'title': row['Title'],
-                'author': row['Author'],
-                'last_modified': row['Date Modified'],
-                'category': row['Category'],
-                'url': row['Source URL'] if row['Source URL'] != 'No URL found' else None
+        store = create_file_catalog(str(Path(directory).resolve()))
 
+        metadata_dict = {}
+        for record in store.records():
+            metadata_dict[record['name']] = {
+                'filename': record['name'],
+                'title': record['title'],
+                'author': record['author'],
+                # The PDF's own ModDate, the file's mtime changes with every checkout
+                'last_modified': record['pdf_modified'],
+                'category': record['category'],
+                'url': record['source_url'] if record['source_url'] != 'No URL found' else None
             }
-        
+
         return metadata_dict
-        
+
     except Exception as e:
         print(f"Error in get_catalog_metadata: {e}")
         return {}
 
-def process_files(directory, vector_store_id):
+def file_attributes(file_path, metadata):
+    """Vector store attributes for a PDF from its catalog entry"""
+    if not metadata:
+        # Not in the catalog: keep what the path tells us
+        metadata = {
+            'filename': file_path.name,
+            'title': None,
+            'author': None,
+            'category': file_path.parent.name,
+            'url': None,
+            'last_modified': None
+        }
+    return {
+        'filename': metadata['filename'],
+        'title': metadata['title'] if isinstance(metadata['title'], str) else '',
+        'author': metadata['author'] if isinstance(metadata['author'], str) else '',
+        'category': metadata['category'],
+        'url': metadata['url'] if isinstance(metadata['url'], str) else '',
+        'last_modified': metadata['last_modified'] or ''
+    }
+
+def with_original(attributes, original_file_id):
+    """Attributes plus the file ID of the original PDF uploaded alongside a text derivative"""
+    if not original_file_id:
+        return attributes
+    return dict(attributes, original_file_id=original_file_id)
+
+def skip_duplicates(directory, file_paths, threshold=DEFAULT_THRESHOLD):
     """
-    Process files and upload them to OpenAI with metadata
+    Cluster exact and near-duplicate PDFs, record the mapping in the catalog
+    and return {duplicate path: canonical path} for the files not to upload.
     """
-    files_with_metadata = []
-    
-    # Get metadata from catalog
-    catalog_metadata = get_catalog_metadata(directory)
-    
-    for file_path in Path(directory).glob('**/*.pdf'):
+    clusters = find_clusters(file_paths, threshold)
+    print_report(clusters, directory)
+    CatalogStore().record_duplicates(clusters, directory)
+    return duplicate_paths(clusters)
+
+def is_retryable(error):
+    """Rate limits, server errors and dropped connections are worth another try"""
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+def retry_delay(error, attempt):
+    """Honour Retry-After when the API sends one, otherwise exponential backoff with jitter"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
         try:
-            filename = file_path.name
-            # Use catalog metadata if available, fallback to PDF extraction
-            if filename in catalog_metadata:
-                metadata = catalog_metadata[filename]
-            else:
-                metadata = "filename unknown"
-            
-            # Upload file first
-            with open(file_path, 'rb') as file:
-                uploaded_file = client.files.create(
-                    file=file,
-                    purpose="assistants"
-                )
-                
-                # Create vector store file with metadata as attributes
-                vector_file = client.vector_stores.files.create(
-                    vector_store_id=vector_store_id,
-                    file_id=uploaded_file.id,
-                    attributes={
-                        'filename': metadata['filename'],
-                        'title': metadata['title'],
-                        'author': metadata['author'],
-                        'category': metadata['category'],
-                        'url': metadata['url'] if metadata['url'] else '',
-                        'last_modified': str(metadata['last_modified'])
-                    }
-                )
-                
-                files_with_metadata.append((vector_file.id, metadata))
-                print(f"Uploaded and processed {filename}: {vector_file.id}")
-                print(f"Metadata attributes: {vector_file.attributes}")
-                
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(2 ** attempt, 60) * random.uniform(0.5, 1.0)
+
+def with_retries(call, description):
+    """Run `call()`, retrying transient API errors up to MAX_ATTEMPTS times"""
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return call()
         except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            continue
-    
-    return files_with_metadata
+            if attempt == MAX_ATTEMPTS - 1 or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            print(f"Retrying {description} in {delay:.1f}s ({e})")
+            time.sleep(delay)
+
+class UploadCheckpoint:
+    """
+    Uploaded file IDs keyed by relative path, size and mtime, saved after every
+    upload so a crashed run resumes without re-sending finished files.
+    """
+
+    def __init__(self, path=checkpoint_path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {'vector_store_id': None, 'uploads': {}}
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    @staticmethod
+    def key(file_path, directory):
+        stat = file_path.stat()
+        return f"{file_path.relative_to(directory).as_posix()}|{stat.st_size}|{stat.st_mtime}"
+
+    def get(self, key):
+        return self.data['uploads'].get(key)
+
+    def record(self, key, file_id):
+        with self._lock:
+            self.data['uploads'][key] = file_id
+            self.save()
+
+    def save(self):
+        temp_path = self.path.with_suffix('.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if self.path.exists():
+            self.path.unlink()
+
+def upload_files(file_paths, directory, checkpoint, max_workers=UPLOAD_WORKERS, sources=None):
+    """
+    Upload PDFs to OpenAI Files with bounded concurrency. A PDF with an entry
+    in `sources` is uploaded as that file (its text derivative) instead.
+
+    Returns {file_path: file_id} for every file that uploaded (or was already
+    uploaded according to the checkpoint). Failures are reported and skipped.
+    """
+    sources = sources or {}
 
-def create_vector_store():
+    def key(file_path):
+        return UploadCheckpoint.key(file_path, directory) + ('|text' if file_path in sources else '')
+
+    uploaded = {}
+    pending = []
+    for file_path in file_paths:
+        file_id = checkpoint.get(key(file_path))
+        if file_id:
+            uploaded[file_path] = file_id
+        else:
+            pending.append(file_path)
+    if uploaded:
+        print(f"Resuming: {len(uploaded)} files already uploaded")
+
+    def upload(file_path):
+        def create():
+            with open(sources.get(file_path, file_path), 'rb') as file:
+                return client.files.create(file=file, purpose="assistants")
+        uploaded_file = with_retries(create, f"upload of {file_path.name}")
+        checkpoint.record(key(file_path), uploaded_file.id)
+        return uploaded_file.id
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(upload, file_path): file_path for file_path in pending}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            done += 1
+            try:
+                uploaded[file_path] = future.result()
+                print(f"[{done}/{len(pending)}] Uploaded {file_path.name}: {uploaded[file_path]}")
+            except Exception as e:
+                print(f"[{done}/{len(pending)}] Error uploading {file_path}: {e}")
+
+    return uploaded
+
+def upload_documents(file_paths, directory, checkpoint, max_workers=UPLOAD_WORKERS, upload_format='text'):
+    """
+    Upload what the vector store should index for each PDF, see UPLOAD_FORMATS.
+    PDFs without a text layer are uploaded as they are whatever the format.
+
+    Returns ({file_path: file_id}, {file_path: original PDF file_id}).
+    """
+    sources = {}
+    if upload_format != 'pdf' and file_paths:
+        sources = build_derivatives(file_paths)
+        print_savings(file_paths, sources)
+    uploaded = upload_files(file_paths, directory, checkpoint, max_workers, sources)
+
+    originals = {}
+    if upload_format == 'both':
+        derived = [file_path for file_path in file_paths if file_path in sources and file_path in uploaded]
+        originals = upload_files(derived, directory, checkpoint, max_workers)
+    return uploaded, originals
+
+def process_files(directory, vector_store_id, checkpoint=None, max_workers=UPLOAD_WORKERS,
+                  dedup_threshold=DEFAULT_THRESHOLD, upload_format='text'):
+    """
+    Upload every PDF under `directory` and pair it with its catalog attributes.
+    Only the canonical copy of each duplicate cluster is uploaded unless
+    `dedup_threshold` is None.
+
+    Returns [(file_id, attributes)] ready for create_file_batch, which attaches
+    them to the vector store in as few operations as possible.
+    """
+    checkpoint = checkpoint or UploadCheckpoint()
+    checkpoint.data['vector_store_id'] = vector_store_id
+
+    # Get metadata from catalog
+    catalog_metadata = get_catalog_metadata(directory)
+
+    file_paths = sorted(Path(directory).glob('**/*.pdf'))
+    if dedup_threshold is not None:
+        duplicates = skip_duplicates(directory, file_paths, dedup_threshold)
+        file_paths = [file_path for file_path in file_paths if file_path not in duplicates]
+    uploaded, originals = upload_documents(file_paths, directory, checkpoint, max_workers, upload_format)
+
+    # Use catalog metadata if available, fallback to the path
+    return [
+        (uploaded[file_path], with_original(
+            file_attributes(file_path, catalog_metadata.get(file_path.name)), originals.get(file_path)
+        ))
+        for file_path in file_paths if file_path in uploaded
+    ]
+
+def create_vector_store(name="podc_knowledge_base"):
     """Create a new vector store"""
     try:
         response = client.vector_stores.create(
-            name="podc_knowledge_base" + str(datetime.now().strftime('%Y%m%d_%H%M%S'))
+            name=name + str(datetime.now().strftime('%Y%m%d_%H%M%S'))
         )
         print(f"Created vector store with ID: {response.id}")
         return response.id
@@ -134,28 +285,383 @@ def create_vector_store():
         print(f"Error creating vector store: {e}")
         return None
 
+def batches_take_attributes():
+    """Whether the installed SDK's file_batches.create accepts `files` with per-file attributes"""
+    return 'files' in inspect.signature(client.vector_stores.file_batches.create).parameters
+
 def create_file_batch(vector_store_id, files_with_metadata):
     """
-    Create a vector store file batch
+    Attach uploaded files to the vector store, each with its own attributes,
+    in as few file batch operations as possible. Returns the set of file IDs
+    the store finished processing; files that failed or were never attached
+    are left out, so callers only record what is really searchable.
     """
+    if not batches_take_attributes():
+        # openai SDKs without per-file batch attributes: attach concurrently instead
+        return attach_files(vector_store_id, files_with_metadata)
+
+    attached = set()
     try:
-        # Extract file IDs and metadata
-        file_ids = [f[0] for f in files_with_metadata]
-        
-        # Create the file batch
-        batch = client.vector_stores.file_batches.create(
-            vector_store_id=vector_store_id,
-            file_ids=file_ids
-        )
-        return batch
+        for start in range(0, len(files_with_metadata), MAX_BATCH_FILES):
+            chunk = files_with_metadata[start:start + MAX_BATCH_FILES]
+            batch = with_retries(
+                lambda: client.vector_stores.file_batches.create(
+                    vector_store_id=vector_store_id,
+                    files=[{'file_id': file_id, 'attributes': attributes} for file_id, attributes in chunk]
+                ),
+                "file batch creation"
+            )
+            batch = wait_for_batch(vector_store_id, batch)
+            print(f"Batch {batch.id} ended with status: {batch.status}")
+            attached |= completed_batch_files(vector_store_id, batch)
+        return attached
     except Exception as e:
         print(f"Error creating file batch: {e}")
-        return None
+        return attached
+
+def completed_batch_files(vector_store_id, batch):
+    """IDs of the files in a finished batch that the store processed successfully"""
+    return {
+        file.id for file in client.vector_stores.file_batches.list_files(
+            batch.id, vector_store_id=vector_store_id, filter="completed", limit=100
+        )
+    }
+
+def attach_files(vector_store_id, files_with_metadata, max_workers=UPLOAD_WORKERS):
+    """
+    Attach files one request each, used when batches cannot carry attributes.
+    Returns the IDs of the files that finished processing.
+    """
+    def attach(file_id, attributes):
+        file = with_retries(
+            lambda: client.vector_stores.files.create(
+                vector_store_id=vector_store_id,
+                file_id=file_id,
+                attributes=attributes
+            ),
+            f"attach of {file_id}"
+        )
+        while file.status == "in_progress":
+            time.sleep(5)
+            file = client.vector_stores.files.retrieve(file_id, vector_store_id=vector_store_id)
+        return file
+
+    attached = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(attach, file_id, attributes) for file_id, attributes in files_with_metadata]
+        for future in as_completed(futures):
+            try:
+                file = future.result()
+            except Exception as e:
+                print(f"Error attaching file: {e}")
+                continue
+            if file.status == "completed":
+                attached.add(file.id)
+            else:
+                print(f"Attaching {file.id} ended with status: {file.status}")
+    print(f"Attached {len(attached)} of {len(files_with_metadata)} files individually")
+    return attached
+
+def wait_for_batch(vector_store_id, batch):
+    """Poll a file batch until it leaves in_progress"""
+    while batch.status == "in_progress":
+        # Wait a bit before checking again
+        time.sleep(5)
+        # Get updated status
+        batch = client.vector_stores.file_batches.retrieve(
+            batch.id,
+            vector_store_id=vector_store_id
+        )
+        print(f"Batch status: {batch.status}")
+        print(f"File counts: {batch.file_counts}")
+    return batch
+
+def load_manifest(path=manifest_path):
+    """Local record of what is in the vector store: relative path -> hash, file_id, attributes"""
+    if path.exists():
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {'vector_store_id': None, 'files': {}}
+
+def save_manifest(manifest, path=manifest_path):
+    """Write the manifest atomically so an interrupted sync never leaves it half written"""
+    manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.json.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def plan_sync(directory, manifest, catalog_metadata, skip=(), upload_format='text', file_paths=None):
+    """
+    Compare the PDFs on disk (all of them under `directory`, or `file_paths`) with the manifest.
+
+    Returns (upload, update, remove): files that are new, whose content changed
+    or that were uploaded in another format, files whose catalog attributes
+    changed, and manifest entries whose PDF no longer exists or is in `skip`
+    (duplicates of another file). Files with an unchanged size and mtime are
+    not re-hashed.
+    """
+    upload, update = [], []
+    seen = set()
+
+    if file_paths is None:
+        file_paths = sorted(Path(directory).glob('**/*.pdf'))
+    for file_path in file_paths:
+        if file_path in skip:
+            continue
+        relative = file_path.relative_to(directory).as_posix()
+        seen.add(relative)
+        stat = file_path.stat()
+        entry = manifest['files'].get(relative)
+
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            sha256 = entry['sha256']
+        else:
+            sha256 = file_sha256(file_path)
+
+        local = {
+            'path': file_path,
+            'relative': relative,
+            'sha256': sha256,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'attributes': file_attributes(file_path, catalog_metadata.get(file_path.name))
+        }
+        if entry is None or entry['sha256'] != sha256 or entry.get('format', 'pdf') != upload_format:
+            upload.append(local)
+            continue
+        local['attributes'] = with_original(local['attributes'], entry.get('original_file_id'))
+        if entry['attributes'] != local['attributes']:
+            update.append(local)
+        elif entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            # Touched but identical, remember the new stat so it is not hashed again
+            entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime
+
+    remove = [relative for relative in manifest['files'] if relative not in seen]
+    return upload, update, remove
+
+def remove_vector_file(vector_store_id, file_id):
+    """Detach a file from the vector store and delete the underlying upload"""
+    try:
+        client.vector_stores.files.delete(file_id, vector_store_id=vector_store_id)
+    except Exception as e:
+        print(f"Error detaching {file_id}: {e}")
+    try:
+        client.files.delete(file_id)
+    except Exception as e:
+        print(f"Error deleting {file_id}: {e}")
+
+def remove_manifest_entry(vector_store_id, entry):
+    """Remove a manifest entry's file from the store, and the original PDF uploaded with it if any"""
+    remove_vector_file(vector_store_id, entry['file_id'])
+    if entry.get('original_file_id'):
+        try:
+            client.files.delete(entry['original_file_id'])
+        except Exception as e:
+            print(f"Error deleting {entry['original_file_id']}: {e}")
+
+def sync_vector_store(directory, vector_store_id=None, dry_run=False, max_workers=UPLOAD_WORKERS,
+                      dedup_threshold=DEFAULT_THRESHOLD, upload_format='text', shard=None):
+    """
+    Bring a vector store in line with the PDFs under `directory`.
+
+    Only new or changed PDFs are uploaded, removed PDFs (and PDFs that turned
+    out to duplicate another) are detached and deleted, and catalog-only
+    changes are applied as attribute updates in place.
+    Uploads are checkpointed and the manifest is saved after every other change,
+    so an interrupted run resumes.
+
+    `shard` restricts the sync to one category's store: {'category',
+    'file_paths', 'manifest_path', 'catalog_metadata', 'duplicates'}, see sync_shards.
+    """
+    path = shard['manifest_path'] if shard else manifest_path
+    manifest = load_manifest(path)
+    vector_store_id = vector_store_id or manifest['vector_store_id']
+    if manifest['vector_store_id'] != vector_store_id:
+        # The manifest describes another store, start from an empty record
+        manifest = {'vector_store_id': vector_store_id, 'files': {}}
+    if shard:
+        manifest['category'] = shard['category']
+        catalog_metadata, duplicates = shard['catalog_metadata'], shard['duplicates']
+    else:
+        catalog_metadata = get_catalog_metadata(directory)
+        duplicates = {}
+        if dedup_threshold is not None:
+            duplicates = skip_duplicates(directory, sorted(Path(directory).glob('**/*.pdf')), dedup_threshold)
+    upload, update, remove = plan_sync(
+        directory, manifest, catalog_metadata, duplicates, upload_format, shard['file_paths'] if shard else None
+    )
+    print(f"Sync plan: {len(upload)} to upload, {len(update)} attribute updates, {len(remove)} to remove")
+
+    if dry_run:
+        for local in upload:
+            print(f"  upload  {local['relative']}")
+        for local in update:
+            print(f"  update  {local['relative']}")
+        for relative in remove:
+            print(f"  remove  {relative}")
+        return manifest
+
+    if vector_store_id is None:
+        vector_store_id = create_vector_store(f"podc_{shard_slug(shard['category'])}_" if shard else "podc_knowledge_base")
+        if not vector_store_id:
+            print("Failed to create vector store")
+            return manifest
+    manifest['vector_store_id'] = vector_store_id
+
+    checkpoint = UploadCheckpoint()
+    uploaded, originals = upload_documents(
+        [local['path'] for local in upload], directory, checkpoint, max_workers, upload_format
+    )
+    attached = [local for local in upload if local['path'] in uploaded]
+    for local in attached:
+        local['attributes'] = with_original(local['attributes'], originals.get(local['path']))
+    completed = set()
+    if attached:
+        completed = create_file_batch(
+            vector_store_id,
+            [(uploaded[local['path']], local['attributes']) for local in attached]
+        )
+
+    # Only files the store processed replace their previous version; the rest
+    # keep their old manifest entry (if any) and are retried by the next sync
+    pending = [local for local in attached if uploaded[local['path']] not in completed]
+    for local in attached:
+        if local in pending:
+            print(f"Not attached, will retry on the next sync: {local['relative']}")
+            continue
+        previous = manifest['files'].get(local['relative'])
+        if previous:
+            remove_manifest_entry(vector_store_id, previous)
+        manifest['files'][local['relative']] = {
+            'sha256': local['sha256'],
+            'size': local['size'],
+            'mtime': local['mtime'],
+            'format': upload_format,
+            'file_id': uploaded[local['path']],
+            'original_file_id': originals.get(local['path']),
+            'attributes': local['attributes']
+        }
+    save_manifest(manifest, path)
+    if not pending:
+        checkpoint.clear()
+
+    for local in update:
+        entry = manifest['files'][local['relative']]
+        try:
+            client.vector_stores.files.update(
+                entry['file_id'],
+                vector_store_id=vector_store_id,
+                attributes=local['attributes']
+            )
+        except Exception as e:
+            print(f"Error updating attributes of {local['relative']}: {e}")
+            continue
+        entry.update(attributes=local['attributes'], size=local['size'], mtime=local['mtime'])
+        save_manifest(manifest, path)
+        print(f"Updated attributes of {local['relative']}")
+
+    for relative in remove:
+        remove_manifest_entry(vector_store_id, manifest['files'][relative])
+        del manifest['files'][relative]
+        save_manifest(manifest, path)
+        print(f"Removed {relative}")
+
+    save_manifest(manifest, path)
+    if pending:
+        print(f"Vector store {vector_store_id}: {len(manifest['files'])} files, {len(pending)} not attached, rerun --sync")
+    else:
+        print(f"Vector store {vector_store_id} is in sync: {len(manifest['files'])} files")
+    return manifest
+
+def shard_slug(category):
+    return re.sub(r'[^a-z0-9]+', '_', category.lower()).strip('_') or 'uncategorised'
+
+def shard_manifest_path(category):
+    return shards_path / f"{shard_slug(category)}.json"
+
+def sync_shards(directory, dry_run=False, max_workers=UPLOAD_WORKERS, dedup_threshold=DEFAULT_THRESHOLD,
+                upload_format='text'):
+    """
+    Keep one vector store per category under `directory`, each synced
+    like sync_vector_store with its own manifest in storage/data/vector_store_shards.
+    The catalog and duplicate detection run once for the whole library, so a
+    PDF duplicated across categories is only uploaded to its canonical file's
+    store. Stores of categories whose folder is gone are emptied and deleted.
+    Returns {category: vector store ID}.
+    """
+    file_paths = sorted(Path(directory).glob('**/*.pdf'))
+    catalog_metadata = get_catalog_metadata(directory)
+    duplicates = {}
+    if dedup_threshold is not None:
+        duplicates = skip_duplicates(directory, file_paths, dedup_threshold)
+
+    # Sharded on the same `category` attribute that /chat filters on
+    by_category = {}
+    for file_path in file_paths:
+        category = file_attributes(file_path, catalog_metadata.get(file_path.name))['category']
+        by_category.setdefault(category, []).append(file_path)
+
+    existing = {}
+    for path in sorted(shards_path.glob('*.json')):
+        with open(path, encoding='utf-8') as f:
+            existing[json.load(f).get('category')] = path
+
+    shards = {}
+    for category in sorted(set(by_category) | set(existing)):
+        print(f"\n== {category} ==")
+        paths = by_category.get(category, [])
+        manifest = sync_vector_store(directory, dry_run=dry_run, max_workers=max_workers, upload_format=upload_format, shard={
+            'category': category,
+            'file_paths': paths,
+            'manifest_path': existing.get(category, shard_manifest_path(category)),
+            'catalog_metadata': catalog_metadata,
+            'duplicates': duplicates
+        })
+        if paths or dry_run:
+            if manifest['vector_store_id']:
+                shards[category] = manifest['vector_store_id']
+            continue
+        # The category folder is gone and sync_vector_store removed its files
+        if manifest['vector_store_id'] and not manifest['files']:
+            try:
+                client.vector_stores.delete(manifest['vector_store_id'])
+                existing[category].unlink()
+                print(f"Deleted the store of {category}")
+            except Exception as e:
+                print(f"Error deleting the store of {category}: {e}")
+
+    print(f"\n{len(shards)} category stores: " + ", ".join(f"{category} ({store_id})" for category, store_id in shards.items()))
+    return shards
 
 def main():
+    parser = argparse.ArgumentParser(description="Upload the PDF library to an OpenAI vector store")
+    parser.add_argument('--sync', action='store_true',
+                        help="Incrementally sync the store recorded in the manifest instead of creating a new one")
+    parser.add_argument('--vector-store-id', help="Vector store to sync (defaults to the one in the manifest)")
+    parser.add_argument('--dry-run', action='store_true', help="With --sync, only print what would change")
+    parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS, help="Concurrent uploads")
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help="Upload every PDF, including exact and near-duplicates of another")
+    parser.add_argument('--similarity', type=float, default=DEFAULT_THRESHOLD,
+                        help="Estimated text similarity (0-1) at which two PDFs count as duplicates")
+    parser.add_argument('--upload', choices=UPLOAD_FORMATS, default='text',
+                        help="Upload text derivatives (default), the PDFs, or both with the PDF kept for links")
+    parser.add_argument('--shards', action='store_true',
+                        help="Sync one vector store per category folder instead of a single store (implies --sync)")
+    args = parser.parse_args()
+    dedup_threshold = None if args.keep_duplicates else args.similarity
+
     # Use absolute path for base directory
-    base_dir = Path(project_root) / "storage" / "data" / "PDFs" / "files"
-    base_dir = base_dir.resolve()
+    base_dir = pdf_root.resolve()
 
     # Directory validation
     if not base_dir.exists():
@@ -163,49 +669,43 @@ def main():
         return
     
     print(f"Processing files in: {base_dir}")
-    
-    # First create a vector store
-    vector_store_id = create_vector_store()
+
+    if args.shards:
+        sync_shards(base_dir, dry_run=args.dry_run, max_workers=args.workers,
+                    dedup_threshold=dedup_threshold, upload_format=args.upload)
+        return
+
+    if args.sync:
+        sync_vector_store(base_dir, args.vector_store_id, dry_run=args.dry_run, max_workers=args.workers,
+                          dedup_threshold=dedup_threshold, upload_format=args.upload)
+        return
+
+    # Carry on with the store of an interrupted run, otherwise create a new one
+    checkpoint = UploadCheckpoint()
+    vector_store_id = checkpoint.data['vector_store_id']
+    if vector_store_id:
+        print(f"Resuming upload into vector store {vector_store_id}")
+    else:
+        vector_store_id = create_vector_store()
     if not vector_store_id:
         print("Failed to create vector store")
         return
     
     # Process and upload files
-    files_with_metadata = process_files(base_dir, vector_store_id)
+    files_with_metadata = process_files(base_dir, vector_store_id, checkpoint, args.workers, dedup_threshold, args.upload)
     
     if not files_with_metadata:
         print("No files were processed successfully")
         return
     
-    # Create file batch in the vector store
-    batch = create_file_batch(vector_store_id, files_with_metadata)
-    
-    if batch:
-        print(f"Successfully created file batch: {batch.id}")
-        print(f"Status: {batch.status}")
-        
-        # Monitor the batch status
-        try:
-            while batch.status == "in_progress":
-                # Wait a bit before checking again
-                time.sleep(5)
-                # Get updated status
-                batch = client.vector_stores.file_batches.retrieve(
-                    vector_store_id=vector_store_id,
-                    batch_id=batch.id
-                )
-                print(f"Batch status: {batch.status}")
-                print(f"File counts: {batch.file_counts}")
-                
-            if batch.status == "completed":
-                print("Successfully processed all files")
-            else:
-                print(f"Batch processing ended with status: {batch.status}")
-                
-        except Exception as e:
-            print(f"Error monitoring batch status: {e}")
+    # Attach everything to the vector store in as few batches as possible
+    attached = create_file_batch(vector_store_id, files_with_metadata)
+    if len(attached) == len(files_with_metadata):
+        checkpoint.clear()
+        print(f"Successfully processed all {len(attached)} files")
     else:
-        print("Failed to create file batch")
+        # The checkpoint keeps the uploads, so a rerun only attaches again
+        print(f"Processed {len(attached)} of {len(files_with_metadata)} files; rerun to retry the rest")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
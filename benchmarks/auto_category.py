@@ -0,0 +1,82 @@
+"""
+Labelled check of AUTO_CATEGORY: which questions get narrowed, to what, and whether that is right.
+
+    python benchmarks/auto_category.py
+    python benchmarks/auto_category.py --coverage 0.99 --max-categories 2
+
+The classifier is trained on the catalog (storage/data/catalog.sqlite3, see
+storage/functions/file_catalog.py) with the attributes the vector store
+holds. Questions come from benchmarks/golden/auto_category.json: an `id`, a
+`message` and the `expected` categories whose documents answer it. Each one is
+reported as
+
+    all      not narrowed, every category is searched
+    ok       narrowed, and every expected category is still searched
+    partial  narrowed, some expected categories are dropped
+    wrong    narrowed, none of the expected categories are searched
+
+A question with no `expected` categories should not be narrowed at all. Exits
+non-zero on any `partial` or `wrong` answer, since a wrong filter silently
+drops the documents that would answer the question.
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+DEFAULT_QUESTIONS = Path(__file__).resolve().parent / "golden" / "auto_category.json"
+
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "backend"))
+
+from storage.functions.catalog_store import CatalogStore, vector_store_attributes  # noqa: E402
+from category_classifier import CategoryClassifier  # noqa: E402
+
+
+def verdict(selected, expected):
+    if not selected:
+        return "all"
+    kept = [category for category in expected if category in selected]
+    if not expected or not kept:
+        return "wrong"
+    return "ok" if len(kept) == len(expected) else "partial"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check which questions AUTO_CATEGORY narrows, and how")
+    parser.add_argument("--questions", type=Path, default=DEFAULT_QUESTIONS)
+    parser.add_argument("--catalog", type=Path, help="Catalog database (default: storage/data/catalog.sqlite3)")
+    parser.add_argument("--coverage", type=float, default=0.95, help="Posterior mass the selected categories must hold")
+    parser.add_argument("--max-categories", type=int, default=3)
+    args = parser.parse_args()
+
+    store = CatalogStore(args.catalog) if args.catalog else CatalogStore()
+    documents = [vector_store_attributes(record) for record in store.records()]
+    if not documents:
+        sys.exit(f"The catalog {store.path} is empty, run storage/functions/file_catalog.py first")
+    classifier = CategoryClassifier(documents, coverage=args.coverage, max_categories=args.max_categories)
+    questions = json.loads(args.questions.read_text(encoding="utf-8"))
+
+    counts = {}
+    for question in questions:
+        scores = classifier.scores(question['message'])
+        selected = classifier.select(question['message'])
+        result = verdict(selected, question.get('expected') or [])
+        counts[result] = counts.get(result, 0) + 1
+        ranked = sorted(scores, key=scores.get, reverse=True)[:3]
+        print(f"{result:8} {question['id']}: {question['message']}")
+        print(f"         searched: {', '.join(selected) if selected else 'every category'}")
+        if ranked:
+            print("         scores:   " + ", ".join(f"{category} {scores[category]:.2f}" for category in ranked))
+        if result in ("partial", "wrong"):
+            print(f"         expected: {', '.join(question.get('expected') or []) or 'no narrowing'}")
+
+    print(os.linesep + "  ".join(f"{name}={counts.get(name, 0)}" for name in ("all", "ok", "partial", "wrong")))
+    if counts.get("partial") or counts.get("wrong"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
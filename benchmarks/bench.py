@@ -0,0 +1,151 @@
+"""
+Start the mock upstream and the backend under gunicorn, run load profiles
+against them and stop everything again. No real OpenAI or Supabase calls are made.
+
+    python benchmarks/bench.py --profiles chat-stream,flag --workers 4 --concurrency 32
+    python benchmarks/bench.py --async --profiles chat-stream --concurrency 200
+    python benchmarks/bench.py --profiles mixed --json results/threads.json
+
+The gunicorn settings come from backend/gunicorn.conf.py; --workers,
+--threads and --async override them for comparisons.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+import load
+
+project_root = Path(__file__).resolve().parent.parent
+backend_dir = project_root / "backend"
+benchmarks_dir = Path(__file__).resolve().parent
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def stop(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend against local mock upstreams")
+    parser.add_argument('--profiles', default='chat,chat-stream,chat-cached,flag,flags',
+                        help=f"Comma separated, from: {', '.join(sorted(load.PROFILES))}")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help="Seconds per profile")
+    parser.add_argument('--workers', type=int, help="Override gunicorn workers")
+    parser.add_argument('--threads', type=int, help="Override gunicorn threads (sync server)")
+    parser.add_argument('--async', dest='async_server', action='store_true', help="Serve async_server:app with uvicorn workers")
+    parser.add_argument('--port', type=int, default=18000, help="Backend port; the mock uses port + 1")
+    parser.add_argument('--latency', type=float, default=0.8, help="Mock model latency in seconds")
+    parser.add_argument('--tokens', type=int, default=60, help="Mock output deltas per reply")
+    parser.add_argument('--token-interval', type=float, default=0.01)
+    parser.add_argument('--supabase-latency', type=float, default=0.02)
+    parser.add_argument('--upstream-rpm', type=float, default=0, help="Mock OpenAI answers 429 above this many requests/minute (0: never)")
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help="Extra backend environment, e.g. ANSWER_CACHE_SIZE=0 (repeatable)")
+    parser.add_argument('--json', help="Write every profile's report to this file")
+    args = parser.parse_args()
+
+    profiles = [profile.strip() for profile in args.profiles.split(',') if profile.strip()]
+    unknown = [profile for profile in profiles if profile not in load.PROFILES]
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(unknown)}")
+
+    mock_port = args.port + 1
+    state_dir = tempfile.mkdtemp(prefix="podc-bench-")
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-benchmark",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        SUPABASE_URL=f"http://127.0.0.1:{mock_port}",
+        SUPABASE_API_KEY="benchmark",
+        VECTOR_STORE_IDS="vs_mock",
+        PODC_STATE_DIR=state_dir,
+        LOG_LEVEL="WARNING",
+        # Every virtual user shares one address, the per-client /chat limit would throttle them all
+        CHAT_RATE_PER_MINUTE="0"
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    if args.async_server:
+        env["PODC_ASYNC"] = "1"
+    else:
+        env.pop("PODC_ASYNC", None)
+    for assignment in args.env:
+        name, _, value = assignment.partition('=')
+        env[name] = value
+
+    mock = subprocess.Popen([
+        sys.executable, str(benchmarks_dir / "mock_upstream.py"),
+        '--port', str(mock_port),
+        '--latency', str(args.latency),
+        '--tokens', str(args.tokens),
+        '--token-interval', str(args.token_interval),
+        '--supabase-latency', str(args.supabase_latency),
+        '--rpm', str(args.upstream_rpm)
+    ])
+    gunicorn_args = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f"127.0.0.1:{args.port}"]
+    if args.workers:
+        gunicorn_args += ['--workers', str(args.workers)]
+    if args.threads:
+        gunicorn_args += ['--threads', str(args.threads)]
+    if not args.async_server:
+        gunicorn_args.append('server:app')
+    backend = None
+
+    reports = {}
+    try:
+        wait_until_up(f"http://127.0.0.1:{mock_port}/v1/vector_stores/vs_mock/files", mock)
+        backend = subprocess.Popen(gunicorn_args, cwd=backend_dir, env=env)
+        target = f"http://127.0.0.1:{args.port}"
+        wait_until_up(f"{target}/readyz", backend)
+
+        server = "async_server (uvicorn workers)" if args.async_server else "server (gthread workers)"
+        print(f"Backend: {server}, mock latency {args.latency}s, {args.tokens} deltas, concurrency {args.concurrency}")
+        for profile in profiles:
+            print(f"\n== {profile} ==")
+            report = asyncio.run(load.run(target, profile, args.concurrency, args.duration))
+            report.update(profile=profile, concurrency=args.concurrency)
+            load.print_report(report)
+            reports[profile] = report
+    finally:
+        if backend is not None:
+            stop(backend)
+        stop(mock)
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump({'settings': vars(args), 'reports': reports}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
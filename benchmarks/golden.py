@@ -0,0 +1,167 @@
+"""
+Golden questions: /chat answers and latency checked offline against a recording.
+
+    python benchmarks/golden.py record      # real OpenAI/Supabase calls, saves the cassette and expected answers
+    python benchmarks/golden.py check       # replays the cassette with no network, fails on drift
+    python benchmarks/golden.py check --repeat 20 --max-p95-ms 50
+
+Questions are read from benchmarks/golden/questions.json: objects with an `id`,
+a `message` and any other /chat fields (category, author, ...). Each one is
+posted to server.py through Flask's test client with a throwaway state
+directory, and the answer cache and rate limits off, so every question runs
+the whole pipeline. `record` writes golden/cassette.jsonl (see
+backend/cassette.py) and golden/expected.json; commit both.
+
+`check` answers from the cassette at memory speed, so the latencies it reports
+are the backend's own overhead. It fails when a question's OpenAI request no
+longer matches the recording (the instructions, model or search options
+changed: re-record), when an answer or its citations drift from the expected
+ones, or when the p95 latency is over --max-p95-ms.
+"""
+import argparse
+import difflib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+backend_dir = project_root / "backend"
+golden_dir = Path(__file__).resolve().parent / "golden"
+
+DEFAULT_QUESTIONS = golden_dir / "questions.json"
+DEFAULT_CASSETTE = golden_dir / "cassette.jsonl"
+DEFAULT_EXPECTED = golden_dir / "expected.json"
+
+
+def load_backend(mode, cassette):
+    """Import server.py with the cassette active; must run before anything imports the backend"""
+    os.environ.update(
+        PODC_CASSETTE=str(cassette),
+        PODC_CASSETTE_MODE=mode,
+        PODC_STATE_DIR=tempfile.mkdtemp(prefix="podc-golden-"),
+        ANSWER_CACHE_SIZE="0",
+        CHAT_RATE_PER_MINUTE="0",
+        OPENAI_RPM="0",
+        OPENAI_TPM="0",
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING")
+    )
+    if mode == "replay":
+        # Nothing is sent, but settings.py insists on a key
+        os.environ.setdefault("OPENAI_API_KEY", "sk-replay")
+    sys.path.insert(0, str(backend_dir))
+    import server
+    import chat_pipeline
+    # What gunicorn's preload does, so the first question sees the same index as every later one
+    chat_pipeline.citation_index.refresh()
+    chat_pipeline.category_classifier()
+    return server.app.test_client()
+
+
+def ask(client, question):
+    """(answer, milliseconds) for one golden question"""
+    body = {name: value for name, value in question.items() if name != 'id'}
+    started = time.perf_counter()
+    response = client.post('/chat', json=body)
+    elapsed = (time.perf_counter() - started) * 1000
+    data = response.get_json(silent=True) or {}
+    answer = {
+        'status': response.status_code,
+        'response': data.get('response'),
+        'citations': sorted({citation.get('filename') or '' for citation in data.get('citations') or []})
+    }
+    return answer, elapsed
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, a or "", b or "").ratio()
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def record(client, questions, expected_path):
+    expected = {}
+    for question in questions:
+        answer, elapsed = ask(client, question)
+        expected[question['id']] = answer
+        print(f"{question['id']:<28} {answer['status']} {elapsed:8.1f} ms  {len(answer['citations'])} citations")
+        if answer['status'] != 200:
+            print(f"  {answer['response']}")
+    with open(expected_path, 'w', encoding='utf-8') as f:
+        json.dump(expected, f, indent=2, ensure_ascii=False)
+    failed = sum(answer['status'] != 200 for answer in expected.values())
+    print(f"Recorded {len(expected)} questions to {expected_path}" + (f", {failed} failed" if failed else ""))
+    return failed == 0
+
+
+def check(client, questions, expected_path, repeat, min_similarity, max_p95_ms):
+    with open(expected_path, encoding='utf-8') as f:
+        expected = json.load(f)
+
+    # The first request also pays for lazy imports, keep it out of the timings
+    ask(client, questions[0])
+
+    latencies = []
+    drifted = []
+    for question in questions:
+        want = expected.get(question['id'])
+        timings = []
+        for _ in range(repeat):
+            answer, elapsed = ask(client, question)
+            timings.append(elapsed)
+        latencies.extend(timings)
+
+        if want is None:
+            problem = "no expected answer, re-record"
+        elif answer['status'] != 200:
+            problem = f"status {answer['status']}: {answer['response']}"
+        else:
+            score = similarity(answer['response'], want['response'])
+            problem = None
+            if score < min_similarity:
+                problem = f"answer similarity {score:.3f}"
+            elif answer['citations'] != want['citations']:
+                problem = f"citations {answer['citations']} != {want['citations']}"
+        if problem:
+            drifted.append(question['id'])
+        print(f"{question['id']:<28} p50 {statistics.median(timings):7.2f} ms  {problem or 'ok'}")
+
+    p50, p95 = statistics.median(latencies), percentile(latencies, 0.95)
+    print(f"{len(questions)} questions x {repeat}: p50 {p50:.2f} ms, p95 {p95:.2f} ms, {len(drifted)} drifted")
+    ok = not drifted
+    if max_p95_ms is not None and p95 > max_p95_ms:
+        print(f"p95 {p95:.2f} ms is over the {max_p95_ms} ms budget")
+        ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or check the golden /chat questions")
+    parser.add_argument('mode', choices=['record', 'check'])
+    parser.add_argument('--questions', default=str(DEFAULT_QUESTIONS))
+    parser.add_argument('--cassette', default=str(DEFAULT_CASSETTE))
+    parser.add_argument('--expected', default=str(DEFAULT_EXPECTED))
+    parser.add_argument('--repeat', type=int, default=1, help="Times each question is asked in check mode, for steadier timings")
+    parser.add_argument('--min-similarity', type=float, default=1.0, help="Smallest answer similarity (difflib ratio) that is not drift")
+    parser.add_argument('--max-p95-ms', type=float, help="Fail the check when the p95 latency is higher")
+    args = parser.parse_args()
+
+    with open(args.questions, encoding='utf-8') as f:
+        questions = json.load(f)
+
+    client = load_backend("record" if args.mode == "record" else "replay", args.cassette)
+    if args.mode == "record":
+        ok = record(client, questions, args.expected)
+    else:
+        ok = check(client, questions, args.expected, max(1, args.repeat), args.min_similarity, args.max_p95_ms)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Scripted load against a running backend, reporting p50/p95/p99 and requests/sec.
+
+    python benchmarks/load.py --target http://127.0.0.1:10000 --profile mixed --concurrency 32 --duration 30
+
+Profiles:
+- chat         — POST /chat, a new question each time (answer cache misses)
+- chat-cached  — POST /chat, a handful of repeated questions (cache hits)
+- chat-stream  — POST /chat as SSE; also reports time to the first delta
+- followup     — a session of three /chat turns per virtual user
+- flag         — POST /flag
+- flags        — GET /flags, first page then one page further via the cursor
+- mixed        — 70% chat-stream, 10% chat-cached, 10% flag, 10% flags
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import httpx
+
+QUESTIONS = [
+    "What is the NDIS?",
+    "How do I apply for early intervention support?",
+    "What hearing services are available for children?",
+    "Where can my child learn Auslan?",
+    "What adjustments can a school make for a deaf student?"
+]
+
+counter = itertools.count()
+
+
+class Results:
+    def __init__(self):
+        self.samples = {}  # operation -> list of (seconds, ok)
+        self.first_bytes = {}
+        self.statuses = {}  # operation -> {status: count}
+
+    def add(self, operation, seconds, ok, first_byte=None, status=None):
+        self.samples.setdefault(operation, []).append((seconds, ok))
+        if status is not None:
+            counts = self.statuses.setdefault(operation, {})
+            counts[status] = counts.get(status, 0) + 1
+        if first_byte is not None:
+            self.first_bytes.setdefault(operation, []).append(first_byte)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def chat(client, results, question=None, operation='chat', session_id=None):
+    question = question or f"{random.choice(QUESTIONS)} (variant {next(counter)})"
+    start = time.perf_counter()
+    response = await client.post('/chat', json={'message': question, 'session_id': session_id})
+    ok = response.status_code == 200
+    results.add(operation, time.perf_counter() - start, ok, status=response.status_code)
+    return response.json().get('session_id') if ok else None
+
+
+async def chat_cached(client, results):
+    await chat(client, results, random.choice(QUESTIONS), 'chat-cached')
+
+
+async def chat_stream(client, results):
+    question = f"{random.choice(QUESTIONS)} (variant {next(counter)})"
+    start = time.perf_counter()
+    first_delta = None
+    ok = False
+    async with client.stream('POST', '/chat', json={'message': question, 'stream': True}) as response:
+        status = response.status_code
+        async for line in response.aiter_lines():
+            if line.startswith('event: delta') and first_delta is None:
+                first_delta = time.perf_counter() - start
+            elif line.startswith('event: done'):
+                ok = status == 200
+            elif line.startswith('event: error'):
+                ok, status = False, 'sse-error'
+    results.add('chat-stream', time.perf_counter() - start, ok, first_delta, status)
+
+
+async def followup(client, results):
+    session_id = None
+    for turn, question in enumerate(random.sample(QUESTIONS, 3)):
+        session_id = await chat(client, results, f"{question} (variant {next(counter)})", f'followup-turn{turn + 1}', session_id)
+
+
+async def flag(client, results):
+    start = time.perf_counter()
+    response = await client.post('/flag', json={
+        'flaggedText': 'Benchmark flag',
+        'userPrompt': random.choice(QUESTIONS),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    })
+    results.add('flag', time.perf_counter() - start, response.status_code == 202, status=response.status_code)
+
+
+async def flags(client, results):
+    start = time.perf_counter()
+    response = await client.get('/flags', params={'limit': 50})
+    results.add('flags', time.perf_counter() - start, response.status_code == 200)
+    cursor = response.headers.get('X-Next-Cursor')
+    if cursor:
+        start = time.perf_counter()
+        response = await client.get('/flags', params={'limit': 50, 'cursor': cursor})
+        results.add('flags-page2', time.perf_counter() - start, response.status_code == 200)
+
+
+PROFILES = {
+    'chat': [(1, chat)],
+    'chat-cached': [(1, chat_cached)],
+    'chat-stream': [(1, chat_stream)],
+    'followup': [(1, followup)],
+    'flag': [(1, flag)],
+    'flags': [(1, flags)],
+    'mixed': [(7, chat_stream), (1, chat_cached), (1, flag), (1, flags)]
+}
+
+
+async def virtual_user(client, results, profile, deadline, remaining):
+    operations, weights = zip(*[(operation, weight) for weight, operation in PROFILES[profile]])
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        operation = random.choices(operations, weights)[0]
+        try:
+            await operation(client, results)
+        except httpx.HTTPError:
+            results.add(operation.__name__.replace('_', '-'), 0.0, False)
+
+
+async def run(target, profile, concurrency, duration, requests=None, timeout=120):
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=target, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        remaining = [requests] if requests else None
+        await asyncio.gather(*[virtual_user(client, results, profile, deadline, remaining) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    return summarize(results, elapsed)
+
+
+def summarize(results, elapsed):
+    report = {'elapsed_s': round(elapsed, 2), 'operations': {}}
+    for operation, samples in sorted(results.samples.items()):
+        latencies = sorted(seconds for seconds, ok in samples if ok)
+        entry = {
+            'requests': len(samples),
+            'errors': sum(1 for _, ok in samples if not ok),
+            'rps': round(len(samples) / elapsed, 2),
+            'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None
+        }
+        if latencies:
+            entry.update({
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+                'max_ms': round(latencies[-1] * 1000, 1)
+            })
+        entry['statuses'] = {str(status): count for status, count in sorted(results.statuses.get(operation, {}).items(), key=str)}
+        first_bytes = sorted(results.first_bytes.get(operation, []))
+        if first_bytes:
+            entry['first_delta_p50_ms'] = round(percentile(first_bytes, 0.50) * 1000, 1)
+            entry['first_delta_p95_ms'] = round(percentile(first_bytes, 0.95) * 1000, 1)
+        report['operations'][operation] = entry
+    return report
+
+
+def print_report(report):
+    columns = ('requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+    print(f"{'operation':<16}" + ''.join(f"{column:>10}" for column in columns))
+    for operation, entry in report['operations'].items():
+        print(f"{operation:<16}" + ''.join(f"{'-' if entry[column] is None else entry[column]:>10}" for column in columns))
+        if entry['errors'] and entry.get('statuses'):
+            print(f"{'':<16}responses: " + ', '.join(f"{status} x{count}" for status, count in entry['statuses'].items()))
+        if 'first_delta_p50_ms' in entry:
+            print(f"{'':<16}time to first delta: p50 {entry['first_delta_p50_ms']} ms, p95 {entry['first_delta_p95_ms']} ms")
+    print(f"elapsed {report['elapsed_s']} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the PODC backend")
+    parser.add_argument('--target', default='http://127.0.0.1:10000')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=16, help="Virtual users sending requests back to back")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run")
+    parser.add_argument('--requests', type=int, help="Stop after this many operations instead")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.target, args.profile, args.concurrency, args.duration, args.requests))
+    report.update(profile=args.profile, concurrency=args.concurrency)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
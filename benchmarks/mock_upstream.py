@@ -0,0 +1,299 @@
+"""
+Local stand-ins for the OpenAI and Supabase APIs the backend calls.
+
+Serves, on one port:
+- POST /v1/responses — Responses API replies with a file_search_call, output
+  text with file_citation annotations and usage, as JSON or as a stream of
+  events, after a configurable delay; optionally 429s with Retry-After above
+  a request rate
+- GET  /v1/models/<model> — used by the backend to warm its connections
+- GET  /v1/vector_stores/<id>/files[/<file_id>] — the files the citations name
+- POST /v1/vector_stores/<id>/search — scored excerpts from those files, for
+  the per-category shard search, after `search_latency`
+- GET/POST /rest/v1/flags — an in-memory Supabase `flags` table with the
+  filters, ordering and keyset cursors the backend uses
+
+Point the backend at it with OPENAI_BASE_URL=http://HOST:PORT/v1 and
+SUPABASE_URL=http://HOST:PORT (bench.py does this for you).
+
+    python benchmarks/mock_upstream.py --port 8100 --latency 0.8 --tokens 60
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+
+from quart import Quart, Response, jsonify, request
+
+app = Quart(__name__)
+
+config = {
+    'latency': 0.8,           # seconds before a JSON reply, or before the first text delta
+    'search_latency': 0.3,    # part of `latency` reported as file_search in streams
+    'tokens': 60,             # output text deltas per reply
+    'token_interval': 0.01,   # seconds between deltas
+    'files': 50,              # files in the mock vector store
+    'citations': 3,           # file_citation annotations per reply
+    'supabase_latency': 0.02, # seconds per Supabase request
+    'rpm': 0                  # /v1/responses answers 429 above this rate, 0 for no limit
+}
+# Token bucket behind `rpm`: [level, updated_at]
+rate_limit = [None, None]
+
+response_ids = itertools.count(1)
+# (model, instructions) prefixes already sent, which OpenAI would serve from its prompt cache
+seen_prefixes = set()
+flag_rows = []
+flag_ids = itertools.count(1)
+
+WORDS = (
+    "The National Disability Insurance Scheme supports families of deaf children with "
+    "early intervention, hearing services, Auslan learning and school adjustments."
+).split()
+
+
+def vector_store_file(index, vector_store_id='vs_mock'):
+    file_id = f"file-mock{index:04d}"
+    return {
+        'id': file_id,
+        'object': 'vector_store.file',
+        'created_at': 1700000000,
+        'vector_store_id': vector_store_id,
+        'status': 'completed',
+        'usage_bytes': 20000,
+        'last_error': None,
+        'chunking_strategy': {'type': 'static', 'static': {'max_chunk_size_tokens': 800, 'chunk_overlap_tokens': 400}},
+        'attributes': {
+            'filename': f"Mock Document {index}_NEW.pdf",
+            'title': f"Mock Document {index}",
+            'author': 'PODC',
+            'category': 'Education',
+            'url': f"https://example.org/docs/{index}.pdf",
+            'last_modified': '2025-05-22 12:00:00'
+        }
+    }
+
+
+def reply_text(question):
+    rng = random.Random(question)
+    return ' '.join(rng.choice(WORDS) for _ in range(config['tokens']))
+
+
+def response_body(body, text):
+    rng = random.Random(text)
+    files = [vector_store_file(rng.randrange(config['files'])) for _ in range(config['citations'])]
+    annotations = [
+        {'type': 'file_citation', 'file_id': f['id'], 'filename': f['attributes']['filename'], 'index': len(text)}
+        for f in files
+    ]
+    input_tokens = 1200 + len(str(body.get('input', ''))) // 4
+    prefix = (body.get('model'), body.get('instructions'))
+    cached = 1024 if body.get('previous_response_id') or prefix in seen_prefixes else 0
+    seen_prefixes.add(prefix)
+    return {
+        'id': f"resp_mock{next(response_ids)}",
+        'object': 'response',
+        'created_at': int(time.time()),
+        'status': 'completed',
+        'model': body.get('model', 'gpt-4o-mini'),
+        'previous_response_id': body.get('previous_response_id'),
+        'parallel_tool_calls': True,
+        'tool_choice': 'auto',
+        'tools': body.get('tools', []),
+        'output': [
+            {
+                'id': 'fs_mock', 'type': 'file_search_call', 'status': 'completed', 'queries': [str(body.get('input', ''))[:200]],
+                'results': [
+                    {'file_id': f['id'], 'filename': f['attributes']['filename'], 'attributes': f['attributes'], 'score': 0.9, 'text': 'excerpt'}
+                    for f in files
+                ]
+            },
+            {
+                'id': 'msg_mock', 'type': 'message', 'role': 'assistant', 'status': 'completed',
+                'content': [{'type': 'output_text', 'text': text, 'annotations': annotations}]
+            }
+        ],
+        'usage': {
+            'input_tokens': input_tokens,
+            'input_tokens_details': {'cached_tokens': cached},
+            'output_tokens': config['tokens'],
+            'output_tokens_details': {'reasoning_tokens': 0},
+            'total_tokens': input_tokens + config['tokens']
+        }
+    }
+
+
+def sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def rate_limited():
+    """Seconds until the next request is allowed under config['rpm'], or 0"""
+    if not config['rpm']:
+        return 0
+    # Ten seconds of burst, like the backend's own buckets
+    rate, capacity = config['rpm'] / 60, max(1.0, config['rpm'] / 6)
+    now = time.monotonic()
+    level = capacity if rate_limit[0] is None else min(capacity, rate_limit[0] + (now - rate_limit[1]) * rate)
+    if level < 1:
+        rate_limit[:] = [level, now]
+        return (1 - level) / rate
+    rate_limit[:] = [level - 1, now]
+    return 0
+
+
+@app.route('/v1/responses', methods=['POST'])
+async def create_response():
+    wait = rate_limited()
+    if wait:
+        return jsonify({'error': {'message': 'Rate limit reached for requests', 'type': 'requests', 'code': 'rate_limit_exceeded'}}), 429, {
+            'retry-after-ms': str(int(wait * 1000)), 'retry-after': str(max(1, round(wait)))
+        }
+    body = await request.get_json()
+    text = reply_text(str(body.get('input')))
+    completed = response_body(body, text)
+
+    if not body.get('stream'):
+        await asyncio.sleep(config['latency'])
+        return jsonify(completed)
+
+    async def events():
+        sequence = itertools.count()
+        yield sse({'type': 'response.created', 'sequence_number': next(sequence), 'response': dict(completed, status='in_progress', output=[])})
+        await asyncio.sleep(config['latency'] - config['search_latency'])
+        yield sse({'type': 'response.file_search_call.in_progress', 'sequence_number': next(sequence), 'item_id': 'fs_mock', 'output_index': 0})
+        await asyncio.sleep(config['search_latency'])
+        yield sse({'type': 'response.file_search_call.completed', 'sequence_number': next(sequence), 'item_id': 'fs_mock', 'output_index': 0})
+        for i, word in enumerate(text.split(' ')):
+            if i:
+                await asyncio.sleep(config['token_interval'])
+            yield sse({
+                'type': 'response.output_text.delta', 'sequence_number': next(sequence), 'item_id': 'msg_mock',
+                'output_index': 1, 'content_index': 0, 'delta': (' ' if i else '') + word, 'logprobs': []
+            })
+        yield sse({'type': 'response.completed', 'sequence_number': next(sequence), 'response': completed})
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.timeout = None
+    return response
+
+
+@app.route('/v1/models/<model>', methods=['GET'])
+async def retrieve_model(model):
+    return jsonify({'id': model, 'object': 'model', 'created': 1700000000, 'owned_by': 'system'})
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/files', methods=['GET'])
+async def list_files(vector_store_id):
+    limit = int(request.args.get('limit', 20))
+    after = request.args.get('after')
+    files = [vector_store_file(i, vector_store_id) for i in range(config['files'])]
+    start = next((i + 1 for i, f in enumerate(files) if f['id'] == after), 0)
+    page = files[start:start + limit]
+    return jsonify({
+        'object': 'list',
+        'data': page,
+        'first_id': page[0]['id'] if page else None,
+        'last_id': page[-1]['id'] if page else None,
+        'has_more': start + limit < len(files)
+    })
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/files/<file_id>', methods=['GET'])
+async def retrieve_file(vector_store_id, file_id):
+    match = re.match(r'file-mock(\d+)$', file_id)
+    if not match:
+        return jsonify({'error': {'message': 'No such file'}}), 404
+    return jsonify(vector_store_file(int(match.group(1)), vector_store_id))
+
+
+@app.route('/v1/vector_stores/<vector_store_id>/search', methods=['POST'])
+async def search_vector_store(vector_store_id):
+    body = await request.get_json()
+    await asyncio.sleep(config['search_latency'])
+    rng = random.Random(f"{vector_store_id} {body.get('query')}")
+    count = min(body.get('max_num_results') or 10, config['files'])
+    results = []
+    for index in rng.sample(range(config['files']), count):
+        stored = vector_store_file(index, vector_store_id)
+        results.append({
+            'file_id': stored['id'],
+            'filename': stored['attributes']['filename'],
+            'score': round(rng.random(), 4),
+            'attributes': stored['attributes'],
+            'content': [{'type': 'text', 'text': ' '.join(rng.choice(WORDS) for _ in range(40))}]
+        })
+    results.sort(key=lambda result: result['score'], reverse=True)
+    return jsonify({
+        'object': 'vector_store.search_results.page',
+        'search_query': [body.get('query')],
+        'data': results,
+        'has_more': False,
+        'next_page': None
+    })
+
+
+def flag_filter(args):
+    """The PostgREST filters flags.flags_page_url emits, as a predicate over rows"""
+    checks = []
+    for condition in args.getlist('timestamp'):
+        op, value = condition.split('.', 1)
+        checks.append((lambda row, v=value: row['timestamp'] >= v) if op == 'gte' else (lambda row, v=value: row['timestamp'] < v))
+    if args.get('or'):
+        match = re.match(r'\(timestamp\.lt\."([^"]*)",and\(timestamp\.eq\."([^"]*)",id\.lt\.(\d+)\)\)', args['or'])
+        if match:
+            timestamp, row_id = match.group(1), int(match.group(3))
+            checks.append(lambda row: (row['timestamp'], row['id']) < (timestamp, row_id))
+    return lambda row: all(check(row) for check in checks)
+
+
+@app.route('/rest/v1/flags', methods=['GET', 'POST'])
+async def flags():
+    await asyncio.sleep(config['supabase_latency'])
+    if request.method == 'POST':
+        rows = await request.get_json()
+        for row in rows if isinstance(rows, list) else [rows]:
+            flag_rows.append(dict(row, id=next(flag_ids)))
+        return Response('', status=201)
+
+    matches = [row for row in flag_rows if flag_filter(request.args)(row)]
+    matches.sort(key=lambda row: (row['timestamp'], row['id']), reverse=True)
+    limit = int(request.args.get('limit', len(matches)))
+    return jsonify(matches[:limit])
+
+
+def seed_flags(count):
+    for i in range(count):
+        flag_rows.append({
+            'id': next(flag_ids),
+            'timestamp': f"2025-05-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00Z",
+            'user_prompt': f"Question {i}",
+            'flagged_text': f"Flagged answer {i}"
+        })
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock OpenAI and Supabase endpoints for benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=config['latency'], help="Seconds before a JSON reply or the first delta")
+    parser.add_argument('--search-latency', type=float, default=config['search_latency'], help="Part of --latency reported as file_search")
+    parser.add_argument('--tokens', type=int, default=config['tokens'], help="Output deltas per reply")
+    parser.add_argument('--token-interval', type=float, default=config['token_interval'], help="Seconds between deltas")
+    parser.add_argument('--files', type=int, default=config['files'], help="Files in the mock vector store")
+    parser.add_argument('--citations', type=int, default=config['citations'], help="Citations per reply")
+    parser.add_argument('--supabase-latency', type=float, default=config['supabase_latency'])
+    parser.add_argument('--rpm', type=float, default=config['rpm'], help="Answer /v1/responses with 429 above this many requests/minute")
+    parser.add_argument('--seed-flags', type=int, default=1000, help="Rows preloaded into the flags table")
+    args = parser.parse_args()
+
+    for key in config:
+        config[key] = getattr(args, key)
+    config['search_latency'] = min(config['search_latency'], config['latency'])
+    seed_flags(args.seed_flags)
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
@@ -10,6 +10,8 @@ const header=document.getElementById('header');
  let userAccepted = false; // user consent
  let introMessage=false;  // introduction message from bot
  let lastUserMessage = "";  // Track the last thing the user sent
+ // Conversation the backend keeps for follow-up questions; only this ID is sent, never the transcript
+ let sessionId = sessionStorage.getItem('podc_session_id');
 
  // Add this helper function at the top of your script
  function cleanFileName(filename) {
@@ -73,18 +75,28 @@ const header=document.getElementById('header');
      fetch('https://podc-chatbot-backend-v2.onrender.com/chat', {
          method: 'POST',
          headers: {
-             'Content-Type': 'application/json'
+             'Content-Type': 'application/json',
+             'Accept': 'text/event-stream, application/json'
          },
-         body: JSON.stringify({ message: text })
+         body: JSON.stringify({ message: text, stream: true, session_id: sessionId })
      })
      .then(response => {
          if (!response.ok) {
              throw new Error(`HTTP error! status: ${response.status}`);
          }
-         return response.json();
+         // Older backends ignore the stream flag and answer with a single JSON body
+         const contentType = response.headers.get('Content-Type') || '';
+         if (!contentType.includes('text/event-stream') || !response.body) {
+             return response.json();
+         }
+         return readStream(response, loading);
      })
      .then(data => {
          loading.style.display = 'none';
+         if (data.session_id) {
+             sessionId = data.session_id;
+             sessionStorage.setItem('podc_session_id', sessionId);
+         }
          // Add detailed debug logging
          console.log('Full response data:', data);
          console.log('Citations:', data.citations);
@@ -120,6 +132,66 @@ const header=document.getElementById('header');
          input.focus();
      });
  }
+
+ // Read Server-Sent Events from /chat, showing text as it arrives.
+ // Resolves with the same {response, citations} shape as the JSON reply.
+ async function readStream(response, loading) {
+     const reader = response.body.getReader();
+     const decoder = new TextDecoder();
+     let buffer = '';
+     let reply = '';
+     let citations = [];
+     let sessionId = null;
+     let draft = null;  // temporary bubble replaced by appendMessage once done
+
+     const handleEvent = (event, payload) => {
+         if (event === 'delta') {
+             reply += payload.text;
+             if (!draft) {
+                 loading.style.display = 'none';
+                 draft = document.createElement('div');
+                 draft.className = 'msg bot';
+                 draft.appendChild(document.createElement('div')).className = 'response-text';
+                 msg.appendChild(draft);
+             }
+             draft.firstChild.innerHTML = marked.parse(reply);
+             msg.scrollTop = msg.scrollHeight;
+         } else if (event === 'citations') {
+             citations = payload.citations || [];
+         } else if (event === 'done') {
+             reply = payload.response || reply;
+             sessionId = payload.session_id || null;
+         } else if (event === 'error') {
+             throw new Error(payload.response);
+         }
+     };
+
+     try {
+         while (true) {
+             const { value, done } = await reader.read();
+             if (done) break;
+             buffer += decoder.decode(value, { stream: true });
+
+             // Frames are separated by a blank line
+             let boundary;
+             while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                 const frame = buffer.slice(0, boundary);
+                 buffer = buffer.slice(boundary + 2);
+                 let event = 'message';
+                 let dataLines = [];
+                 frame.split('\n').forEach(line => {
+                     if (line.startsWith('event:')) event = line.slice(6).trim();
+                     else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                 });
+                 if (dataLines.length) handleEvent(event, JSON.parse(dataLines.join('\n')));
+             }
+         }
+     } finally {
+         if (draft) draft.remove();
+     }
+
+     return { response: reply, citations: citations, session_id: sessionId };
+ }
  
  function appendMessage(sender, text, citations = []) {
     const message = document.createElement('div');
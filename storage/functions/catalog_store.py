@@ -0,0 +1,209 @@
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from storage.functions.pdf_info import extract_pdf_info, find_pdfs
+except ImportError:  # run as a script from storage/functions
+    from pdf_info import extract_pdf_info, find_pdfs
+
+DEFAULT_PATH = Path(__file__).resolve().parent.parent / "data" / "catalog.sqlite3"
+
+# Catalog column -> Excel heading, in the order create_file_catalog has always used
+EXCEL_COLUMNS = {
+    'name': 'Name',
+    'title': 'Title',
+    'author': 'Author',
+    'date_modified': 'Date Modified',
+    'category': 'Category',
+    'size_kb': 'Size (KB)',
+    'source_url': 'Source URL'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    title TEXT,
+    author TEXT,
+    source_url TEXT,
+    date_modified TEXT NOT NULL,
+    size_kb REAL NOT NULL,
+    error TEXT,
+    pdf_modified TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_category ON files (category);
+CREATE TABLE IF NOT EXISTS duplicates (
+    path TEXT PRIMARY KEY,
+    canonical_path TEXT NOT NULL,
+    method TEXT NOT NULL,
+    similarity REAL NOT NULL
+);
+"""
+
+
+def _display_record(row):
+    """A catalog row with the placeholders the Excel catalog has always shown"""
+    record = dict(row)
+    if record['error'] is not None:
+        record['title'] = record['author'] = record['source_url'] = 'Error reading metadata'
+    else:
+        if record['title'] is None:
+            record['title'] = 'No title found'
+        if record['author'] is None:
+            record['author'] = 'No author found'
+        if record['source_url'] is None:
+            record['source_url'] = 'No URL found'
+    return record
+
+
+def vector_store_attributes(record):
+    """
+    The attributes vector_store_setup.py gives an uploaded PDF with this catalog
+    record. `last_modified` is the PDF's own ModDate rather than `date_modified`:
+    file times change with every checkout, the content's date does not.
+    """
+    return {
+        'filename': record['name'],
+        'title': record['title'],
+        'author': record['author'],
+        'category': record['category'],
+        'url': record['source_url'] if record['source_url'] != 'No URL found' else '',
+        'last_modified': record['pdf_modified'] or ''
+    }
+
+
+class CatalogStore:
+    """
+    The PDF catalog kept in one SQLite file instead of a new timestamped xlsx per run.
+
+    `update` rescans a PDF folder and rewrites the rows in place (unchanged PDFs
+    come straight from the pdf_info cache). Records are read back with indexed
+    lookups by file name or category; Excel is only an export.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Catalogs created before pdf_modified existed gain the column; the next update fills it
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(files)")}
+            if 'pdf_modified' not in columns:
+                conn.execute("ALTER TABLE files ADD COLUMN pdf_modified TEXT")
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def update(self, root_directory):
+        """Make the catalog match the PDFs under `root_directory`, returning the record count"""
+        pdfs = find_pdfs(root_directory)
+        pdf_info = extract_pdf_info([file_path for file_path, _ in pdfs])
+
+        rows = []
+        for file_path, category in pdfs:
+            stat = os.stat(file_path)
+            info = pdf_info[file_path]
+            rows.append((
+                Path(os.path.relpath(file_path, root_directory)).as_posix(),
+                os.path.basename(file_path),
+                category,
+                info['title'],
+                info['author'],
+                info['source_url'],
+                datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                round(stat.st_size / 1024, 2),
+                info['error'],
+                info['modified']
+            ))
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM files")
+                conn.executemany(
+                    "INSERT INTO files (path, name, category, title, author, source_url, date_modified, size_kb, error, pdf_modified)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        finally:
+            conn.close()
+        return len(rows)
+
+    def _select(self, where="", params=()):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT * FROM files {where} ORDER BY path", params).fetchall()
+        finally:
+            conn.close()
+        return [_display_record(row) for row in rows]
+
+    def records(self):
+        return self._select()
+
+    def by_name(self, name):
+        """Records for one file name (more than one if the same file sits in several categories)"""
+        return self._select("WHERE name = ?", (name,))
+
+    def by_category(self, category):
+        return self._select("WHERE category = ?", (category,))
+
+    def record_duplicates(self, clusters, root_directory):
+        """Replace the duplicate mapping with pdf_dedup clusters, paths relative to `root_directory`"""
+        def relative(path):
+            return Path(os.path.relpath(path, root_directory)).as_posix()
+
+        rows = [
+            (relative(duplicate['path']), relative(cluster['canonical']), duplicate['method'], duplicate['similarity'])
+            for cluster in clusters for duplicate in cluster['duplicates']
+        ]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM duplicates")
+                conn.executemany("INSERT INTO duplicates VALUES (?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+        return len(rows)
+
+    def duplicates(self):
+        """{'path', 'canonical_path', 'method', 'similarity'} for every file not uploaded as a duplicate"""
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute("SELECT * FROM duplicates ORDER BY canonical_path, path")]
+        finally:
+            conn.close()
+
+    def canonical_path(self, path):
+        """The file uploaded in place of `path`, or `path` itself if it is not a duplicate"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT canonical_path FROM duplicates WHERE path = ?", (path,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else path
+
+    def __len__(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        finally:
+            conn.close()
+
+    def to_dataframe(self):
+        import pandas as pd
+        records = self.records()
+        return pd.DataFrame(
+            [{heading: record[column] for column, heading in EXCEL_COLUMNS.items()} for record in records],
+            columns=list(EXCEL_COLUMNS.values())
+        )
+
+    def export_excel(self, output_file):
+        """Write the catalog in the file_catalog_*.xlsx layout"""
+        self.to_dataframe().to_excel(output_file, index=False)
+        return output_file
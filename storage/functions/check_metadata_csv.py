@@ -1,10 +1,14 @@
 import os
 import pandas as pd
-from PyPDF2 import PdfReader
 import unicodedata
 from datetime import datetime
 import sys
 
+try:
+    from storage.functions.pdf_info import extract_pdf_info, find_pdfs
+except ImportError:  # run as a script from storage/functions
+    from pdf_info import extract_pdf_info, find_pdfs
+
 # Set console to UTF-8 mode
 if sys.platform.startswith('win'):
     import codecs
@@ -33,32 +37,24 @@ def generate_metadata_csv(root_directory, output_directory=None):
     titles = []
     authors = []
 
-    # Walk through the directory
-    for root, dirs, files in os.walk(root_directory):
-        if root == root_directory:
-            continue
-            
-        for file in files:
-            if not file.lower().endswith('.pdf'):
-                continue
+    # Find every PDF, then read their metadata in parallel (cached across runs)
+    pdfs = find_pdfs(root_directory)
+    pdf_info = extract_pdf_info([file_path for file_path, _ in pdfs])
 
-            file_path = os.path.join(root, file)
-            try:
-                with open(file_path, 'rb') as pdf_file:
-                    reader = PdfReader(pdf_file)
-                    metadata = reader.metadata
-                    
-                    names.append(normalize_text(file))
-                    urls.append(normalize_text(metadata.get('/SourceURL', '')))
-                    titles.append(normalize_text(metadata.get('/Title', '')))
-                    authors.append(normalize_text(metadata.get('/Author', '')))
-                
-            except Exception as e:
-                print(f"Error processing {file}: {str(e)}")
-                names.append(normalize_text(file))
-                urls.append('Error reading metadata')
-                titles.append('Error reading metadata')
-                authors.append('Error reading metadata')
+    for file_path, _ in pdfs:
+        file = os.path.basename(file_path)
+        info = pdf_info[file_path]
+        if info['error'] is None:
+            names.append(normalize_text(file))
+            urls.append(normalize_text(info['source_url'] or ''))
+            titles.append(normalize_text(info['title'] or ''))
+            authors.append(normalize_text(info['author'] or ''))
+        else:
+            print(f"Error processing {file}: {info['error']}")
+            names.append(normalize_text(file))
+            urls.append('Error reading metadata')
+            titles.append('Error reading metadata')
+            authors.append('Error reading metadata')
     
     if names:
         df = pd.DataFrame({
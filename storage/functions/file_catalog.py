@@ -1,89 +1,46 @@
 import os
-import pandas as pd
+import argparse
 from datetime import datetime
-from PyPDF2 import PdfReader
 
-def create_file_catalog(root_directory, output_directory=None):
-    # Lists to store file information
-    file_names = []
-    mod_dates = []
-    categories = []
-    sizes = []
-    source_urls = []
-    titles = []      
-    authors = []     
+try:
+    from storage.functions.catalog_store import CatalogStore
+except ImportError:  # run as a script from storage/functions
+    from catalog_store import CatalogStore
 
-    # Walk through the directory
-    for root, dirs, files in os.walk(root_directory):
-        category = os.path.basename(root)
-        
-        if root == root_directory:
-            continue
-            
-        for file in files:
-            if not file.lower().endswith('.pdf'):
-                continue
+def create_file_catalog(root_directory, output_directory=None, store=None):
+    """
+    Bring the catalog store up to date with the PDFs under `root_directory`.
 
-            file_path = os.path.join(root, file)
-            file_names.append(file)
-            
-            # Get file modification time
-            mod_timestamp = os.path.getmtime(file_path)
-            mod_datetime = datetime.fromtimestamp(mod_timestamp)
-            mod_dates.append(mod_datetime.strftime('%Y-%m-%d %H:%M:%S'))
-            
-            categories.append(category)
-            
-            # Get file size
-            size_kb = round(os.path.getsize(file_path) / 1024, 2)
-            sizes.append(size_kb)
+    Returns the store. A timestamped Excel copy is written only when
+    `output_directory` is given.
+    """
+    store = store or CatalogStore()
+    count = store.update(root_directory)
+    print(f"Catalog updated: {store.path}")
+    print(f"Total files processed: {count}")
 
-            # Get metadata from PDF
-            try:
-                reader = PdfReader(file_path)
-                url = reader.metadata.get('/SourceURL', 'No URL found')
-                title = reader.metadata.get('/Title', 'No title found')
-                author = reader.metadata.get('/Author', 'No author found')
-                
-                source_urls.append(url)
-                titles.append(title)
-                authors.append(author)
-            except Exception as e:
-                source_urls.append('Error reading metadata')
-                titles.append('Error reading metadata')
-                authors.append('Error reading metadata')
-    
-    # Create DataFrame with eight columns
-    df = pd.DataFrame({
-        'Name': file_names,
-        'Title': titles,
-        'Author': authors,
-        'Date Modified': mod_dates,
-        'Category': categories,
-        'Size (KB)': sizes,
-        'Source URL': source_urls
-    })
-    
-    # Generate timestamp for unique filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    output_file = f'file_catalog_{timestamp}.xlsx'
-    
-    # If output directory is specified, join it with filename
     if output_directory:
+        # Generate timestamp for unique filename
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         if not os.path.exists(output_directory):
             os.makedirs(output_directory)
-        output_file = os.path.join(output_directory, output_file)
-    
-    try:
-        df.to_excel(output_file, index=False)
-        print(f"Catalog created successfully: {output_file}")
-        print(f"Total files processed: {len(file_names)}")
-    except Exception as e:
-        print(f"Error creating Excel file: {e}")
+        output_file = os.path.join(output_directory, f'file_catalog_{timestamp}.xlsx')
+
+        try:
+            store.export_excel(output_file)
+            print(f"Catalog exported: {output_file}")
+        except Exception as e:
+            print(f"Error creating Excel file: {e}")
+
+    return store
 
 if __name__ == "__main__":
-    directory = r"storage\data\PDFs"
-    output_dir = r"storage\data\Catalogs"
+    parser = argparse.ArgumentParser(description="Update the PDF catalog")
+    parser.add_argument("--excel", action="store_true", help="Also export a timestamped Excel copy to storage/data/Catalogs")
+    args = parser.parse_args()
+
+    directory = os.path.join("storage", "data", "PDFs")
+    output_dir = os.path.join("storage", "data", "Catalogs")
 
     # Add directory existence check
     if not os.path.exists(directory):
@@ -92,4 +49,4 @@ if __name__ == "__main__":
 
     print("Starting catalog creation...")
     print(f"Scanning directory: {os.path.abspath(directory)}")
-    create_file_catalog(directory, output_dir)
\ No newline at end of file
+    create_file_catalog(directory, output_dir if args.excel else None)
@@ -1,15 +1,53 @@
+import json
+import os
 import re
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
 
 def get_vector_store_id_from_server():
+    """
+    The store the backend serves: the first of VECTOR_STORE_IDS, else the one
+    recorded by vector_store_setup.py, else the ID still written in server.py.
+    """
+    if os.getenv("VECTOR_STORE_IDS"):
+        return os.environ["VECTOR_STORE_IDS"].split(",")[0].strip()
     try:
-        server_path = "backend\server.py"
-        with open(server_path, 'r') as file:
-            content = file.read()
+        manifest_path = project_root / "storage" / "data" / "vector_store_manifest.json"
+        if manifest_path.exists():
+            with open(manifest_path, encoding='utf-8') as file:
+                store_id = json.load(file).get('vector_store_id')
+            if store_id:
+                return store_id
+
+        for server_path in (project_root / "backend" / "settings.py", project_root / "backend" / "server.py"):
+            with open(server_path, 'r') as file:
+                content = file.read()
             # Look for the vector store ID in the tools configuration
-            match = re.search(r'"vector_store_ids":\s*\["([^"]+)"\]', content)
+            match = re.search(r'"(vs_[A-Za-z0-9]+)"', content)
             if match:
                 return match.group(1)
-            return None
+        return None
     except Exception as e:
         print(f"Error reading vector store ID from server.py: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def get_vector_store_ids_from_server():
+    """
+    Every store the backend serves: its per-category shards (VECTOR_STORE_SHARDS,
+    else those synced by vector_store_setup.py --shards) if there are any,
+    else the single store above.
+    """
+    if os.getenv("VECTOR_STORE_SHARDS"):
+        entries = [entry.rpartition("=")[2].strip() for entry in os.environ["VECTOR_STORE_SHARDS"].split(";")]
+        return sorted({store_id for store_id in entries if store_id})
+    store_ids = set()
+    for manifest_path in (project_root / "storage" / "data" / "vector_store_shards").glob("*.json"):
+        with open(manifest_path, encoding='utf-8') as file:
+            store_id = json.load(file).get('vector_store_id')
+        if store_id:
+            store_ids.add(store_id)
+    if store_ids:
+        return sorted(store_ids)
+    store_id = get_vector_store_id_from_server()
+    return [store_id] if store_id else []
@@ -0,0 +1,248 @@
+"""
+Find duplicate and near-duplicate PDFs before they are uploaded.
+
+Exact copies share a SHA-256 of their bytes. Near-duplicates, such as a
+`_NEW` file next to the version it replaced or a re-export with a new cover,
+are found with MinHash over 5-word shingles of the extracted text: each PDF
+is reduced to the smallest hashes of its shingles (a bottom-k sketch), and two
+sketches estimate the Jaccard similarity of the full shingle sets. Files above
+the threshold are joined into clusters and each cluster keeps one canonical
+file, which is the only one vector_store_setup.py uploads.
+
+    python storage/functions/pdf_dedup.py                  # report clusters and record them in the catalog
+    python storage/functions/pdf_dedup.py --threshold 0.9 --json clusters.json
+"""
+import argparse
+import hashlib
+import heapq
+import io
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    from storage.functions.pdf_info import _load_cache, _save_cache
+    from storage.functions.pdf_text import extract_pages
+except ImportError:  # run as a script from storage/functions
+    from pdf_info import _load_cache, _save_cache
+    from pdf_text import extract_pages
+
+DEFAULT_CACHE = Path(__file__).resolve().parent.parent / "data" / ".pdf_fingerprint_cache.json"
+PDF_ROOT = Path(__file__).resolve().parent.parent / "data" / "PDFs"
+
+SHINGLE_WORDS = 5
+SKETCH_SIZE = 256
+DEFAULT_THRESHOLD = 0.75
+# Fewer words than this (e.g. a scanned PDF without a text layer) only match exactly
+MIN_WORDS = 50
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+VERSION_RE = re.compile(r"[ _-](new|old|v\d+)$", re.IGNORECASE)
+# The info dictionary's modification date; incremental updates append newer ones
+MOD_DATE_RE = re.compile(rb"/ModDate\s*\(D:(\d{4,14})")
+
+
+def _hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def fingerprint(path):
+    """
+    {'sha256', 'modified', 'words', 'sketch', 'error'} for one PDF. The sketch
+    is the SKETCH_SIZE smallest shingle hashes of its text, empty if it has too
+    little. `modified` is the PDF's own ModDate as YYYYMMDDHHMMSS, or None.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return {'sha256': None, 'modified': None, 'words': 0, 'sketch': [], 'error': str(e)}
+    dates = MOD_DATE_RE.findall(data)
+    result = {
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'modified': dates[-1].decode('ascii').ljust(14, '0') if dates else None,
+        'words': 0,
+        'sketch': [],
+        'error': None
+    }
+
+    words = []
+    try:
+        for _, text in extract_pages(io.BytesIO(data)):
+            words.extend(WORD_RE.findall(text.lower()))
+    except Exception as e:
+        result['error'] = str(e)
+    result['words'] = len(words)
+    if len(words) >= MIN_WORDS:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+        result['sketch'] = heapq.nsmallest(SKETCH_SIZE, {_hash(shingle) for shingle in shingles})
+    return result
+
+
+def fingerprints(paths, cache_path=DEFAULT_CACHE, max_workers=None):
+    """
+    Fingerprints for many PDFs: {path: fingerprint}. Cached on disk by
+    (path, size, mtime) like pdf_info, since extracting the text is the slow part.
+    """
+    cache = _load_cache(cache_path) if cache_path else {}
+    results = {}
+    stale = []
+
+    for path in paths:
+        stat = os.stat(path)
+        key = str(Path(path).resolve())
+        entry = cache.get(key)
+        # Entries written before `modified` was fingerprinted are read again
+        if (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                and 'modified' in entry['fingerprint']):
+            results[path] = entry['fingerprint']
+        else:
+            stale.append((path, key, stat))
+
+    if stale:
+        stale_paths = [str(path) for path, _, _ in stale]
+        if len(stale) < 4:
+            computed = [fingerprint(path) for path in stale_paths]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                computed = list(executor.map(fingerprint, stale_paths))
+
+        for (path, key, stat), result in zip(stale, computed):
+            results[path] = result
+            if result['sha256'] is not None:
+                cache[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'fingerprint': result}
+
+        if cache_path:
+            _save_cache(cache_path, cache)
+
+    return results
+
+
+def similarity(sketch_a, sketch_b, size=SKETCH_SIZE):
+    """Estimated Jaccard similarity of two documents from their bottom-k sketches"""
+    if not sketch_a or not sketch_b:
+        return 0.0
+    a, b = set(sketch_a), set(sketch_b)
+    union = heapq.nsmallest(size, a | b)
+    return sum(1 for value in union if value in a and value in b) / len(union)
+
+
+def canonical_order(path, info):
+    """
+    Sort key, lowest first: `_NEW` over unmarked over `_OLD`, then the latest
+    ModDate inside the PDF, then most text, then the shortest path. File
+    mtimes are left out, in a git checkout they are the checkout time, and
+    every machine has to pick the same canonical file.
+    """
+    stem = Path(path).stem
+    marker = VERSION_RE.search(stem)
+    rank = {'new': 0, 'old': 2}.get(marker.group(1).lower(), 1) if marker else 1
+    modified = int(info.get('modified') or 0)
+    return (rank, -modified, -info['words'], len(str(path)), str(path))
+
+
+def find_clusters(paths, threshold=DEFAULT_THRESHOLD, cache_path=DEFAULT_CACHE, max_workers=None):
+    """
+    Groups of two or more PDFs that are copies or near-copies of each other.
+
+    Returns [{'canonical': path, 'duplicates': [{'path', 'method', 'similarity'}]}],
+    where `method` is `exact` for identical bytes and `near` otherwise and
+    `similarity` is measured against the canonical file.
+    """
+    paths = list(paths)
+    prints = fingerprints(paths, cache_path, max_workers)
+    parent = {path: path for path in paths}
+
+    def find(path):
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    by_hash = {}
+    for path in paths:
+        sha256 = prints[path]['sha256']
+        if sha256 is None:
+            continue
+        if sha256 in by_hash:
+            union(path, by_hash[sha256])
+        else:
+            by_hash[sha256] = path
+
+    # Only one file per distinct content takes part in the pairwise comparison
+    distinct = [path for path in by_hash.values() if prints[path]['sketch']]
+    for i, a in enumerate(distinct):
+        for b in distinct[i + 1:]:
+            if similarity(prints[a]['sketch'], prints[b]['sketch']) >= threshold:
+                union(a, b)
+
+    groups = {}
+    for path in paths:
+        groups.setdefault(find(path), []).append(path)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda path: canonical_order(path, prints[path]))
+        canonical = members[0]
+        duplicates = []
+        for path in members[1:]:
+            exact = prints[path]['sha256'] == prints[canonical]['sha256']
+            duplicates.append({
+                'path': path,
+                'method': 'exact' if exact else 'near',
+                'similarity': 1.0 if exact else round(similarity(prints[path]['sketch'], prints[canonical]['sketch']), 3)
+            })
+        clusters.append({'canonical': canonical, 'duplicates': duplicates})
+    clusters.sort(key=lambda cluster: str(cluster['canonical']))
+    return clusters
+
+
+def duplicate_paths(clusters):
+    """{duplicate path: canonical path} for every non-canonical file"""
+    return {duplicate['path']: cluster['canonical'] for cluster in clusters for duplicate in cluster['duplicates']}
+
+
+def print_report(clusters, root):
+    """Print each cluster with its canonical file first, plus the bytes not uploaded"""
+    root = Path(root)
+    saved = 0
+    for cluster in clusters:
+        print(f"{Path(cluster['canonical']).relative_to(root).as_posix()}")
+        for duplicate in cluster['duplicates']:
+            saved += os.path.getsize(duplicate['path'])
+            print(f"  = {Path(duplicate['path']).relative_to(root).as_posix()} "
+                  f"({duplicate['method']}, {duplicate['similarity']:.2f})")
+    skipped = sum(len(cluster['duplicates']) for cluster in clusters)
+    print(f"{len(clusters)} duplicate clusters, {skipped} files skipped, {saved / 1024 / 1024:.1f} MB not uploaded")
+
+
+if __name__ == "__main__":
+    try:
+        from storage.functions.catalog_store import CatalogStore
+    except ImportError:  # run as a script from storage/functions
+        from catalog_store import CatalogStore
+
+    parser = argparse.ArgumentParser(description="Find duplicate PDFs and record them in the catalog")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="Estimated Jaccard similarity for a near-duplicate")
+    parser.add_argument('--json', help="Also write the clusters to this file")
+    args = parser.parse_args()
+
+    root = PDF_ROOT.resolve()
+    clusters = find_clusters(sorted(root.glob('**/*.pdf')), args.threshold)
+    print_report(clusters, root)
+    CatalogStore().record_duplicates(clusters, root)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump([{
+                'canonical': Path(cluster['canonical']).relative_to(root).as_posix(),
+                'duplicates': [dict(duplicate, path=Path(duplicate['path']).relative_to(root).as_posix())
+                               for duplicate in cluster['duplicates']]
+            } for cluster in clusters], f, indent=2)
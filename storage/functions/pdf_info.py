@@ -0,0 +1,185 @@
+import io
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import DictionaryObject, IndirectObject
+
+# Info dictionary keys the catalog cares about
+INFO_KEYS = {'/Title': 'title', '/Author': 'author', '/SourceURL': 'source_url', '/ModDate': 'modified'}
+# PDF date strings, D:YYYYMMDDHHmmSS with everything after the year optional
+PDF_DATE_RE = re.compile(r"D:(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?")
+
+DEFAULT_CACHE = Path(__file__).resolve().parent.parent / "data" / ".pdf_info_cache.json"
+
+TAIL_BYTES = 4096
+OBJECT_WINDOW = 64 * 1024
+
+
+def _info_from_dict(info):
+    values = {}
+    for key, name in INFO_KEYS.items():
+        value = info.get(key)
+        if isinstance(value, IndirectObject):
+            raise ValueError("Indirect info value")
+        values[name] = str(value) if value is not None else None
+    return values
+
+
+def pdf_date(value):
+    """A PDF date string as 'YYYY-MM-DD HH:MM:SS' (time zone dropped), or None"""
+    match = PDF_DATE_RE.match((value or "").strip())
+    if not match:
+        return None
+    year, month, day, hour, minute, second = (part or default for part, default in zip(
+        match.groups(), ('', '01', '01', '00', '00', '00')
+    ))
+    return f"{year}-{month}-{day} {hour}:{minute}:{second}"
+
+
+def _read_info_from_trailer(pdf_file):
+    """
+    Read the info dictionary using only the file tail, one xref entry and the
+    object itself. Works for classic cross-reference tables whose last trailer
+    names /Info; returns None for anything else so the caller can fall back.
+    """
+    pdf_file.seek(0, os.SEEK_END)
+    size = pdf_file.tell()
+    pdf_file.seek(max(0, size - TAIL_BYTES))
+    tail = pdf_file.read()
+
+    startxref = re.findall(rb'startxref\s+(\d+)', tail)
+    trailer_at = tail.rfind(b'trailer')
+    if not startxref or trailer_at == -1 or b'/Encrypt' in tail[trailer_at:]:
+        return None
+    info_ref = re.search(rb'/Info\s+(\d+)\s+(\d+)\s+R', tail[trailer_at:])
+    if not info_ref:
+        return None
+    object_number = int(info_ref.group(1))
+
+    # Walk the subsections of the newest xref table for the info object's offset
+    pdf_file.seek(int(startxref[-1]))
+    if not pdf_file.read(4).startswith(b'xref'):
+        return None
+    pdf_file.readline()
+    offset = None
+    while offset is None:
+        header = pdf_file.readline().split()
+        if len(header) != 2 or not header[0].isdigit():
+            return None  # reached the trailer, the object lives in an older section
+        first, count = int(header[0]), int(header[1])
+        if first <= object_number < first + count:
+            pdf_file.seek((object_number - first) * 20, os.SEEK_CUR)
+            entry = pdf_file.read(20).split()
+            if len(entry) < 3 or entry[2] != b'n':
+                return None
+            offset = int(entry[0])
+        else:
+            pdf_file.seek(count * 20, os.SEEK_CUR)
+
+    pdf_file.seek(offset)
+    window = pdf_file.read(OBJECT_WINDOW)
+    start = window.find(b'<<')
+    if start == -1:
+        return None
+    info = DictionaryObject.read_from_stream(io.BytesIO(window[start:]), None)
+    return _info_from_dict(info)
+
+
+def read_pdf_info(path):
+    """
+    Title, author, source URL and modification date (the info dictionary's
+    ModDate, see pdf_date) of one PDF, plus an `error` message if it could not
+    be read. Only the trailer and info object are parsed when the file layout
+    allows it; other files go through PdfReader.
+    """
+    try:
+        with open(path, 'rb') as pdf_file:
+            try:
+                info = _read_info_from_trailer(pdf_file)
+            except Exception:
+                info = None
+            if info is None:
+                pdf_file.seek(0)
+                metadata = PdfReader(pdf_file).metadata or {}
+                info = {name: str(metadata[key]) if metadata.get(key) is not None else None
+                        for key, name in INFO_KEYS.items()}
+        info['modified'] = pdf_date(info['modified'])
+        info['error'] = None
+        return info
+    except Exception as e:
+        return {'title': None, 'author': None, 'source_url': None, 'modified': None, 'error': str(e)}
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_path, cache):
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = cache_path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(temp_path, cache_path)
+
+
+def extract_pdf_info(paths, cache_path=DEFAULT_CACHE, max_workers=None):
+    """
+    Info for many PDFs at once: {path: {'title', 'author', 'source_url', 'modified', 'error'}}.
+
+    Results are cached on disk keyed by (path, size, mtime), so unchanged files
+    are never reopened. Files that do need parsing are read in a process pool.
+    """
+    cache = _load_cache(cache_path) if cache_path else {}
+    results = {}
+    stale = []
+
+    for path in paths:
+        stat = os.stat(path)
+        key = str(Path(path).resolve())
+        entry = cache.get(key)
+        # Entries cached before `modified` was read are parsed again
+        if (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                and 'modified' in entry['info']):
+            results[path] = entry['info']
+        else:
+            stale.append((path, key, stat))
+
+    if stale:
+        stale_paths = [str(path) for path, _, _ in stale]
+        if len(stale) < 8:
+            infos = [read_pdf_info(path) for path in stale_paths]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                infos = list(executor.map(read_pdf_info, stale_paths, chunksize=8))
+
+        for (path, key, stat), info in zip(stale, infos):
+            results[path] = info
+            if info['error'] is None:
+                cache[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'info': info}
+
+        if cache_path:
+            _save_cache(cache_path, cache)
+
+    return results
+
+
+def find_pdfs(root_directory):
+    """(path, category) for every PDF in the subfolders of `root_directory`"""
+    found = []
+    for root, dirs, files in os.walk(root_directory):
+        if root == root_directory:
+            continue
+        category = os.path.basename(root)
+        for file in files:
+            if file.lower().endswith('.pdf'):
+                found.append((os.path.join(root, file), category))
+    return found
@@ -1,48 +1,168 @@
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import DictionaryObject, NameObject, TextStringObject
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import io
 import os
+import re
+import struct
 import pandas as pd
 
-def append_pdf_metadata(pdf_path, url, title=None, author=None):
-    """Add source URL, title, and author to PDF metadata."""
+# Info dictionary key for each metadata field
+INFO_KEYS = {'url': '/SourceURL', 'title': '/Title', 'author': '/Author'}
+
+def _serialize(obj):
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer, None)
+    return buffer.getvalue()
+
+def _last_startxref(pdf_file):
+    pdf_file.seek(0, os.SEEK_END)
+    size = pdf_file.tell()
+    pdf_file.seek(max(0, size - 1024))
+    matches = re.findall(rb'startxref\s+(\d+)', pdf_file.read())
+    if not matches:
+        raise ValueError("startxref not found")
+    return int(matches[-1]), size
+
+def _newest_xref(pdf_file, startxref):
+    """Whether the newest xref section is a stream, and the /Size its trailer declares"""
+    pdf_file.seek(startxref)
+    section = pdf_file.read(4096)
+    xref_stream = not section.lstrip().startswith(b'xref')
+    if not xref_stream:
+        section = section[section.find(b'trailer'):]
+    size = re.search(rb'/Size\s+(\d+)', re.split(rb'>>\s*stream', section, 1)[0] if xref_stream else section)
+    return xref_stream, int(size.group(1)) if size else None
+
+def metadata_changes(reader, url=None, title=None, author=None):
+    """{info key: (current, new)} for the fields that would change"""
+    info = reader.trailer.get('/Info')
+    info = info.get_object() if info is not None else {}
+    changes = {}
+    for field, value in (('url', url), ('title', title), ('author', author)):
+        key = INFO_KEYS[field]
+        current = info.get(key)
+        current = str(current.get_object()) if current is not None else None
+        if value is not None and value != current:
+            changes[key] = (current, value)
+    return changes
+
+def append_info_update(pdf_path, reader, changes):
+    """
+    Write `changes` as an incremental update: a new info dictionary, one xref
+    section (a table or a stream, matching the file) and a trailer whose /Prev
+    points at the previous one. The existing bytes are left untouched.
+    """
+    trailer = reader.trailer
+    info = trailer.get('/Info')
+    new_info = DictionaryObject(info.get_object() if info is not None else {})
+    for key, (_, value) in changes.items():
+        new_info[NameObject(key)] = TextStringObject(value)
+
+    with open(pdf_path, 'r+b') as pdf_file:
+        startxref, offset = _last_startxref(pdf_file)
+        xref_stream, size = _newest_xref(pdf_file, startxref)
+
+        info_number = int(trailer.get('/Size', size))
+        trailer_keys = b'/Root ' + _serialize(trailer.raw_get('/Root'))
+        trailer_keys += b' /Info %d 0 R' % info_number
+        if '/ID' in trailer:
+            trailer_keys += b' /ID ' + _serialize(trailer['/ID'])
+
+        update = b'\n'
+        info_offset = offset + len(update)
+        update += b'%d 0 obj\n' % info_number + _serialize(new_info) + b'\nendobj\n'
+        xref_offset = offset + len(update)
+
+        if xref_stream:
+            # Cross-reference stream covering the info dictionary and itself
+            entries = struct.pack('>BIH', 1, info_offset, 0) + struct.pack('>BIH', 1, xref_offset, 0)
+            update += (
+                b'%d 0 obj\n<< /Type /XRef /Size %d /Index [%d 2] /W [1 4 2] /Length %d '
+                % (info_number + 1, info_number + 2, info_number, len(entries))
+                + trailer_keys + b' /Prev %d >>\nstream\n' % startxref
+                + entries + b'\nendstream\nendobj\n'
+            )
+        else:
+            update += (
+                b'xref\n0 1\n0000000000 65535 f\r\n%d 1\n%010d 00000 n\r\ntrailer\n' % (info_number, info_offset)
+                + b'<< /Size %d ' % (info_number + 1) + trailer_keys + b' /Prev %d >>\n' % startxref
+            )
+        update += b'startxref\n%d\n%%%%EOF\n' % xref_offset
+
+        pdf_file.seek(offset)
+        pdf_file.write(update)
+
+def rewrite_pdf_metadata(pdf_path, reader, changes):
+    """Full rewrite through PdfWriter, for files an incremental update cannot handle"""
+    writer = PdfWriter()
+
+    # Copy pages
+    for page in reader.pages:
+        writer.add_page(page)
+
+    # Add metadata
+    writer.add_metadata({key: value for key, (_, value) in changes.items()})
+
+    # Save with new metadata
+    temp_path = pdf_path + ".temp"
+    with open(temp_path, "wb") as output_file:
+        writer.write(output_file)
+
+    # Replace original file
+    os.replace(temp_path, pdf_path)
+
+def update_pdf_metadata(pdf_path, url=None, title=None, author=None, dry_run=False):
+    """
+    Set source URL, title and author where they differ from the PDF's info dictionary.
+
+    Returns (status, changes) with status 'updated', 'unchanged', 'dry-run' or
+    'failed'; `changes` maps info keys to (current, new), or holds the error.
+    """
     try:
-        # Open the PDF
         reader = PdfReader(pdf_path)
-        writer = PdfWriter()
-
-        # Copy pages
-        for page in reader.pages:
-            writer.add_page(page)
-
-        # Prepare metadata
-        metadata = {"/SourceURL": url}
-        if title:
-            metadata["/Title"] = title
-        if author:
-            metadata["/Author"] = author
-
-        # Add metadata
-        writer.add_metadata(metadata)
-
-        # Save with new metadata
-        temp_path = pdf_path + ".temp"
-        with open(temp_path, "wb") as output_file:
-            writer.write(output_file)
-
-        # Replace original file
-        os.replace(temp_path, pdf_path)
-        return True
+        changes = metadata_changes(reader, url, title, author)
+        if not changes:
+            return 'unchanged', changes
+        if dry_run:
+            return 'dry-run', changes
+
+        if reader.is_encrypted:
+            rewrite_pdf_metadata(pdf_path, reader, changes)
+        else:
+            append_info_update(pdf_path, reader, changes)
+        return 'updated', changes
     except Exception as e:
-        print(f"Error adding metadata to {pdf_path}: {e}")
+        return 'failed', str(e)
+
+def append_pdf_metadata(pdf_path, url, title=None, author=None):
+    """Add source URL, title, and author to PDF metadata."""
+    status, result = update_pdf_metadata(pdf_path, url, title, author)
+    if status == 'failed':
+        print(f"Error adding metadata to {pdf_path}: {result}")
         return False
+    return True
+
+def index_pdfs(base_dir):
+    """Map each PDF file name under `base_dir` to every path it appears at"""
+    index = {}
+    for root, _, files in os.walk(base_dir):
+        for file in files:
+            if file.lower().endswith('.pdf'):
+                index.setdefault(file, []).append(os.path.join(root, file))
+    return index
 
 def find_pdf_in_subdirectories(base_dir, filename):
     """Search for a PDF file in all subdirectories."""
-    for root, _, files in os.walk(base_dir):
-        if filename in files:
-            return os.path.join(root, filename)
-    return None
+    paths = index_pdfs(base_dir).get(filename)
+    return paths[0] if paths else None
 
-def batch_add_metadata(data_path, pdf_directory):
+def _clean(value):
+    """Convert empty strings and NaN to None"""
+    return None if value is None or pd.isna(value) or str(value).strip() == '' else str(value)
+
+def batch_add_metadata(data_path, pdf_directory, dry_run=False, max_workers=None):
     """Add metadata to PDFs based on Excel/CSV file data."""
     try:
         # Read the data file based on extension with different encodings
@@ -56,68 +176,81 @@ def batch_add_metadata(data_path, pdf_directory):
                     df = pd.read_csv(data_path, encoding='cp1252')
         else:
             df = pd.read_excel(data_path)
-        
+
         # Ensure required columns exist
         required_columns = ['Name']
         if not all(col in df.columns for col in required_columns):
             raise ValueError("Data file must contain 'Name' column")
-        
+
+        # One walk of the tree instead of one per row
+        index = index_pdfs(pdf_directory)
+        duplicates = {name: paths for name, paths in index.items() if len(paths) > 1}
+        for name, paths in duplicates.items():
+            print(f"Duplicate file name, every copy will be tagged: {name}")
+            for path in paths:
+                print(f"  {path}")
+
         successful = 0
+        unchanged = 0
         failed = 0
-        
-        # Process each row
-        for index, row in df.iterrows():
+        tasks = []
+
+        for _, row in df.iterrows():
             pdf_name = row['Name']
-            
+
             # Get metadata fields, use None if not present
-            url = row.get('URL', None)
-            title = row.get('Title', None)
-            author = row.get('Author', None)
-            
-            # Search for PDF in all subdirectories
-            pdf_path = find_pdf_in_subdirectories(pdf_directory, pdf_name)
-            
-            if pdf_path is None:
+            url = _clean(row.get('URL', None))
+            title = _clean(row.get('Title', None))
+            author = _clean(row.get('Author', None))
+
+            if pdf_name not in index:
                 print(f"PDF not found in any subdirectory: {pdf_name}")
                 failed += 1
                 continue
-            
+
             # Skip if no metadata to add
-            if all(x is None or pd.isna(x) or str(x).strip() == '' for x in [url, title, author]):
+            if url is None and title is None and author is None:
                 print(f"Skipping {pdf_name} - No metadata provided")
                 continue
-            
-            # Convert empty strings and NaN to None
-            url = None if pd.isna(url) or str(url).strip() == '' else str(url)
-            title = None if pd.isna(title) or str(title).strip() == '' else str(title)
-            author = None if pd.isna(author) or str(author).strip() == '' else str(author)
-            
-            # Add metadata
-            if append_pdf_metadata(pdf_path, url, title, author):
-                successful += 1
-                print(f"Successfully added metadata to {pdf_name}")
-                print(f"Location: {pdf_path}")
-                if title: print(f"Title: {title}")
-                if author: print(f"Author: {author}")
-                if url: print(f"URL: {url}")
-            else:
-                failed += 1
-                print(f"Failed to add metadata to {pdf_name}")
-        
-        print(f"\nBatch processing complete:")
-        print(f"Successfully processed: {successful}")
+
+            for pdf_path in index[pdf_name]:
+                tasks.append((pdf_path, url, title, author, dry_run))
+
+        # PDFs are independent, so parse and update them in parallel
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(update_pdf_metadata, *zip(*tasks)) if tasks else []
+            for (pdf_path, *_), (status, changes) in zip(tasks, results):
+                if status == 'failed':
+                    failed += 1
+                    print(f"Failed to add metadata to {pdf_path}: {changes}")
+                elif status == 'unchanged':
+                    unchanged += 1
+                else:
+                    successful += 1
+                    print(f"{'Would update' if dry_run else 'Updated'} {pdf_path}")
+                    for key, (current, new) in changes.items():
+                        print(f"  {key}: {current!r} -> {new!r}")
+
+        print(f"\nBatch processing complete{' (dry run)' if dry_run else ''}:")
+        print(f"{'To update' if dry_run else 'Successfully processed'}: {successful}")
+        print(f"Already up to date: {unchanged}")
         print(f"Failed: {failed}")
-        
+
     except Exception as e:
         print(f"Error processing batch: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write metadata.csv into the PDFs' info dictionaries")
+    parser.add_argument("--dry-run", action="store_true", help="Show the changes without writing them")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
     # Use relative paths
-    base_dir = "storage\data"
-    data_file = os.path.join(base_dir, "METADATA.csv")
+    base_dir = os.path.join("storage", "data")
+    data_file = os.path.join(base_dir, "metadata.csv")
     pdf_dir = os.path.join(base_dir, "PDFs")
-    
+
     print("Starting batch metadata addition...")
     print(f"Reading metadata from: {data_file}")
     print(f"Processing PDFs in: {pdf_dir}")
-    batch_add_metadata(data_file, pdf_dir)
+    batch_add_metadata(data_file, pdf_dir, args.dry_run, args.workers)
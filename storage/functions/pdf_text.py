@@ -0,0 +1,138 @@
+"""
+Text derivatives of the PDFs, uploaded to the vector store in their place.
+
+file_search only ever reads a file's text, so a Markdown file with one
+section per page is all the store needs. For image-heavy publications it is a
+small fraction of the PDF, which cuts upload time, `usage_bytes` and indexing
+time. Derivatives are written under storage/data/derivatives, mirroring the
+PDF folders, and rebuilt only when their PDF is newer.
+
+    python storage/functions/pdf_text.py      # build every derivative and report the bytes saved
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PyPDF2 import PdfReader
+
+PDF_ROOT = Path(__file__).resolve().parent.parent / "data" / "PDFs"
+DERIVATIVE_ROOT = Path(__file__).resolve().parent.parent / "data" / "derivatives"
+
+PAGE_HEADING = "## Page "
+# Lines on at least this share of the pages are running headers or footers
+REPEATED_LINE_SHARE = 0.5
+PAGE_NUMBER_RE = re.compile(r"(page\s*)?\d{1,4}(\s*(of|/)\s*\d{1,4})?", re.IGNORECASE)
+
+
+def clean_page(text):
+    """Rejoin words hyphenated across lines, squeeze whitespace and drop bare page numbers"""
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text or "")
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"[ \t\u00a0]+", " ", line).strip()
+        if PAGE_NUMBER_RE.fullmatch(line):
+            continue
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def extract_pages(source):
+    """
+    [(page_number, text)] for the pages of a PDF (a path or binary file) that
+    have any text, with running headers and footers removed.
+    """
+    pages = []
+    for number, page in enumerate(PdfReader(source).pages, start=1):
+        try:
+            pages.append((number, clean_page(page.extract_text())))
+        except Exception:
+            continue
+
+    if len(pages) >= 3:
+        counts = {}
+        for _, text in pages:
+            for line in set(text.splitlines()):
+                if line:
+                    counts[line] = counts.get(line, 0) + 1
+        repeated = {line for line, count in counts.items() if count >= REPEATED_LINE_SHARE * len(pages)}
+        if repeated:
+            pages = [
+                (number, "\n".join(line for line in text.splitlines() if line not in repeated).strip())
+                for number, text in pages
+            ]
+    return [(number, text) for number, text in pages if text]
+
+
+def to_markdown(title, pages):
+    return f"# {title}\n\n" + "\n\n".join(f"{PAGE_HEADING}{number}\n\n{text}" for number, text in pages) + "\n"
+
+
+def derivative_path(pdf_path, pdf_root=PDF_ROOT, derivative_root=DERIVATIVE_ROOT):
+    relative = Path(pdf_path).resolve().relative_to(Path(pdf_root).resolve())
+    return Path(derivative_root) / relative.with_suffix('.md')
+
+
+def has_text(path):
+    with open(path, encoding='utf-8') as f:
+        return PAGE_HEADING in f.read()
+
+
+def build_derivative(paths):
+    """Write the Markdown derivative for (pdf_path, out_path); returns its page count or an error"""
+    pdf_path, out_path = paths
+    try:
+        pages = extract_pages(pdf_path)
+    except Exception as e:
+        return {'pages': 0, 'error': str(e)}
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = out_path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(to_markdown(Path(pdf_path).name, pages))
+    os.replace(temp_path, out_path)
+    return {'pages': len(pages), 'error': None}
+
+
+def build_derivatives(pdf_paths, pdf_root=PDF_ROOT, derivative_root=DERIVATIVE_ROOT, max_workers=None):
+    """
+    {pdf_path: derivative path} for every PDF with a text layer; PDFs without
+    one (scans) are left out so the caller can upload them as they are.
+    Missing or outdated derivatives are extracted in a process pool.
+    """
+    targets = {pdf_path: derivative_path(pdf_path, pdf_root, derivative_root) for pdf_path in pdf_paths}
+    stale = [
+        (pdf_path, out_path) for pdf_path, out_path in targets.items()
+        if not out_path.exists() or out_path.stat().st_mtime_ns < os.stat(pdf_path).st_mtime_ns
+    ]
+    if stale:
+        print(f"Extracting text from {len(stale)} PDFs")
+        if len(stale) < 4:
+            results = [build_derivative(paths) for paths in stale]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(build_derivative, stale))
+        for (pdf_path, _), result in zip(stale, results):
+            if result['error']:
+                print(f"Error extracting text from {pdf_path}: {result['error']}")
+
+    return {pdf_path: out_path for pdf_path, out_path in targets.items() if out_path.exists() and has_text(out_path)}
+
+
+def print_savings(pdf_paths, derivatives):
+    """Report how much smaller the upload is with derivatives in place of the PDFs"""
+    pdf_bytes = sum(os.path.getsize(path) for path in pdf_paths)
+    upload_bytes = sum(os.path.getsize(derivatives.get(path, path)) for path in pdf_paths)
+    saved = pdf_bytes - upload_bytes
+    print(f"Text derivatives: {len(derivatives)} of {len(pdf_paths)} PDFs, "
+          f"{pdf_bytes / 1024 / 1024:.1f} MB -> {upload_bytes / 1024 / 1024:.1f} MB "
+          f"({saved / 1024 / 1024:.1f} MB, {saved / max(pdf_bytes, 1):.0%} saved)")
+    missing = len(pdf_paths) - len(derivatives)
+    if missing:
+        print(f"{missing} PDFs have no text layer and are uploaded as PDFs")
+    return saved
+
+
+if __name__ == "__main__":
+    pdf_paths = sorted(PDF_ROOT.resolve().glob('**/*.pdf'))
+    print_savings(pdf_paths, build_derivatives(pdf_paths))
@@ -1,101 +1,209 @@
 import os
+import sys
+import argparse
+import csv
 from openai import OpenAI
 import json
 from dotenv import load_dotenv
-import pandas as pd
 from datetime import datetime
-from get_vector_store_id import get_vector_store_id_from_server
+from pathlib import Path
+
+try:
+    from storage.functions.get_vector_store_id import get_vector_store_ids_from_server
+    from storage.functions.catalog_store import CatalogStore, vector_store_attributes
+except ImportError:  # run as a script from storage/functions
+    from get_vector_store_id import get_vector_store_ids_from_server
+    from catalog_store import CatalogStore, vector_store_attributes
+
+# backend/cassette.py records or replays the OpenAI calls when PODC_CASSETTE_MODE is set
+sys.path.append(str(Path(__file__).resolve().parent.parent.parent / "backend"))
+from cassette import openai_http_client
 
 # Load environment variables
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), http_client=openai_http_client())
+
+DEFAULT_OUTPUT = Path(__file__).resolve().parent.parent / "data" / "vector_store_inventory.csv"
+PDF_DIRECTORY = Path(__file__).resolve().parent.parent / "data" / "PDFs"
+
+INVENTORY_COLUMNS = [
+    'vector_store_id', 'file_id', 'created_at', 'status', 'usage_bytes', 'last_error',
+    'max_chunk_size', 'chunk_overlap', 'filename', 'title', 'author',
+    'category', 'url', 'last_modified', 'attributes'
+]
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH = 1000
+
+def iter_vector_store_files(vector_store_id):
+    """Every file in the store, fetched 100 (the API maximum) at a time"""
+    after = None
+    while True:
+        page = client.vector_stores.files.list(vector_store_id, limit=100, after=after)
+        yield from page.data
+        if not page.has_more:
+            break
+        after = page.data[-1].id
+
+def inventory_row(file):
+    attributes = file.attributes or {}
+    static = getattr(file.chunking_strategy, 'static', None)
+    row = {
+        'vector_store_id': file.vector_store_id,
+        'file_id': file.id,
+        'created_at': datetime.fromtimestamp(file.created_at).strftime('%Y-%m-%d %H:%M:%S'),
+        'status': file.status,
+        'usage_bytes': file.usage_bytes,
+        'last_error': file.last_error.message if file.last_error else None,
+        'max_chunk_size': static.max_chunk_size_tokens if static else None,
+        'chunk_overlap': static.chunk_overlap_tokens if static else None,
+        'attributes': json.dumps(attributes, ensure_ascii=False)
+    }
+    for key in ('filename', 'title', 'author', 'category', 'url', 'last_modified'):
+        value = attributes.get(key)
+        row[key] = None if value is None else str(value)
+    return row
+
+class CsvSink:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=INVENTORY_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+class ParquetSink:
+    """Writes a row group every PARQUET_BATCH rows (needs pyarrow)"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        types = {'usage_bytes': pa.int64(), 'max_chunk_size': pa.int64(), 'chunk_overlap': pa.int64()}
+        self.schema = pa.schema([(column, types.get(column, pa.string())) for column in INVENTORY_COLUMNS])
+        self.writer = pq.ParquetWriter(str(path), self.schema)
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
 
-def check_vector_store(vector_store_id=None):
-    # Get vector store ID from server.py if not provided
+def drift_report(remote, catalog_records):
+    """
+    Compare the store with the local catalog.
+
+    `remote` maps file IDs to their inventory rows. Returns lists of:
+    missing (catalog PDFs with no file in the store), stale (attributes differ
+    from the catalog, e.g. the PDF changed after upload), failed (status failed
+    or a last_error) and orphaned (files with no catalog entry).
+    """
+    expected = {record['name']: vector_store_attributes(record) for record in catalog_records}
+    report = {'missing': [], 'stale': [], 'failed': [], 'orphaned': []}
+    seen = set()
+
+    for file_id, row in remote.items():
+        if row['status'] == 'failed' or row['last_error']:
+            report['failed'].append({'file_id': file_id, 'filename': row['filename'], 'error': row['last_error']})
+
+        attributes = expected.get(row['filename'])
+        if attributes is None:
+            report['orphaned'].append({'file_id': file_id, 'filename': row['filename']})
+            continue
+        seen.add(row['filename'])
+
+        differences = {
+            key: (row[key], value) for key, value in attributes.items()
+            if (row[key] or '') != (value or '')
+        }
+        if differences:
+            report['stale'].append({'file_id': file_id, 'filename': row['filename'], 'differences': differences})
+
+    report['missing'] = [{'filename': name} for name in sorted(expected) if name not in seen]
+    return report
+
+def check_vector_store(vector_store_id=None, output_path=DEFAULT_OUTPUT, catalog_store=None, pdf_directory=PDF_DIRECTORY):
+    """
+    Stream an inventory of the store to CSV or Parquet (by extension) and
+    report its drift from the local catalog. Without an ID every store the
+    backend serves is checked, all of its category shards when it has them.
+    """
+    # Get vector store IDs from the backend's configuration if not provided
     if vector_store_id is None:
-        vector_store_id = get_vector_store_id_from_server()
-        if vector_store_id is None:
-            vector_store_id = "vs_682b3328e1cc8191ae3c2186a94b18e4"  # fallback default
-            print("Warning: Could not read vector store ID from server.py, using default")
-    
+        vector_store_ids = get_vector_store_ids_from_server()
+        if not vector_store_ids:
+            vector_store_ids = ["vs_682b3328e1cc8191ae3c2186a94b18e4"]  # fallback default
+            print("Warning: Could not find the backend's vector store ID, using default")
+    else:
+        vector_store_ids = [vector_store_id]
+
     try:
-        print(f"\nChecking Vector Store: {vector_store_id}")
+        print(f"\nChecking Vector Store: {', '.join(vector_store_ids)}")
         print("=" * 50)
-        
-        # Create a list to store all files
-        all_files = []
-        
-        # Initialize pagination
-        after = None
-        while True:
-            # Get vector store files with pagination
-            vector_store_files = client.vector_stores.files.list(
-                vector_store_id,
-                after=after
-            )
-            
-            # Add files to our collection
-            all_files.extend(vector_store_files.data)
-            
-            # Check if there are more files to fetch
-            if not vector_store_files.has_more:
-                break
-                
-            # Update the pagination cursor
-            after = vector_store_files.last_id
-        
-        print(f"Total files found: {len(all_files)}")
-        
-        # Create a list to store file data
-        files_data = []
-        
-        # Extract relevant information from each file
-        for file in all_files:
-            # Start with base file data
-            file_data = {
-                'File ID': file.id,
-                'Created At': datetime.fromtimestamp(file.created_at).strftime('%Y-%m-%d %H:%M:%S'),
-                'Status': file.status,
-                'Usage Bytes': file.usage_bytes,
-                'Last Error': file.last_error.message if file.last_error else None,
-                'Max Chunk Size': file.chunking_strategy.static.max_chunk_size_tokens,
-                'Chunk Overlap': file.chunking_strategy.static.chunk_overlap_tokens
-            }
-            
-            # Add attributes as separate columns
-            if file.attributes:
-                # Store the original attributes JSON for reference
-                file_data['Raw Attributes'] = json.dumps(file.attributes, indent=2)
-                # Add attribute count
-                file_data['Attribute Count'] = len(file.attributes)
-                # Add each attribute as a separate column
-                for key, value in file.attributes.items():
-                    file_data[f'Attribute_{key}'] = value
-            else:
-                file_data['Raw Attributes'] = "No attributes"
-                file_data['Attribute Count'] = 0
-                
-            files_data.append(file_data)
-        
-        # Create DataFrame
-        df = pd.DataFrame(files_data)
-        
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        excel_filename = f'vector_store_files_{timestamp}.xlsx'
-        
-        # Save to Excel
-        df.to_excel(excel_filename, index=False)
-        print(f"\nFile data exported to: {excel_filename}")
-        print(f"Absolute path: {os.path.abspath(excel_filename)}")
-        
-        return df
-        
+
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        sink = ParquetSink(output_path) if output_path.suffix == '.parquet' else CsvSink(output_path)
+
+        # Only the columns the drift report needs stay in memory
+        remote = {}
+        statuses = {}
+        try:
+            for store_id in vector_store_ids:
+                for file in iter_vector_store_files(store_id):
+                    row = inventory_row(file)
+                    sink.write(row)
+                    remote[row['file_id']] = {key: row[key] for key in ('status', 'last_error', 'filename', 'title', 'author', 'category', 'url', 'last_modified')}
+                    statuses[row['status']] = statuses.get(row['status'], 0) + 1
+        finally:
+            sink.close()
+
+        print(f"Total files found: {len(remote)} ({', '.join(f'{count} {status}' for status, count in sorted(statuses.items()))})")
+        print(f"Inventory written to: {output_path}")
+
+        # Cheap when nothing changed, the PDF info is cached
+        catalog_store = catalog_store or CatalogStore()
+        catalog_store.update(pdf_directory)
+        # Duplicates recorded by pdf_dedup are left out of the store on purpose
+        duplicates = {row['path'] for row in catalog_store.duplicates()}
+        report = drift_report(remote, [record for record in catalog_store.records() if record['path'] not in duplicates])
+
+        print(f"\nDrift against the catalog ({catalog_store.path}):")
+        for entry in report['missing']:
+            print(f"  missing   {entry['filename']}")
+        for entry in report['stale']:
+            changed = ', '.join(f"{key}: {remote_value!r} -> {local_value!r}" for key, (remote_value, local_value) in entry['differences'].items())
+            print(f"  stale     {entry['filename']} ({entry['file_id']}) {changed}")
+        for entry in report['failed']:
+            print(f"  failed    {entry['filename']} ({entry['file_id']}) {entry['error']}")
+        for entry in report['orphaned']:
+            print(f"  orphaned  {entry['filename']} ({entry['file_id']})")
+        print(' '.join(f"{len(entries)} {kind}" for kind, entries in report.items()))
+
+        return report
+
     except Exception as e:
         print(f"Error checking vector store: {e}")
         print(f"Error type: {type(e)}")
         return None
 
 if __name__ == "__main__":
-    check_vector_store()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Inventory a vector store and diff it against the local catalog")
+    parser.add_argument("--vector-store-id", help="Store to check (default: the one the backend serves)")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="Inventory file, .csv or .parquet (needs pyarrow)")
+    args = parser.parse_args()
+    check_vector_store(args.vector_store_id, args.output)